@@ -2,37 +2,35 @@
 
 from __future__ import annotations
 
-import importlib.util
 import os
-import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory, abort
-from modules.donation_receipts import donation_receipts_bp
-
-MODULE_DIR = Path(__file__).resolve().parent
-
-
-def _load_data_module(module_name: str, filename: str):
-    if module_name in sys.modules:
-        return sys.modules[module_name]
-
-    module_path = MODULE_DIR / filename
-    spec = importlib.util.spec_from_file_location(module_name, module_path)
-    if spec is None or spec.loader is None:
-        raise ImportError(f"Unable to load module: {filename}")
-
-    module = importlib.util.module_from_spec(spec)
-    sys.modules[module_name] = module
-    spec.loader.exec_module(module)
-    return module
+from flask import Flask, Response, request, jsonify, send_from_directory, abort
+from werkzeug.exceptions import RequestEntityTooLarge
+from modules import (
+    admission,
+    change_feed,
+    dataset_query,
+    edge_cache,
+    json_codec,
+    rate_limit,
+    sqlite_store,
+    structured_log,
+    tenant_watcher,
+    version_history,
+)
+from modules.client_settings import ClientSettings, combined_cache_control
+from modules.json_index import pointer_from_path
+from modules.json_provider import FastJSONProvider
+from modules.json_stream import BodyTooLarge
+from modules.storage_backend import StorageConflict
 
+from data_access import client as client_access
+from data_access import multi_tenant as multi_access
 
-multi_access = _load_data_module(
-    "multi_tennant_data_access", "multi-tennant-data-access.py"
-)
-client_access = _load_data_module(
-    "client_data_acess", "client-data-acess.py"
-)
 
 get_client_paths = multi_access.get_client_paths
 get_client_slug = multi_access.get_client_slug
@@ -41,9 +39,22 @@ load_json = multi_access.load_json
 save_json = multi_access.save_json
 
 get_client_dataset_ids = client_access.get_client_dataset_ids
-resolve_client_dataset_for_request = client_access.resolve_client_dataset_for_request
+warm_dataset_indexes = client_access.warm_dataset_indexes
+resolve_client_dataset_path = client_access.resolve_client_dataset_path
 resolve_backend_data_path = client_access.resolve_backend_data_path
-
+backend_data_policy = client_access.backend_data_policy
+dataset_policy = client_access.dataset_policy
+backend_data_exists = client_access.backend_data_exists
+read_backend_data = client_access.read_backend_data
+read_backend_data_bytes = client_access.read_backend_data_bytes
+backend_data_etag = client_access.backend_data_etag
+read_backend_data_subtree = client_access.read_backend_data_subtree
+write_backend_data_stream = client_access.write_backend_data_stream
+list_backend_data_versions = client_access.list_backend_data_versions
+read_backend_data_version = client_access.read_backend_data_version
+restore_backend_data_version = client_access.restore_backend_data_version
+dataset_id_for_file = client_access.dataset_id_for_file
+list_client_dataset_ids = client_access.list_client_dataset_ids
 
 
 def validate_env(
@@ -96,6 +107,11 @@ except ValueError as e:
 
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+# First, so every later hook and handler logs with the request's context.
+structured_log.init_app(app, get_client_slug)
+# Next, so shed requests skip everything else (see modules/admission.py).
+admission.init_app(app)
 
 app.config['SECRET_KEY'] = env_config['FLASK_SECRET_KEY']
 
@@ -128,13 +144,13 @@ def internal_error(error):
     return 'Internal Server Error', 500
 
 
-def load_client_settings(client_slug: str, paths=None) -> dict:
+def load_client_settings(client_slug: str, paths=None) -> ClientSettings:
     if paths is None:
         paths = get_client_paths(client_slug)
 
     manifest = load_client_manifest(paths)
 
-    frontend_dir = manifest["frontend_dir"]
+    frontend_dir = manifest.frontend_dir
     if not frontend_dir.exists():
         raise FileNotFoundError(
             f"Frontend dir not found for client {client_slug}: {frontend_dir}"
@@ -143,10 +159,13 @@ def load_client_settings(client_slug: str, paths=None) -> dict:
     return manifest
 
 
-def serve_client_file(frontend_root: Path, rel_path: str):
+def serve_client_file(frontend_root: Path, rel_path: str, frontend_files=frozenset()):
     """
     Serve a file relative to the client's frontend root.
 
+    ``frontend_files`` is the client's cached route table; paths found there
+    skip the existence check.
+
     rel_path examples:
       'index.html'
       'script.js'
@@ -155,73 +174,658 @@ def serve_client_file(frontend_root: Path, rel_path: str):
       'style.css'
     """
     full_path = frontend_root / rel_path
-    if not full_path.exists():
+    if rel_path not in frontend_files and not full_path.exists():
         abort(404)
 
     return send_from_directory(full_path.parent, full_path.name)
 
 
-app.register_blueprint(donation_receipts_bp)
+# Optional blueprints by name. Only the ones listed in PLATFORM_BLUEPRINTS
+# are imported, so a disabled blueprint costs nothing at boot.
+BLUEPRINTS = {
+    "receipts": "modules.donation_receipts:donation_receipts_bp",
+    "payments": "modules.paypal_gateway:paypal_bp",
+}
+ENABLED_BLUEPRINTS = [
+    name.strip()
+    for name in os.getenv("PLATFORM_BLUEPRINTS", "receipts").split(",")
+    if name.strip()
+]
+
+
+def register_blueprints(flask_app: Flask, names) -> None:
+    """Import and register the named optional blueprints."""
+    for name in names:
+        if name not in BLUEPRINTS:
+            raise ValueError(f"Unknown blueprint {name!r} in PLATFORM_BLUEPRINTS")
+        module_name, _, attribute = BLUEPRINTS[name].partition(":")
+        # __import__ rather than importlib.import_module: only the former is
+        # reported by -X importtime (scripts/bench_import_time.py).
+        module = __import__(module_name, fromlist=[attribute])
+        flask_app.register_blueprint(getattr(module, attribute))
+
+
+register_blueprints(app, ENABLED_BLUEPRINTS)
+
+
+def _rate_limit_scope(req):
+    """Tenant slug and its compiled rate limits for the rate limiter."""
+    client_slug = get_client_slug(req)
+    if edge_cache.is_refresh(req):
+        # nginx re-fetching a cached read after a write: not visitor traffic.
+        return client_slug, rate_limit.UNLIMITED
+    try:
+        manifest = load_client_manifest(get_client_paths(client_slug))
+    except Exception:
+        return client_slug, rate_limit.DEFAULT_COMPILED_LIMITS
+    return client_slug, manifest.rate_limits
+
+
+rate_limit.init_app(app, _rate_limit_scope)
+
+
+def warm_tenant_caches() -> dict:
+    """
+    Prebuild the tenant registry, manifests, route tables and dataset indexes
+    for every client under CLIENTS_ROOT.
+
+    gunicorn.conf.py calls this in the master before forking so workers
+    inherit warm caches; it is safe to call again at any time.
+    """
+    started = time.perf_counter()
+    datasets = 0
+    slugs = multi_access.warm_client_caches()
+    for slug in slugs:
+        paths = get_client_paths(slug)
+        try:
+            datasets += warm_dataset_indexes(paths, load_client_manifest(paths))
+        except Exception:
+            app.logger.warning("Warmup failed for client %s", slug, exc_info=True)
+
+    return {
+        "clients": len(slugs),
+        "datasets": datasets,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _publish_dataset_change(client_slug: str, paths, manifest, filename: str) -> None:
+    """Tell change-feed subscribers that a backend data file was written."""
+    dataset_id = dataset_id_for_file(manifest, filename)
+    if dataset_id is None or not change_feed.has_subscribers(client_slug):
+        return
+    target = resolve_client_dataset_path(paths, manifest, dataset_id)
+    change_feed.publish(
+        client_slug,
+        dataset_id,
+        backend_data_etag(paths, manifest, target),
+        lambda: read_backend_data(paths, manifest, target),
+    )
+
+
+def _apply_tenant_changes(events) -> None:
+    """Rebuild cached tenant snapshots touched by a batch of watcher events."""
+    if any(event.kind == "client" for event in events):
+        multi_access.register_clients()
+
+    for slug in sorted({event.slug for event in events if event.kind != "data"}):
+        paths = get_client_paths(slug)
+        if not paths["client_root"].is_dir():
+            multi_access.forget_client(slug)
+            continue
+        try:
+            manifest = multi_access.reload_client_manifest(paths)
+            warm_dataset_indexes(paths, manifest)
+        except Exception:
+            app.logger.warning("Reload failed for client %s", slug, exc_info=True)
+
+    for event in events:
+        if event.kind != "data" or not change_feed.has_subscribers(event.slug):
+            continue
+        paths = get_client_paths(event.slug)
+        try:
+            manifest = load_client_manifest(paths)
+            if event.name.startswith(sqlite_store.STORE_FILENAME):
+                # Any SQLite write may touch any document; unchanged etags
+                # are dropped by the feed.
+                filenames = manifest.backend_data
+            else:
+                filenames = [event.name]
+            for filename in filenames:
+                _publish_dataset_change(event.slug, paths, manifest, filename)
+        except Exception:
+            app.logger.warning("Change feed failed for client %s", event.slug, exc_info=True)
+
+
+tenant_watcher.subscribe(_apply_tenant_changes)
+
+
+def start_tenant_watcher() -> str | None:
+    """
+    Start this worker's CLIENTS_ROOT watcher (called from gunicorn.conf.py).
+
+    Once it runs, cached manifests are trusted without per-request stat
+    checks; anything that changed between warmup and now is revalidated first.
+    """
+    multi_access.start_storage_sync()
+    backend = tenant_watcher.start(multi_access.CLIENTS_ROOT)
+    if backend is None:
+        return None
+
+    for slug in multi_access.register_clients():
+        load_client_manifest(get_client_paths(slug))
+    multi_access.set_cache_watcher(tenant_watcher.is_running)
+    return backend
+
 
 @app.route("/api/backend-data/<path:data_filename>", methods=["GET", "PUT"])
 def backend_data(data_filename: str):
-    """Read or write backend data declared in the client's msn_<user>.json."""
+    """
+    Read or write backend data declared in the client's msn_<user>.json.
+
+    The file's manifest policy decides whether GET/PUT are allowed, the
+    largest PUT body, and the ``Cache-Control`` sent with reads.
+    """
 
     client_slug = get_client_slug(request)
     paths = get_client_paths(client_slug)
     settings = load_client_settings(client_slug, paths=paths)
 
+    access = "read" if request.method == "GET" else "write"
     try:
-        target_path = resolve_backend_data_path(paths, settings, data_filename)
+        policy = backend_data_policy(settings, data_filename, access)
     except ValueError as exc:
         return jsonify({"error": "invalid_backend_data", "message": str(exc)}), 400
+    except PermissionError as exc:
+        return jsonify({"error": "forbidden", "message": str(exc)}), 403
+    target_path = policy.path
 
     if request.method == "GET":
-        if not target_path.exists():
+        etag = backend_data_etag(paths, settings, target_path)
+        if etag is None:
             abort(404)
-
-        return jsonify(load_json(target_path))
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(read_backend_data(paths, settings, target_path))
+        response.set_etag(etag)
+        response.headers.update(edge_cache.shared_headers(policy.cache_control, policy.public))
+        return response
+
+    # The declared length is refused up front; chunked bodies are cut off as
+    # soon as they pass the limit, before the stored file is touched.
+    if policy.max_body is not None:
+        if (request.content_length or 0) > policy.max_body:
+            return _payload_too_large(policy)
+        request.max_content_length = policy.max_body
 
     try:
-        payload = request.get_json(force=True)
-    except Exception:
+        write_backend_data_stream(
+            paths, settings, target_path, request.stream, policy.max_body
+        )
+    except (BodyTooLarge, RequestEntityTooLarge):
+        return _payload_too_large(policy)
+    except ValueError as exc:
         return (
             jsonify(
                 {
                     "error": "invalid_json",
-                    "message": "Request body must be valid JSON",
+                    "message": f"Request body must be valid JSON ({exc})",
                 }
             ),
             400,
         )
+    except StorageConflict:
+        return (
+            jsonify(
+                {
+                    "error": "conflict",
+                    "message": "File was changed by another instance; reload and retry",
+                }
+            ),
+            409,
+        )
+    _publish_dataset_change(client_slug, paths, settings, target_path.name)
+    edge_cache.purge_file(client_slug, settings, target_path.name)
+    response = jsonify({"status": "ok"})
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def _payload_too_large(policy):
+    return (
+        jsonify(
+            {
+                "error": "payload_too_large",
+                "message": f"{policy.filename} accepts at most {policy.max_body} bytes",
+            }
+        ),
+        413,
+    )
+
+
+def _version_target(data_filename: str, access: str):
+    """Resolve a backend data file for the version endpoints (or an error response)."""
+    client_slug = get_client_slug(request)
+    paths = get_client_paths(client_slug)
+    settings = load_client_settings(client_slug, paths=paths)
+    try:
+        policy = backend_data_policy(settings, data_filename, access)
+    except ValueError as exc:
+        return None, (jsonify({"error": "invalid_backend_data", "message": str(exc)}), 400)
+    except PermissionError as exc:
+        return None, (jsonify({"error": "forbidden", "message": str(exc)}), 403)
+    return (client_slug, paths, settings, policy), None
+
+
+def _version_not_found(version):
+    return (
+        jsonify({"error": "version_not_found", "message": f"No version {version} of this file"}),
+        404,
+    )
+
+
+@app.route("/api/backend-data/<path:data_filename>/versions", methods=["GET"])
+def backend_data_versions(data_filename: str):
+    """List the recorded versions of a backend data file, oldest first."""
+    target, error = _version_target(data_filename, "read")
+    if error:
+        return error
+    _, paths, _, policy = target
+    response = jsonify(
+        {
+            "file": policy.filename,
+            "versions": list_backend_data_versions(paths, policy.path),
+        }
+    )
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
-    save_json(target_path, payload)
-    return jsonify({"status": "ok"})
+
+@app.route("/api/backend-data/<path:data_filename>/versions/<int:version>", methods=["GET"])
+def backend_data_version(data_filename: str, version: int):
+    """Return the content of one recorded version."""
+    target, error = _version_target(data_filename, "read")
+    if error:
+        return error
+    _, paths, _, policy = target
+    try:
+        response = jsonify(read_backend_data_version(paths, policy.path, version))
+    except KeyError:
+        return _version_not_found(version)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.route(
+    "/api/backend-data/<path:data_filename>/versions/<int:version>/diff", methods=["GET"]
+)
+def backend_data_version_diff(data_filename: str, version: int):
+    """
+    Return a JSON Patch from one version to another.
+
+    Query params:
+      - to: the later version (default: the newest)
+    """
+    target, error = _version_target(data_filename, "read")
+    if error:
+        return error
+    _, paths, _, policy = target
+    to = request.args.get("to", type=int)
+    if to is None:
+        versions = list_backend_data_versions(paths, policy.path)
+        to = versions[-1]["version"] if versions else version
+    try:
+        old = read_backend_data_version(paths, policy.path, version)
+    except KeyError:
+        return _version_not_found(version)
+    try:
+        new = read_backend_data_version(paths, policy.path, to)
+    except KeyError:
+        return _version_not_found(to)
+    response = jsonify(
+        {"from": version, "to": to, "patch": version_history.diff(old, new)}
+    )
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.route(
+    "/api/backend-data/<path:data_filename>/versions/<int:version>/restore",
+    methods=["POST"],
+)
+def restore_backend_data(data_filename: str, version: int):
+    """Make a recorded version the current content again (needs write access)."""
+    target, error = _version_target(data_filename, "write")
+    if error:
+        return error
+    client_slug, paths, settings, policy = target
+    try:
+        restore_backend_data_version(paths, settings, policy.path, version)
+    except KeyError:
+        return _version_not_found(version)
+    except StorageConflict:
+        return (
+            jsonify(
+                {
+                    "error": "conflict",
+                    "message": "File was changed by another instance; reload and retry",
+                }
+            ),
+            409,
+        )
+    _publish_dataset_change(client_slug, paths, settings, policy.path.name)
+    edge_cache.purge_file(client_slug, settings, policy.path.name)
+    versions = list_backend_data_versions(paths, policy.path)
+    response = jsonify(
+        {"status": "ok", "version": versions[-1]["version"] if versions else None}
+    )
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 
 @app.route("/api/datasets", methods=["GET"])
 def list_datasets():
     client_slug = get_client_slug(request)
 
-    return jsonify(
+    response = jsonify(
         {
             "client": client_slug,
             "datasets": get_client_dataset_ids(request),
         }
     )
+    response.headers.update(edge_cache.shared_headers("no-cache", public=True))
+    return response
 
 
 @app.route("/api/datasets/<string:dataset_id>", methods=["GET"])
 def load_dataset(dataset_id: str):
+    """
+    Return a dataset, or one branch of it.
+
+    Query params:
+      - pointer: JSON Pointer (RFC 6901), e.g. ``/events/0``
+      - path: dotted alternative to ``pointer``, e.g. ``events.0``
+      - where.<field>, min.<field>, max.<field>, sort, limit, offset,
+        fields: filter an array (see modules/dataset_query.py)
+    """
+    client_slug = get_client_slug(request)
+    paths = get_client_paths(client_slug)
+    manifest = load_client_manifest(paths)
+
     try:
-        dataset_path = resolve_client_dataset_for_request(request, dataset_id)
+        policy = dataset_policy(manifest, dataset_id)
     except ValueError as exc:
         return jsonify({"error": "invalid_dataset", "message": str(exc)}), 400
+    except PermissionError as exc:
+        return jsonify({"error": "forbidden", "message": str(exc)}), 403
+    dataset_path = policy.path
 
-    if not dataset_path.exists():
+    etag = backend_data_etag(paths, manifest, dataset_path)
+    if etag is None:
         abort(404)
 
-    return jsonify(load_json(dataset_path))
+    pointer = request.args.get("pointer")
+    if pointer is None and request.args.get("path"):
+        pointer = pointer_from_path(request.args["path"])
+
+    query = dataset_query.is_query(request.args)
+    version = etag
+    if query:
+        etag = f"{etag}.q{zlib.crc32(request.query_string):x}"
+    elif pointer:
+        etag = f"{etag}.{zlib.crc32(pointer.encode('utf-8')):x}"
+    cache_headers = {
+        "ETag": f'"{etag}"',
+        **edge_cache.shared_headers(policy.cache_control, policy.public),
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=cache_headers)
+
+    if query:
+        try:
+            result = dataset_query.run(
+                request.args,
+                str(dataset_path),
+                version,
+                lambda: read_backend_data(paths, manifest, dataset_path),
+                pointer or "",
+            )
+        except dataset_query.QueryError as exc:
+            return jsonify({"error": "invalid_query", "message": str(exc)}), 400
+        except ValueError as exc:
+            return jsonify({"error": "invalid_pointer", "message": str(exc)}), 400
+        except KeyError:
+            return (
+                jsonify(
+                    {
+                        "error": "pointer_not_found",
+                        "message": "Pointer does not resolve inside the dataset",
+                    }
+                ),
+                404,
+            )
+        response = jsonify(result)
+    elif pointer:
+        try:
+            body = read_backend_data_subtree(paths, manifest, dataset_path, pointer)
+        except ValueError as exc:
+            return jsonify({"error": "invalid_pointer", "message": str(exc)}), 400
+        except KeyError:
+            return (
+                jsonify(
+                    {
+                        "error": "pointer_not_found",
+                        "message": "Pointer does not resolve inside the dataset",
+                    }
+                ),
+                404,
+            )
+        response = app.response_class(body + b"\n", mimetype="application/json")
+    else:
+        response = jsonify(read_backend_data(paths, manifest, dataset_path))
+
+    response.headers.update(cache_headers)
+    return response
+
+
+DATASET_BATCH_MAX = int(os.getenv("DATASET_BATCH_MAX", "50"))
+DATASET_IO_THREADS = int(os.getenv("DATASET_IO_THREADS", "4"))
+
+_io_pool: ThreadPoolExecutor | None = None
+_io_pool_pid: int | None = None
+_io_pool_lock = threading.Lock()
+
+
+def _dataset_io_pool() -> ThreadPoolExecutor:
+    """Small per-process thread pool for parallel dataset reads."""
+    global _io_pool, _io_pool_pid
+    if _io_pool is None or _io_pool_pid != os.getpid():
+        with _io_pool_lock:
+            if _io_pool is None or _io_pool_pid != os.getpid():
+                _io_pool = ThreadPoolExecutor(
+                    max_workers=DATASET_IO_THREADS, thread_name_prefix="dataset-io"
+                )
+                _io_pool_pid = os.getpid()
+    return _io_pool
+
+
+def _batch_item(paths, manifest, dataset_id: str, known_etags) -> bytes:
+    """Encode one batch entry; ``data`` is spliced in from stored bytes."""
+    header = {"id": dataset_id}
+    try:
+        dataset_path = resolve_client_dataset_path(paths, manifest, dataset_id)
+        etag, body = read_backend_data_bytes(paths, manifest, dataset_path, known_etags)
+    except ValueError as exc:
+        header.update(status=400, error="invalid_dataset", message=str(exc))
+        return json_codec.dumps(header)
+    except PermissionError as exc:
+        header.update(status=403, error="forbidden", message=str(exc))
+        return json_codec.dumps(header)
+    except FileNotFoundError:
+        header.update(status=404, error="not_found")
+        return json_codec.dumps(header)
+
+    header.update(status=200 if body is not None else 304, etag=etag)
+    encoded = json_codec.dumps(header)
+    if body is None:
+        return encoded
+    return encoded[:-1] + b',"data":' + body.strip() + b"}"
+
+
+@app.route("/api/datasets/batch", methods=["GET", "POST"])
+def load_dataset_batch():
+    """
+    Return several datasets in one response.
+
+    GET  /api/datasets/batch?ids=a,b,c
+    POST /api/datasets/batch   {"ids": ["a", "b"], "etags": {"a": "<etag>"}}
+
+    Each entry carries ``status`` (200, 304, 400 or 404) and ``etag``; entries
+    whose etag matches ``If-None-Match`` or the ``etags`` map are returned as
+    304 without ``data``. With ``?format=ndjson`` (or an
+    ``application/x-ndjson`` Accept header) entries are streamed one per line
+    as they are read; otherwise they are returned as an object keyed by ID.
+    """
+    client_slug = get_client_slug(request)
+    paths = get_client_paths(client_slug)
+    manifest = load_client_manifest(paths)
+
+    known = {etag for etag in request.if_none_match.as_set()}
+    if request.method == "POST":
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get("ids"), list):
+            return (
+                jsonify({"error": "invalid_batch", "message": "Body must contain an ids array"}),
+                400,
+            )
+        ids = [str(dataset_id) for dataset_id in body["ids"]]
+        etags = body.get("etags")
+        if isinstance(etags, dict):
+            known.update(str(etag).strip('"') for etag in etags.values())
+    else:
+        ids = [item for item in request.args.get("ids", "").split(",") if item]
+
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return jsonify({"error": "invalid_batch", "message": "No dataset ids requested"}), 400
+    if len(ids) > DATASET_BATCH_MAX:
+        return (
+            jsonify(
+                {
+                    "error": "invalid_batch",
+                    "message": f"At most {DATASET_BATCH_MAX} datasets per batch",
+                }
+            ),
+            400,
+        )
+
+    pool = _dataset_io_pool()
+    futures = {
+        pool.submit(_batch_item, paths, manifest, dataset_id, known): dataset_id
+        for dataset_id in ids
+    }
+
+    wants_ndjson = request.args.get("format") == "ndjson" or (
+        request.accept_mimetypes.best == "application/x-ndjson"
+    )
+    # Entries depend on the caller's etags, so only plain GETs are shareable.
+    if request.method == "GET" and not known:
+        cache_control = combined_cache_control(
+            manifest.datasets[dataset_id] for dataset_id in ids if dataset_id in manifest.datasets
+        )
+    else:
+        cache_control = "private, no-cache"
+
+    if wants_ndjson:
+        def stream():
+            for future in as_completed(futures):
+                yield future.result() + b"\n"
+
+        return Response(
+            stream(),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": cache_control},
+        )
+
+    results = {futures[future]: future.result() for future in as_completed(futures)}
+    parts = [
+        json_codec.dumps(dataset_id) + b":" + results[dataset_id] for dataset_id in ids
+    ]
+    body = (
+        b'{"client":' + json_codec.dumps(client_slug)
+        + b',"datasets":{' + b",".join(parts) + b"}}\n"
+    )
+    return app.response_class(
+        body, mimetype="application/json", headers={"Cache-Control": cache_control}
+    )
+
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+
+def _sse(event: str, data, event_id: str | None = None) -> bytes:
+    lines = [f"event: {event}".encode("utf-8")]
+    if event_id:
+        lines.append(f"id: {event_id}".encode("utf-8"))
+    lines.append(b"data: " + json_codec.dumps(data))
+    return b"\n".join(lines) + b"\n\n"
+
+
+@app.route("/api/datasets/stream", methods=["GET"])
+def stream_datasets():
+    """
+    Server-Sent Events feed of dataset changes for the current client.
+
+    Query params:
+      - ids: comma-separated dataset IDs to watch (default: all)
+      - patch: ``1`` to include a JSON Merge Patch (RFC 7386) with changes
+
+    Sends ``ready`` with the current etags, then one ``change`` event
+    (``{"dataset", "etag", "patch"?}``) per write; ``etag`` is null when a
+    dataset is removed. ``resync`` means events were dropped and the client
+    should refetch. Served by the gevent instance (gunicorn.stream.conf.py).
+    """
+    client_slug = get_client_slug(request)
+    paths = get_client_paths(client_slug)
+    manifest = load_client_manifest(paths)
+
+    ids = [item for item in request.args.get("ids", "").split(",") if item] or None
+    want_patch = request.args.get("patch") == "1"
+    subscription = change_feed.subscribe(client_slug, ids, want_patch)
+
+    current = {}
+    for dataset_id in list_client_dataset_ids(paths, manifest):
+        if ids is not None and dataset_id not in ids:
+            continue
+        target = resolve_client_dataset_path(paths, manifest, dataset_id)
+        current[dataset_id] = backend_data_etag(paths, manifest, target)
+        if want_patch and (
+            not target.exists() or target.stat().st_size <= change_feed.PATCH_MAX_BYTES
+        ):
+            change_feed.remember(
+                client_slug, dataset_id, read_backend_data(paths, manifest, target)
+            )
+
+    def stream():
+        try:
+            yield b"retry: 5000\n\n" + _sse("ready", {"client": client_slug, "etags": current})
+            while True:
+                events, overflowed = subscription.drain(SSE_HEARTBEAT_SECONDS)
+                if overflowed:
+                    yield _sse("resync", {"client": client_slug})
+                for event in events:
+                    yield _sse("change", event, event["etag"])
+                if not events and not overflowed:
+                    yield b": keep-alive\n\n"
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/")
@@ -230,8 +834,10 @@ def client_root():
     paths = get_client_paths(client_slug)
     settings = load_client_settings(client_slug, paths=paths)
 
-    rel_path = settings.get("default_entry", "index.html")
-    return serve_client_file(settings["frontend_dir"], rel_path)
+    rel_path = settings.default_entry
+    return serve_client_file(
+        settings.frontend_dir, rel_path, settings.frontend_files
+    )
 
 
 @app.route("/assets/<path:asset_path>")
@@ -246,7 +852,9 @@ def client_assets(asset_path: str):
     settings = load_client_settings(client_slug, paths=paths)
 
     rel_path = f"assets/{asset_path}"
-    return serve_client_file(settings["frontend_dir"], rel_path)
+    return serve_client_file(
+        settings.frontend_dir, rel_path, settings.frontend_files
+    )
 
 
 @app.route("/frontend/<path:static_path>")
@@ -263,7 +871,9 @@ def client_frontend_static(static_path: str):
     paths = get_client_paths(client_slug)
     settings = load_client_settings(client_slug, paths=paths)
 
-    return serve_client_file(settings["frontend_dir"], static_path)
+    return serve_client_file(
+        settings.frontend_dir, static_path, settings.frontend_files
+    )
 
 
 @app.route("/<path:filename>")
@@ -292,7 +902,9 @@ def client_catch_all(filename: str):
     if "." not in filename:
         filename = f"{filename}.html"
 
-    return serve_client_file(settings["frontend_dir"], filename)
+    return serve_client_file(
+        settings.frontend_dir, filename, settings.frontend_files
+    )
 
 
 @app.route("/api/health")
@@ -300,6 +912,24 @@ def health():
     return jsonify({"status": "ok"})
 
 
+@app.route("/api/metrics")
+def metrics():
+    """
+    Admission and logging counters. Only answered on the Gunicorn socket
+    itself or from loopback: nginx always sets X-Real-IP to the visitor.
+    """
+    if request.headers.get("X-Real-IP", "127.0.0.1") not in ("127.0.0.1", "::1"):
+        abort(404)
+    response = jsonify(
+        {
+            "admission": admission.metrics(),
+            "logging": {"pid": os.getpid(), **structured_log.stats()},
+        }
+    )
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
 # -------------------------------------------------------------------
 # Development Server (for local testing only)
 # -------------------------------------------------------------------
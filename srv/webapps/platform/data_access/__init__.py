@@ -0,0 +1,11 @@
+# /srv/webapps/platform/data_access/__init__.py
+
+"""
+The data-access layer, as an importable package::
+
+    from data_access import multi_tenant, client
+
+``multi_tenant`` resolves tenants and stores their files; ``client`` reads
+and writes one client's datasets and backend data. Submodules are not
+imported here, so importing the package itself costs nothing.
+"""
@@ -0,0 +1,351 @@
+# /srv/webapps/platform/data_access/client.py
+
+"""
+Per-client dataset and backend data access.
+
+Resolves manifest-declared dataset and backend data files to paths and
+policies, and reads and writes them through the client's storage engine
+(files or SQLite), including streamed uploads and version history.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import tempfile
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, BinaryIO, Collection, Dict, List, NamedTuple, Optional, Tuple
+
+from modules import (
+    group_commit,
+    json_codec,
+    json_index,
+    json_stream,
+    sqlite_store,
+    version_history,
+)
+from modules.client_settings import ClientSettings, FilePolicy
+
+from data_access import multi_tenant as _multi
+
+
+def _normalize_filename(value: str) -> str:
+    clean = Path(value).name
+    if clean != value:
+        raise ValueError("Dataset filenames cannot include directories")
+    return clean
+
+
+def _check_access(policy: FilePolicy, access: Optional[str]) -> FilePolicy:
+    """Raise PermissionError unless the manifest allows ``access`` on the file."""
+    if access == "read" and not policy.read:
+        raise PermissionError(f"{policy.filename} is not readable")
+    if access == "write" and not policy.write:
+        raise PermissionError(f"{policy.filename} is read-only")
+    return policy
+
+
+def dataset_id_for_file(manifest: ClientSettings, filename: str) -> Optional[str]:
+    """Return the dataset ID served from ``filename``, if it is a readable dataset."""
+    policy = manifest.files.get(filename)
+    return policy.dataset_id if policy is not None and policy.read else None
+
+
+def list_client_dataset_ids(
+    paths: Dict[str, Path], manifest: ClientSettings
+) -> List[str]:
+    """Return readable dataset IDs for the client based on its manifest."""
+    return sorted(
+        dataset_id
+        for dataset_id, policy in manifest.datasets.items()
+        if policy.read and backend_data_exists(paths, manifest, policy.path)
+    )
+
+
+def dataset_policy(manifest: ClientSettings, dataset_id: str) -> FilePolicy:
+    """
+    Return the policy for a readable dataset. Raises ValueError when it is
+    not registered and PermissionError when the manifest disallows reads.
+    """
+    policy = manifest.datasets.get(dataset_id)
+    if policy is None:
+        raise ValueError("Requested dataset is not registered for this client")
+    return _check_access(policy, "read")
+
+
+def resolve_client_dataset_path(
+    paths: Dict[str, Path], manifest: ClientSettings, dataset_id: str
+) -> Path:
+    """Resolve a dataset ID to a JSON file path inside the client data dir."""
+    return dataset_policy(manifest, dataset_id).path
+
+
+def backend_data_policy(
+    manifest: ClientSettings, filename: str, access: Optional[str] = "read"
+) -> FilePolicy:
+    """
+    Return the policy for a declared backend data file, checking ``access``
+    (``"read"``, ``"write"`` or None). Raises ValueError for undeclared files
+    and PermissionError when the manifest disallows the access.
+    """
+    policy = manifest.files.get(_normalize_filename(filename))
+    if policy is None:
+        raise ValueError("Requested file is not declared in backend_data list")
+    return _check_access(policy, access)
+
+
+def resolve_backend_data_path(
+    paths: Dict[str, Path],
+    manifest: ClientSettings,
+    filename: str,
+    access: Optional[str] = "read",
+) -> Path:
+    """Resolve a manifest-declared backend data filename to a safe path."""
+    return backend_data_policy(manifest, filename, access).path
+
+
+def resolve_storage_format(manifest: ClientSettings, filename: str) -> str:
+    """Return the on-disk format for a backend data file (per-file override first)."""
+    return manifest.storage_format_for(filename)
+
+
+def backend_data_exists(
+    paths: Dict[str, Path], manifest: ClientSettings, target: Path
+) -> bool:
+    """Return whether a resolved backend data file has stored content."""
+    if manifest.uses_sqlite:
+        return sqlite_store.document_exists(sqlite_store.store_path(paths), target.name)
+    return target.exists()
+
+
+def read_backend_data(
+    paths: Dict[str, Path], manifest: ClientSettings, target: Path
+) -> Any:
+    """Load a resolved backend data file from the client's storage engine."""
+    if manifest.uses_sqlite:
+        return sqlite_store.load_document(sqlite_store.store_path(paths), target.name)
+    return _multi.load_json(target)
+
+
+def _file_etag(stat: os.stat_result) -> str:
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def _document_etag(name: str, version: int) -> str:
+    return f"{zlib.crc32(name.encode('utf-8')):x}-v{version}"
+
+
+def backend_data_etag(
+    paths: Dict[str, Path], manifest: ClientSettings, target: Path
+) -> Optional[str]:
+    """Return a strong validator for the stored content, or None if absent."""
+    if manifest.uses_sqlite:
+        version = sqlite_store.document_version(sqlite_store.store_path(paths), target.name)
+        return None if version is None else _document_etag(target.name, version)
+    _multi.refresh_local(target)
+    try:
+        return _file_etag(target.stat())
+    except FileNotFoundError:
+        return None
+
+
+def read_backend_data_bytes(
+    paths: Dict[str, Path],
+    manifest: ClientSettings,
+    target: Path,
+    known_etags: Collection[str] = (),
+) -> Tuple[str, Optional[bytes]]:
+    """
+    Return ``(etag, json_bytes)`` for a backend data file without re-encoding
+    JSON content. The body is None when the etag is in ``known_etags``.
+
+    Raises FileNotFoundError when nothing is stored.
+    """
+    if manifest.uses_sqlite:
+        version, body = sqlite_store.load_document_bytes(
+            sqlite_store.store_path(paths), target.name
+        )
+        etag = _document_etag(target.name, version)
+        return etag, None if etag in known_etags else body
+
+    _multi.refresh_local(target)
+    with target.open("rb") as handle:
+        etag = _file_etag(os.fstat(handle.fileno()))
+        if etag in known_etags:
+            return etag, None
+        data = handle.read()
+
+    if _multi.is_json_payload(data):
+        return etag, data
+    return etag, json_codec.dumps(_multi.decode_payload(data))
+
+
+def read_backend_data_subtree(
+    paths: Dict[str, Path], manifest: ClientSettings, target: Path, pointer: str
+) -> bytes:
+    """
+    Return the JSON-encoded value at ``pointer`` inside a backend data file.
+
+    Raises ValueError for a malformed pointer and KeyError when it does not
+    resolve.
+    """
+    tokens = json_index.parse_pointer(pointer)
+    if manifest.uses_sqlite:
+        document = read_backend_data(paths, manifest, target)
+        return json_codec.dumps(json_index.resolve_tokens(document, tokens))
+    _multi.refresh_local(target)
+    return json_index.read_subtree(target, tokens, _multi.load_json)
+
+
+class _Upload(NamedTuple):
+    """A streamed PUT body, already encoded in a temp file next to the target."""
+
+    path: Path
+    spans: json_index.Spans
+
+
+def _commit_backend_data(paths: Dict[str, Path], target: Path, storage_format: str):
+    def commit(items: List[Any]) -> None:
+        # Each PUT replaces the whole file, so a batch only writes the last;
+        # the other uploads' temp files are dropped.
+        try:
+            with group_commit.file_lock(target):
+                last = items[-1]
+                if isinstance(last, _Upload):
+                    _multi.install_json(target, last.path, last.spans, durable=True)
+                else:
+                    _multi.save_json(target, last, storage_format, durable=True)
+                version_history.record_file(paths, target.name, target)
+        finally:
+            for item in items[:-1]:
+                if isinstance(item, _Upload):
+                    item.path.unlink(missing_ok=True)
+
+    return commit
+
+
+def write_backend_data(
+    paths: Dict[str, Path], manifest: ClientSettings, target: Path, payload: Any
+) -> None:
+    """
+    Persist a resolved backend data file through the client's storage engine.
+
+    File writes are group-committed and fsynced before this returns. With a
+    shared storage backend, StorageConflict means another instance replaced
+    the file since this one last saw it.
+    """
+    if manifest.uses_sqlite:
+        store = sqlite_store.store_path(paths)
+        with group_commit.file_lock(store):
+            sqlite_store.save_document(store, target.name, payload)
+            version_history.record(paths, target.name, json_codec.dumps(payload))
+        return
+
+    storage_format = resolve_storage_format(manifest, target.name)
+    group_commit.submit(
+        ("backend_data", str(target), storage_format),
+        payload,
+        _commit_backend_data(paths, target, storage_format),
+    )
+
+
+def write_backend_data_stream(
+    paths: Dict[str, Path],
+    manifest: ClientSettings,
+    target: Path,
+    stream: BinaryIO,
+    limit: Optional[int] = None,
+) -> None:
+    """
+    Persist a JSON request body read from ``stream`` without loading it.
+
+    The body is validated and re-encoded into a temp file beside the target
+    as it arrives (modules/json_stream.py), then renamed into place by the
+    same group commit as write_backend_data. Raises json_stream.BodyTooLarge
+    once more than ``limit`` bytes arrive and ValueError for invalid JSON;
+    the old file is untouched in both cases. MessagePack files and the
+    SQLite engine still need the decoded document: the body is validated
+    into an anonymous temp file first, so the size limit applies before
+    anything is parsed.
+    """
+    storage_format = resolve_storage_format(manifest, target.name)
+    if manifest.uses_sqlite or storage_format == "msgpack":
+        with tempfile.TemporaryFile() as spooled:
+            json_stream.spool(stream, spooled, indent=False, limit=limit)
+            spooled.seek(0)
+            payload = json_codec.loads(spooled.read())
+        write_backend_data(paths, manifest, target, payload)
+        return
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    upload = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.upload")
+    try:
+        with upload.open("wb") as handle:
+            _, spans = json_stream.spool(
+                stream, handle, indent=storage_format == "pretty", limit=limit
+            )
+            handle.flush()
+            os.fsync(handle.fileno())
+        group_commit.submit(
+            ("backend_data", str(target), storage_format),
+            _Upload(upload, spans),
+            _commit_backend_data(paths, target, storage_format),
+        )
+    finally:
+        upload.unlink(missing_ok=True)
+
+
+def list_backend_data_versions(paths: Dict[str, Path], target: Path) -> List[Dict[str, Any]]:
+    """Return the version log of a backend data file (oldest first)."""
+    return version_history.load_log(paths, target.name)
+
+
+def read_backend_data_version(paths: Dict[str, Path], target: Path, version: int) -> Any:
+    """Load one recorded version of a backend data file; KeyError if unknown."""
+    entry = version_history.find_version(paths, target.name, version)
+    return _multi.decode_payload(version_history.read_version(paths, entry))
+
+
+def restore_backend_data_version(
+    paths: Dict[str, Path], manifest: ClientSettings, target: Path, version: int
+) -> None:
+    """
+    Write a recorded version back as the current content. The restore is an
+    ordinary write, so it becomes the newest version (sharing its objects
+    with the restored one). Raises KeyError for an unknown version.
+    """
+    entry = version_history.find_version(paths, target.name, version)
+    data = version_history.read_version(paths, entry)
+    if _multi.is_json_payload(data):
+        write_backend_data_stream(paths, manifest, target, io.BytesIO(data))
+    else:
+        write_backend_data(paths, manifest, target, _multi.decode_payload(data))
+
+
+def warm_dataset_indexes(paths: Dict[str, Path], manifest: ClientSettings) -> int:
+    """Build the client's dataset tables and load offset indexes; return count."""
+    warmed = 0
+    for dataset_id in list_client_dataset_ids(paths, manifest):
+        target = resolve_client_dataset_path(paths, manifest, dataset_id)
+        if not manifest.uses_sqlite:
+            json_index.preload_index(target)
+        warmed += 1
+    return warmed
+
+
+def get_client_dataset_ids(request) -> List[str]:
+    """List dataset IDs available for the current request's client."""
+    client_slug = _multi.get_client_slug(request)
+    paths = _multi.get_client_paths(client_slug)
+    manifest = _multi.load_client_manifest(paths)
+    return list_client_dataset_ids(paths, manifest)
+
+
+def resolve_client_dataset_for_request(request, dataset_id: str) -> Path:
+    """Resolve a dataset path for the current request's client."""
+    client_slug = _multi.get_client_slug(request)
+    paths = _multi.get_client_paths(client_slug)
+    manifest = _multi.load_client_manifest(paths)
+    return resolve_client_dataset_path(paths, manifest, dataset_id)
@@ -0,0 +1,643 @@
+# /srv/webapps/platform/data_access/multi_tenant.py
+
+"""
+Tenant resolution and tenant file storage.
+
+Maps a request's host to a client slug and its directories under
+CLIENTS_ROOT, compiles the client's manifest into ClientSettings, and reads
+and writes tenant files (JSON or MessagePack, atomically, through the shared
+storage backend when one is configured).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+
+from modules import client_settings, json_codec, json_index, rate_limit, storage_backend
+from modules.client_settings import ClientSettings, FilePolicy
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+PLATFORM_ROOT = Path(__file__).resolve().parents[1]
+WEBAPPS_ROOT = PLATFORM_ROOT.parent
+CLIENTS_ROOT = Path(os.getenv("CLIENTS_ROOT", str(WEBAPPS_ROOT / "clients")))
+PLATFORM_DATA_DIR = PLATFORM_ROOT / "data"
+
+DEFAULT_CLIENT_SLUG = os.getenv(
+    "DEFAULT_CLIENT_SLUG", "fruitfulnetworkdevelopment.com"
+)
+
+# On-disk encodings understood by load_json/save_json. "pretty" is the
+# historical indent=2 layout; "compact" drops all insignificant whitespace;
+# "msgpack" is binary and requires the optional msgpack package.
+STORAGE_FORMATS = ("pretty", "compact", "msgpack")
+DEFAULT_STORAGE_FORMAT = os.getenv("DATA_STORAGE_FORMAT", "pretty")
+
+# Where backend data lives: one file per dataset, or a per-tenant SQLite
+# database (see modules/sqlite_store.py).
+STORAGE_ENGINES = ("files", "sqlite")
+DEFAULT_STORAGE_ENGINE = os.getenv("DATA_STORAGE_ENGINE", "files")
+
+# How donation receipts are laid out on disk: one file, or one partition per
+# month/year with older partitions sealed (see modules/receipt_partitions.py).
+RECEIPT_PARTITION_SCHEMES = ("none", "month", "year")
+DEFAULT_RECEIPT_PARTITIONS = os.getenv("RECEIPT_PARTITIONS", "none")
+
+# Largest backend data PUT body, in bytes, for files whose manifest entry
+# sets no ``max_body`` (0 disables the limit).
+DEFAULT_MAX_BODY = int(os.getenv("BACKEND_DATA_MAX_BODY", str(8 * 1024 * 1024)))
+
+# With a shared STORAGE_BACKEND, CLIENTS_ROOT is this node's read-through
+# copy of it: reads revalidate, writes upload conditionally (see
+# modules/storage_backend.py). None keeps CLIENTS_ROOT authoritative.
+_backend = storage_backend.from_env()
+mirror = storage_backend.Mirror(_backend, CLIENTS_ROOT) if _backend else None
+
+# First significant byte of any JSON document. Everything else is treated as
+# MessagePack (datasets are always top-level objects or arrays).
+_JSON_LEADING_BYTES = frozenset(b'{["-0123456789tfn')
+
+
+def normalize_storage_format(value: Any) -> str:
+    """Return a known storage format name, falling back to the default."""
+    if isinstance(value, str) and value.lower() in STORAGE_FORMATS:
+        return value.lower()
+    return DEFAULT_STORAGE_FORMAT if DEFAULT_STORAGE_FORMAT in STORAGE_FORMATS else "pretty"
+
+
+def normalize_storage_engine(value: Any) -> str:
+    """Return a known storage engine name, falling back to the default."""
+    if isinstance(value, str) and value.lower() in STORAGE_ENGINES:
+        return value.lower()
+    return DEFAULT_STORAGE_ENGINE if DEFAULT_STORAGE_ENGINE in STORAGE_ENGINES else "files"
+
+
+def normalize_receipt_partitions(value: Any) -> str:
+    """Return a known receipt partition scheme, falling back to the default."""
+    if isinstance(value, str) and value.lower() in RECEIPT_PARTITION_SCHEMES:
+        return value.lower()
+    return (
+        DEFAULT_RECEIPT_PARTITIONS
+        if DEFAULT_RECEIPT_PARTITIONS in RECEIPT_PARTITION_SCHEMES
+        else "none"
+    )
+
+
+def encode_payload(payload: Any, storage_format: Optional[str] = None) -> bytes:
+    """Serialize a payload using one of STORAGE_FORMATS."""
+    storage_format = normalize_storage_format(storage_format)
+
+    if storage_format == "msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack storage format requires the msgpack package")
+        return msgpack.packb(payload, use_bin_type=True)
+
+    return json_codec.dumps(payload, indent=storage_format == "pretty")
+
+
+def is_json_payload(data: bytes) -> bool:
+    """Return whether stored bytes are JSON (as opposed to MessagePack)."""
+    head = data[:64].lstrip()[:1]
+    return not head or head[0] in _JSON_LEADING_BYTES
+
+
+def decode_payload(data: bytes) -> Any:
+    """Deserialize bytes written by encode_payload, detecting the format."""
+    if is_json_payload(data):
+        return json_codec.loads(data)
+
+    if msgpack is None:
+        raise ValueError("File is not JSON and the msgpack package is not installed")
+    return msgpack.unpackb(data, raw=False)
+
+
+def refresh_local(path: Path) -> None:
+    """Revalidate a tenant file against the shared storage backend, if any."""
+    if mirror is not None:
+        mirror.refresh(path)
+
+
+def load_json(path: Path) -> Any:
+    """Load JSON (or MessagePack) content from disk."""
+    refresh_local(path)
+    return decode_payload(path.read_bytes())
+
+
+def _atomic_stream(
+    path: Path, write: Callable[[BinaryIO], None], durable: bool = False
+) -> None:
+    """
+    Call ``write`` with a sibling temp file, then rename it over ``path``.
+    With ``durable`` the data and the rename are fsynced before returning.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp.open("wb") as handle:
+            write(handle)
+            if durable:
+                handle.flush()
+                os.fsync(handle.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    if durable:
+        _fsync_directory(path.parent)
+
+
+def _fsync_directory(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path: Path, data: bytes, durable: bool = False) -> None:
+    """Write ``data`` to a sibling temp file and rename it over ``path``."""
+    _atomic_stream(path, lambda handle: handle.write(data), durable)
+
+
+def save_bytes(path: Path, data: bytes, durable: bool = False) -> None:
+    """Atomically replace ``path`` with ``data`` (uploaded like save_json)."""
+    if mirror is None:
+        _atomic_write(path, data, durable)
+    else:
+        mirror.write(path, lambda: _atomic_write(path, data, durable))
+
+
+def save_local_bytes(path: Path, data: bytes, durable: bool = False) -> None:
+    """
+    Atomically replace a node-local file with ``data``. Unlike save_bytes it
+    is never uploaded to the shared storage backend (rendered documents,
+    caches).
+    """
+    _atomic_write(path, data, durable)
+
+
+def remove_file(path: Path) -> None:
+    """Delete a tenant file, from the shared storage backend as well."""
+    if mirror is None:
+        path.unlink(missing_ok=True)
+    else:
+        mirror.delete(path)
+
+
+def save_json(
+    path: Path,
+    payload: Any,
+    storage_format: Optional[str] = None,
+    durable: bool = False,
+) -> None:
+    """
+    Persist content in the requested format, ensuring parent directories exist.
+
+    The file is replaced atomically (and fsynced when ``durable``). JSON files
+    large enough to benefit get a byte-offset index for JSON Pointer reads
+    (see modules/json_index.py). With a shared storage backend the new
+    version is uploaded only if nobody replaced the one this node had;
+    otherwise StorageConflict is raised.
+    """
+    storage_format = normalize_storage_format(storage_format)
+    spans = None
+    if storage_format == "msgpack":
+        data = encode_payload(payload, storage_format)
+    else:
+        data, spans = json_index.encode_indexed(payload, indent=storage_format == "pretty")
+        if len(data) < json_index.INDEX_MIN_BYTES:
+            spans = None
+
+    def write_local() -> None:
+        _atomic_write(path, data, durable)
+        json_index.write_index(path, spans)
+
+    if mirror is None:
+        write_local()
+    else:
+        mirror.write(path, write_local)
+
+
+def install_json(
+    path: Path, source: Path, spans: Optional[json_index.Spans], durable: bool = False
+) -> None:
+    """
+    Rename an already-encoded JSON file over ``path``, the way save_json
+    would have written it. ``source`` must be a dot-prefixed sibling (see
+    modules/json_stream.py) and is fsynced by the caller; ``spans`` are its
+    offset-index spans. Conflicts raise StorageConflict as in save_json.
+    """
+    if spans is not None and source.stat().st_size < json_index.INDEX_MIN_BYTES:
+        spans = None
+
+    def write_local() -> None:
+        os.replace(source, path)
+        if durable:
+            _fsync_directory(path.parent)
+        json_index.write_index(path, spans)
+
+    if mirror is None:
+        write_local()
+    else:
+        mirror.write(path, write_local)
+
+
+def _array_close(handle: BinaryIO) -> Tuple[int, bool]:
+    """Return the offset of a JSON array's closing bracket and whether it is empty."""
+    handle.seek(0, os.SEEK_END)
+    offset = handle.tell()
+    tail = b""
+    while offset > 0 and not tail.strip(b" \t\r\n"):
+        step = min(offset, 4096)
+        offset -= step
+        handle.seek(offset)
+        tail = handle.read(step) + tail
+    tail = tail.rstrip(b" \t\r\n")
+    if not tail.endswith(b"]"):
+        raise ValueError("File does not contain a JSON array")
+    close = offset + len(tail) - 1
+    head = tail[:-1].rstrip(b" \t\r\n")
+    if head:
+        return close, head.endswith(b"[")
+    # Only whitespace between here and the bracket: look further back.
+    handle.seek(0)
+    return close, handle.read(close).strip(b" \t\r\n") == b"["
+
+
+def append_json_array(
+    path: Path,
+    items: Iterable[Any],
+    storage_format: Optional[str] = None,
+    durable: bool = False,
+) -> int:
+    """
+    Append ``items`` to the JSON array stored at ``path`` and return how many
+    were written.
+
+    JSON files are rewritten by copying the existing bytes and streaming the
+    new elements after them, so memory does not grow with the file or the
+    input. The offset index is dropped. MessagePack files are decoded and
+    rewritten whole.
+
+    With a shared storage backend the append is applied to the newest
+    version and retried when another node appended first.
+    """
+    if mirror is None:
+        return _append_local(path, items, storage_format, durable)
+    items = list(items)
+    written = 0
+
+    def write_local() -> None:
+        nonlocal written
+        written = _append_local(path, items, storage_format, durable)
+
+    mirror.write(path, write_local, retries=3, refresh_first=True)
+    return written
+
+
+def _append_local(
+    path: Path, items: Iterable[Any], storage_format: Optional[str], durable: bool
+) -> int:
+    storage_format = normalize_storage_format(storage_format)
+    if storage_format == "msgpack" or (path.exists() and not _is_json_file(path)):
+        existing = decode_payload(path.read_bytes()) if path.exists() else []
+        if not isinstance(existing, list):
+            raise ValueError("File does not contain a JSON array")
+        added = list(items)
+        _atomic_write(path, encode_payload(existing + added, storage_format), durable)
+        json_index.write_index(path, None)
+        return len(added)
+
+    indent = storage_format == "pretty"
+    written = 0
+
+    def write(out: BinaryIO) -> None:
+        nonlocal written
+        empty = True
+        if path.exists():
+            with path.open("rb") as source:
+                close, empty = _array_close(source)
+                source.seek(0)
+                remaining = close
+                while remaining:
+                    chunk = source.read(min(remaining, 1 << 20))
+                    out.write(chunk.rstrip(b" \t\r\n") if len(chunk) == remaining else chunk)
+                    remaining -= len(chunk)
+        else:
+            out.write(b"[")
+
+        for item in items:
+            encoded = json_codec.dumps(item, indent=indent)
+            if indent:
+                encoded = b"\n  " + encoded.replace(b"\n", b"\n  ")
+            out.write(encoded if empty and not written else b"," + encoded)
+            written += 1
+        out.write(b"\n]" if indent and (written or not empty) else b"]")
+
+    _atomic_stream(path, write, durable)
+    json_index.write_index(path, None)
+    return written
+
+
+def _is_json_file(path: Path) -> bool:
+    with path.open("rb") as handle:
+        return is_json_payload(handle.read(64))
+
+
+def _extract_host(request) -> str:
+    forwarded = request.headers.get("X-Forwarded-Host") or ""
+    raw_host = forwarded or request.host or ""
+    primary_host = raw_host.split(",", maxsplit=1)[0].strip()
+    return primary_host.split(":", maxsplit=1)[0].strip()
+
+
+# -------------------------------------------------------------------
+# Tenant caches
+# -------------------------------------------------------------------
+# Known client slugs and parsed manifests are kept per process. Both are
+# replaced wholesale rather than mutated, so request threads read them
+# without locking. Replacements happen under _cache_lock so concurrent
+# threads (gthread/gevent workers, the watcher) never drop each other's
+# updates. warm_client_caches() fills them before workers fork.
+# While a filesystem watcher keeps them current (see set_cache_watcher),
+# cached manifests are trusted without the per-request stat checks.
+
+_known_clients: frozenset = frozenset()
+_manifest_cache: Dict[Path, Tuple[Tuple[int, ...], ClientSettings]] = {}
+_cache_watcher: Optional[Callable[[], bool]] = None
+_cache_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _cache_lock
+    _cache_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def set_cache_watcher(is_running: Optional[Callable[[], bool]]) -> None:
+    """Trust cached manifests while ``is_running()`` reports a live watcher."""
+    global _cache_watcher
+    _cache_watcher = is_running
+
+
+def register_clients() -> List[str]:
+    """Rescan CLIENTS_ROOT and return the client slugs found there."""
+    global _known_clients
+    slugs = sorted(
+        entry.name
+        for entry in CLIENTS_ROOT.iterdir()
+        if entry.is_dir() and not entry.name.startswith(".")
+    ) if CLIENTS_ROOT.exists() else []
+    with _cache_lock:
+        _known_clients = frozenset(slugs)
+    return slugs
+
+
+def get_client_slug(request) -> str:
+    """
+    Choose which client directory to serve based on the request host.
+
+    Known hosts are trusted while a watcher keeps the registry current;
+    otherwise the directory is checked again, so a removed client falls
+    back to DEFAULT_CLIENT_SLUG.
+    """
+    global _known_clients
+    host = _extract_host(request)
+    if host:
+        known = host in _known_clients
+        if known and _cache_watcher is not None and _cache_watcher():
+            return host
+        if (CLIENTS_ROOT / host).exists():
+            if not known:
+                with _cache_lock:
+                    _known_clients = _known_clients | {host}
+            return host
+        if known:
+            forget_client(host)
+    return DEFAULT_CLIENT_SLUG
+
+
+def get_client_paths(client_slug: str) -> Dict[str, Path]:
+    """Return key filesystem roots for a given client."""
+    client_root = CLIENTS_ROOT / client_slug
+    return {
+        "client_root": client_root,
+        "frontend_dir": client_root / "frontend",
+        "data_dir": client_root / "data",
+        "platform_data_dir": PLATFORM_DATA_DIR,
+    }
+
+
+def _find_manifest_file(client_root: Path) -> Optional[Path]:
+    matches = sorted(client_root.glob("msn_*.json"))
+    return matches[0] if matches else None
+
+
+def _as_format_map(value: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        Path(str(name)).name: normalize_storage_format(fmt)
+        for name, fmt in value.items()
+        if isinstance(fmt, str) and fmt.lower() in STORAGE_FORMATS
+    }
+
+
+def _compile_file_policies(
+    data_dir: Path,
+    entries: List[Any],
+    storage_format: str,
+    storage_formats: Dict[str, str],
+    problems: List[str],
+) -> Dict[str, FilePolicy]:
+    """One FilePolicy per valid ``backend_data`` entry, in manifest order."""
+    policies: Dict[str, FilePolicy] = {}
+    for entry in entries:
+        fields: Dict[str, Any] = {}
+        if isinstance(entry, dict):
+            fields, entry_problems = client_settings.validate_entry(entry)
+            problems.extend(entry_problems)
+            entry = fields.get("file")
+        if not isinstance(entry, str) or not entry:
+            problems.append(f"backend_data entry {entry!r} is not a filename")
+            continue
+        if Path(entry).name != entry:
+            problems.append(f"backend_data entry {entry!r} cannot include directories")
+            continue
+        path = (data_dir / entry).resolve()
+        try:
+            path.relative_to(data_dir)
+        except ValueError:
+            problems.append(f"backend_data entry {entry!r} escapes the data directory")
+            continue
+
+        cache_ttl = fields.get("max_age")
+        stale = fields.get("stale_while_revalidate")
+        public = fields.get("public", True)
+        file_format = fields.get("storage_format")
+        policies[entry] = FilePolicy(
+            filename=entry,
+            path=path,
+            dataset_id=Path(entry).stem if Path(entry).suffix.lower() == ".json" else None,
+            storage_format=(
+                normalize_storage_format(file_format)
+                if file_format
+                else storage_formats.get(entry, storage_format)
+            ),
+            read=fields.get("read", True),
+            write=fields.get("write", True),
+            max_body=fields.get("max_body", DEFAULT_MAX_BODY or None),
+            cache_ttl=cache_ttl,
+            stale_while_revalidate=stale,
+            public=public,
+            cache_control=client_settings.cache_control(cache_ttl, stale, public),
+        )
+    return policies
+
+
+def _list_frontend_files(frontend_dir: Path) -> frozenset:
+    """Relative paths of every file under the frontend dir (the route table)."""
+    if not frontend_dir.is_dir():
+        return frozenset()
+    files = []
+    for root, dirnames, filenames in os.walk(frontend_dir):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        base = Path(root).relative_to(frontend_dir)
+        files.extend((base / name).as_posix() for name in filenames)
+    return frozenset(files)
+
+
+def _manifest_validator(client_root: Path, manifest_path: Optional[Path]) -> Tuple[int, ...]:
+    """Cheap change detector: the client dir (new msn files) and the manifest."""
+    try:
+        parts = [client_root.stat().st_mtime_ns]
+        if manifest_path is not None:
+            stat = manifest_path.stat()
+            parts.extend((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+    except OSError:
+        return ()
+    return tuple(parts)
+
+
+def load_client_manifest(paths: Dict[str, Path]) -> ClientSettings:
+    """
+    Return the client's compiled settings (see modules/client_settings.py).
+
+    The result is cached per client and revalidated with two ``stat`` calls.
+    It is immutable, so requests share it.
+    """
+    client_root = paths["client_root"]
+
+    cached = _manifest_cache.get(client_root)
+    if cached is not None:
+        validator, manifest = cached
+        if _cache_watcher is not None and _cache_watcher():
+            return manifest
+        if validator and validator == _manifest_validator(
+            client_root, manifest.manifest_path
+        ):
+            return manifest
+
+    return reload_client_manifest(paths)
+
+
+def reload_client_manifest(paths: Dict[str, Path]) -> ClientSettings:
+    """Re-parse a client's manifest and swap it into the cache."""
+    global _manifest_cache
+    client_root = paths["client_root"]
+    manifest_path = _find_manifest_file(client_root)
+    validator = _manifest_validator(client_root, manifest_path)
+    manifest = _parse_client_manifest(client_root, manifest_path)
+    with _cache_lock:
+        _manifest_cache = {**_manifest_cache, client_root: (validator, manifest)}
+    return manifest
+
+
+def _parse_client_manifest(
+    client_root: Path, manifest_path: Optional[Path]
+) -> ClientSettings:
+    """Validate a manifest against the MSS schema and compile its settings."""
+    manifest = load_json(manifest_path) if manifest_path else {}
+    raw = manifest.get("MSS") if isinstance(manifest, dict) else None
+    settings, problems = client_settings.validate(raw)
+
+    frontend_root = settings.get("frontend_root") or "frontend"
+    if Path(frontend_root).is_absolute():
+        frontend_dir = Path(frontend_root)
+    else:
+        frontend_dir = (client_root / frontend_root).resolve()
+    data_dir = (client_root / "data").resolve()
+
+    storage_format = normalize_storage_format(settings.get("storage_format"))
+    storage_formats = _as_format_map(settings.get("storage_formats", {}))
+    storage_engine = normalize_storage_engine(settings.get("storage_engine"))
+    files = _compile_file_policies(
+        data_dir, settings.get("backend_data", []), storage_format, storage_formats, problems
+    )
+
+    for problem in problems:
+        logger.warning("Manifest %s: %s", manifest_path, problem)
+
+    return ClientSettings(
+        manifest_path=manifest_path,
+        client_root=client_root,
+        frontend_dir=frontend_dir,
+        data_dir=data_dir,
+        default_entry=settings.get("default_entry") or "index.html",
+        frontend_files=_list_frontend_files(frontend_dir),
+        backend_data=tuple(files),
+        backend_files=frozenset(files),
+        files=client_settings.frozen_mapping(files),
+        datasets=client_settings.frozen_mapping(
+            {policy.dataset_id: policy for policy in files.values() if policy.dataset_id}
+        ),
+        storage_format=storage_format,
+        storage_formats=client_settings.frozen_mapping(storage_formats),
+        storage_engine=storage_engine,
+        uses_sqlite=storage_engine == "sqlite",
+        receipt_partitions=normalize_receipt_partitions(settings.get("receipt_partitions")),
+        rate_limits=rate_limit.compile_limits(settings.get("rate_limits")),
+        organization=client_settings.frozen_mapping(settings.get("organization")),
+        problems=tuple(problems),
+    )
+
+
+def forget_client(client_slug: str) -> None:
+    """Drop a removed client from the registry and manifest cache."""
+    global _known_clients, _manifest_cache
+    client_root = get_client_paths(client_slug)["client_root"]
+    with _cache_lock:
+        _known_clients = _known_clients - {client_slug}
+        _manifest_cache = {
+            root: entry for root, entry in _manifest_cache.items() if root != client_root
+        }
+
+
+def start_storage_sync() -> None:
+    """Keep this process's view of the shared storage backend current."""
+    if mirror is not None:
+        mirror.start_sync()
+
+
+def warm_client_caches() -> List[str]:
+    """
+    Register every client and parse its manifest; return the slugs. With a
+    shared storage backend, CLIENTS_ROOT is synced from it first.
+    """
+    if mirror is not None:
+        fetched = mirror.sync()
+        logger.info("Synced %d files from the %s storage backend", fetched, _backend.name)
+    slugs = register_clients()
+    for slug in slugs:
+        load_client_manifest(get_client_paths(slug))
+    return slugs
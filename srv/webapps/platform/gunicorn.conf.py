@@ -0,0 +1,84 @@
+# /srv/webapps/platform/gunicorn.conf.py
+
+"""
+Gunicorn settings for platform.service.
+
+With ``preload_app`` the app is imported once in the master: environment
+validation and the data-access modules run a single time, and
+``warm_tenant_caches`` builds every client's registry entry, manifest, route
+table and dataset index before workers fork. ``gc.freeze`` then moves those
+objects out of the collector's reach so workers keep sharing the pages
+copy-on-write instead of touching them during collections.
+
+Rate-limit state (modules/rate_limit.py) is shared by all workers through a
+memory-mapped file that the master clears on start.
+
+After fork every worker starts its own CLIENTS_ROOT watcher
+(modules/tenant_watcher.py) so tenant edits are picked up without restarts.
+
+Because code is loaded in the master, deploys need
+``systemctl restart platform.service`` (a HUP only re-forks workers).
+Set PLATFORM_PRELOAD=0 to import and warm in each worker instead.
+
+Gunicorn listens on a Unix socket in /run/platform (created by systemd's
+``RuntimeDirectory``). nginx reaches it through the ``platform_api``
+upstream and keeps connections open between requests. Workers use the
+``gthread`` class by default (PLATFORM_WORKER_CLASS). Each of the
+PLATFORM_WORKERS processes serves PLATFORM_THREADS requests at once and
+holds nginx's idle connections for ``keepalive`` seconds. ``sync`` closes
+every connection after one request, so the upstream pool goes unused.
+``gevent`` monkey-patches at worker start, after a preloaded app would
+already have created its locks, so it defaults to PLATFORM_PRELOAD=0.
+"""
+
+import gc
+import os
+
+bind = os.getenv("PLATFORM_BIND", "unix:/run/platform/gunicorn.sock")
+workers = int(os.getenv("PLATFORM_WORKERS", "3"))
+worker_class = os.getenv("PLATFORM_WORKER_CLASS", "gthread")
+threads = int(os.getenv("PLATFORM_THREADS", "4"))
+worker_connections = int(os.getenv("PLATFORM_CONNECTIONS", "1000"))
+# Longer than the upstream keepalive_timeout in etc/nginx/nginx.conf.
+keepalive = int(os.getenv("PLATFORM_KEEPALIVE", "75"))
+preload_app = os.getenv(
+    "PLATFORM_PRELOAD", "0" if worker_class == "gevent" else "1"
+) == "1"
+
+
+def _warm(log) -> None:
+    from app import warm_tenant_caches
+
+    stats = warm_tenant_caches()
+    log.info(
+        "Warmed %d clients (%d datasets) in %.1f ms",
+        stats["clients"],
+        stats["datasets"],
+        stats["seconds"] * 1000,
+    )
+
+
+def on_starting(server):
+    from modules import admission, rate_limit
+
+    # Buckets, in-flight counts and admission counters from a previous run
+    # are meaningless.
+    rate_limit.reset_state()
+    admission.reset_state()
+
+
+def when_ready(server):
+    if preload_app:
+        _warm(server.log)
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        _warm(worker.log)
+
+    from app import start_tenant_watcher
+
+    backend = start_tenant_watcher()
+    if backend:
+        worker.log.info("Watching tenants with %s", backend)
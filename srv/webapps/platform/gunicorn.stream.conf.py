@@ -0,0 +1,30 @@
+# /srv/webapps/platform/gunicorn.stream.conf.py
+
+"""
+Gunicorn settings for platform-stream.service, the SSE change feed.
+
+``/api/datasets/stream`` connections stay open for as long as a page is, so
+they are served by a separate instance on the gevent worker class: each idle
+connection is a greenlet waiting on an event rather than a blocked worker.
+nginx routes only that path here (see etc/nginx/sites-available).
+
+The worker runs the same app with its own CLIENTS_ROOT watcher, which is how
+writes made by platform.service workers reach the feed.
+"""
+
+import os
+
+bind = os.getenv("PLATFORM_STREAM_BIND", "127.0.0.1:8001")
+workers = int(os.getenv("PLATFORM_STREAM_WORKERS", "1"))
+worker_class = "gevent"
+worker_connections = int(os.getenv("PLATFORM_STREAM_CONNECTIONS", "5000"))
+keepalive = 75
+
+
+def post_worker_init(worker):
+    from app import start_tenant_watcher, warm_tenant_caches
+
+    warm_tenant_caches()
+    backend = start_tenant_watcher()
+    if backend:
+        worker.log.info("Watching tenants with %s", backend)
@@ -0,0 +1,328 @@
+# /srv/webapps/platform/modules/admission.py
+
+"""
+Admission control: shed low-priority requests quickly when workers fall behind.
+
+Each request is given a priority by endpoint:
+
+- ``critical``: payment capture and single receipt writes
+  (ADMISSION_CRITICAL_ENDPOINTS). Always admitted.
+- ``low``: the frontend catch-all routes and the dataset listing
+  (ADMISSION_LOW_ENDPOINTS). Shed first.
+- ``normal``: everything else, including bulk receipt imports, which are
+  the heaviest requests and so must not hold a thread while the worker is
+  behind.
+
+Two signals tell a worker it is behind:
+
+- Queue wait: how long the request waited before a worker thread picked it
+  up, measured from the ``X-Request-Start: t=<seconds>`` header nginx adds.
+  Each worker keeps a moving average of it (``queue_ms``).
+- In-flight requests: requests this worker is running, against
+  ``ADMISSION_CAPACITY`` (default PLATFORM_THREADS). ``ADMISSION_RESERVE``
+  threads are kept free for normal and critical requests.
+
+A low-priority request is shed when the average wait exceeds
+``ADMISSION_LOW_QUEUE_MS`` (default 200) or when taking it would leave fewer
+than the reserved threads free. A normal request is shed when the average
+wait exceeds ``ADMISSION_QUEUE_MS`` (default 1000). Any non-critical
+request that itself waited longer than ``ADMISSION_MAX_WAIT_MS`` (default
+10000) is shed too, because its client has most likely given up. A shed
+request costs well under a millisecond: an immediate 503 with
+``Retry-After``, which nginx answers from its stale cache where it can.
+
+Counters (admitted and shed per priority, in-flight, a queue-wait
+histogram) are kept per worker in a small memory-mapped file
+(``ADMISSION_STATE``, default under /dev/shm), so :func:`metrics` can add
+up every worker. Set ADMISSION=off to disable shedding. The counters are
+still kept.
+
+Registration example in app.py::
+
+    from modules import admission
+    admission.init_app(app)
+"""
+
+from __future__ import annotations
+
+import fcntl
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import g, jsonify, request
+
+from modules import shm_state
+
+ENABLED = os.getenv("ADMISSION", "on") != "off"
+STATE_PATH = shm_state.state_path("ADMISSION_STATE", "platform-admission")
+CAPACITY = int(os.getenv("ADMISSION_CAPACITY", os.getenv("PLATFORM_THREADS", "4")))
+RESERVE = int(os.getenv("ADMISSION_RESERVE", "1"))
+LOW_QUEUE_MS = float(os.getenv("ADMISSION_LOW_QUEUE_MS", "200"))
+QUEUE_MS = float(os.getenv("ADMISSION_QUEUE_MS", "1000"))
+MAX_WAIT_MS = float(os.getenv("ADMISSION_MAX_WAIT_MS", "10000"))
+REQUEST_START_HEADER = "X-Request-Start"
+
+PRIORITIES = ("low", "normal", "critical")
+LOW, NORMAL, CRITICAL = range(3)
+
+
+def _endpoints(name: str, default: str) -> frozenset:
+    return frozenset(
+        endpoint.strip() for endpoint in os.getenv(name, default).split(",") if endpoint.strip()
+    )
+
+
+CRITICAL_ENDPOINTS = _endpoints(
+    "ADMISSION_CRITICAL_ENDPOINTS",
+    "paypal.capture_order,donation_receipts.save_donation_receipt",
+)
+LOW_ENDPOINTS = _endpoints(
+    "ADMISSION_LOW_ENDPOINTS",
+    "client_root,client_assets,client_frontend_static,client_catch_all,list_datasets",
+)
+# Not counted at all: probes, and the change feed's long-lived connections.
+EXEMPT_ENDPOINTS = frozenset({None, "health", "metrics", "static", "stream_datasets"})
+
+# Upper bounds (ms) of the queue-wait histogram; the last bucket is open.
+WAIT_BUCKETS = (5, 25, 100, 250, 500, 1000, 2500, 10000)
+# Weight of the newest wait in the moving average.
+_SMOOTHING = 0.2
+
+# One slot per worker: pid, in flight, peak in flight, average wait,
+# last update, admitted and shed per priority, wait histogram.
+_SLOT = struct.Struct(f"<iiidd3Q3Q{len(WAIT_BUCKETS) + 1}Q")
+_SLOTS = 64
+
+
+class _Worker:
+    """This process's counters; written to its state slot after each change."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.queue_ms = 0.0
+        self.admitted = [0, 0, 0]
+        self.shed = [0, 0, 0]
+        self.waits = [0] * (len(WAIT_BUCKETS) + 1)
+        self.slot: Optional[int] = None
+        self.mapped: Optional[mmap.mmap] = None
+
+
+_worker = _Worker()
+
+
+def _reset_after_fork() -> None:
+    global _worker
+    _worker = _Worker()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def reset_state() -> None:
+    """Start with empty counters (called once by the Gunicorn master)."""
+    shm_state.reset(STATE_PATH)
+
+
+def _open_state() -> Tuple[int, mmap.mmap]:
+    return shm_state.open_state(STATE_PATH, _SLOT.size * _SLOTS)
+
+
+def _claim_slot(worker: _Worker) -> None:
+    """Take a free (or dead worker's) slot for this process."""
+    fd, mapped = _open_state()
+    pid = os.getpid()
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        for slot in range(_SLOTS):
+            stored = struct.unpack_from("<i", mapped, slot * _SLOT.size)[0]
+            if stored in (0, pid) or not shm_state.pid_alive(stored):
+                struct.pack_into("<i", mapped, slot * _SLOT.size, pid)
+                worker.slot, worker.mapped = slot, mapped
+                return
+        worker.slot = -1  # table full: keep counting locally
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _publish(worker: _Worker) -> None:
+    # Called with worker.lock held. Only this process writes its slot.
+    if worker.slot is None:
+        _claim_slot(worker)
+    if worker.mapped is None:
+        return
+    _SLOT.pack_into(
+        worker.mapped,
+        worker.slot * _SLOT.size,
+        os.getpid(),
+        worker.in_flight,
+        worker.peak,
+        worker.queue_ms,
+        time.time(),
+        *worker.admitted,
+        *worker.shed,
+        *worker.waits,
+    )
+
+
+def queue_wait_ms(header: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Milliseconds since ``X-Request-Start`` (``t=<seconds>``, as nginx's
+    ``$msec``; milli- and microsecond timestamps are accepted too).
+    """
+    if not header:
+        return None
+    try:
+        started = float(header.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(((now or time.time()) - started) * 1000, 0.0)
+
+
+def priority_for(endpoint: Optional[str]) -> Optional[int]:
+    """LOW, NORMAL or CRITICAL; None for endpoints admission ignores."""
+    if endpoint in EXEMPT_ENDPOINTS:
+        return None
+    if endpoint in CRITICAL_ENDPOINTS:
+        return CRITICAL
+    if endpoint in LOW_ENDPOINTS:
+        return LOW
+    return NORMAL
+
+
+def admit(priority: int, wait_ms: Optional[float]) -> Optional[float]:
+    """
+    Count the request in or shed it. Returns None when admitted (call
+    :func:`finish` afterwards) or the Retry-After seconds when shed.
+    """
+    worker = _worker
+    with worker.lock:
+        if wait_ms is not None:
+            worker.queue_ms += _SMOOTHING * (wait_ms - worker.queue_ms)
+            bucket = 0
+            while bucket < len(WAIT_BUCKETS) and wait_ms > WAIT_BUCKETS[bucket]:
+                bucket += 1
+            worker.waits[bucket] += 1
+
+        shed = False
+        if ENABLED and priority != CRITICAL:
+            if wait_ms is not None and wait_ms > MAX_WAIT_MS:
+                shed = True
+            elif priority == LOW:
+                shed = worker.queue_ms > LOW_QUEUE_MS or (
+                    CAPACITY > RESERVE and worker.in_flight >= CAPACITY - RESERVE
+                )
+            else:
+                shed = worker.queue_ms > QUEUE_MS
+
+        if shed:
+            worker.shed[priority] += 1
+        else:
+            worker.admitted[priority] += 1
+            worker.in_flight += 1
+            worker.peak = max(worker.peak, worker.in_flight)
+        _publish(worker)
+    if not shed:
+        return None
+    return float(max(1, math.ceil(worker.queue_ms / 1000)))
+
+
+def finish() -> None:
+    """Release the in-flight count taken by an admitted request."""
+    worker = _worker
+    with worker.lock:
+        worker.in_flight = max(worker.in_flight - 1, 0)
+        _publish(worker)
+
+
+def metrics() -> Dict[str, Any]:
+    """Counters of every live worker, and their totals."""
+    fd, mapped = _open_state()
+    os.close(fd)
+    workers: List[Dict[str, Any]] = []
+    with mapped:
+        for slot in range(_SLOTS):
+            pid, in_flight, peak, queue_ms, updated, *counts = _SLOT.unpack_from(
+                mapped, slot * _SLOT.size
+            )
+            if not pid or not shm_state.pid_alive(pid):
+                continue
+            workers.append(
+                {
+                    "pid": pid,
+                    "in_flight": in_flight,
+                    "peak_in_flight": peak,
+                    "queue_ms": round(queue_ms, 2),
+                    "updated": updated,
+                    "admitted": dict(zip(PRIORITIES, counts[0:3])),
+                    "shed": dict(zip(PRIORITIES, counts[3:6])),
+                    "queue_wait_ms": counts[6:],
+                }
+            )
+    totals = {
+        "in_flight": sum(worker["in_flight"] for worker in workers),
+        "admitted": {
+            name: sum(worker["admitted"][name] for worker in workers) for name in PRIORITIES
+        },
+        "shed": {name: sum(worker["shed"][name] for worker in workers) for name in PRIORITIES},
+        "queue_wait_ms": [
+            sum(worker["queue_wait_ms"][bucket] for worker in workers)
+            for bucket in range(len(WAIT_BUCKETS) + 1)
+        ],
+    }
+    return {
+        "enabled": ENABLED,
+        "capacity": CAPACITY,
+        "queue_wait_buckets_ms": [*WAIT_BUCKETS, None],
+        "totals": totals,
+        "workers": workers,
+    }
+
+
+def _overloaded(retry_after: float):
+    seconds = int(retry_after)
+    response = jsonify(
+        {
+            "error": "overloaded",
+            "message": "The server is busy; retry shortly",
+            "retry_after": seconds,
+        }
+    )
+    response.status_code = 503
+    response.headers["Retry-After"] = str(seconds)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def init_app(app) -> None:
+    """
+    Install admission control. Register it before the rate limiter so a
+    shed request costs no more than the decision.
+    """
+
+    @app.before_request
+    def _admission_before():
+        priority = priority_for(request.endpoint)
+        if priority is None:
+            return None
+        retry_after = admit(priority, queue_wait_ms(request.headers.get(REQUEST_START_HEADER)))
+        if retry_after is not None:
+            return _overloaded(retry_after)
+        g.admission_admitted = True
+        return None
+
+    @app.teardown_request
+    def _admission_teardown(exc):
+        if g.pop("admission_admitted", False):
+            finish()
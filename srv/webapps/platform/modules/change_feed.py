@@ -0,0 +1,175 @@
+# /srv/webapps/platform/modules/change_feed.py
+
+"""
+In-process pub/sub of dataset changes for the SSE stream endpoint.
+
+Publishers call :func:`publish` when a tenant dataset changes (a
+``backend_data`` PUT, or a data event from modules/tenant_watcher.py). Every
+open ``/api/datasets/stream`` connection holds a :class:`Subscription` and
+wakes up when one of its datasets changes.
+
+A subscription is a deque plus an Event, so an idle connection costs one
+small object and, under the gevent worker (gunicorn.stream.conf.py), one
+greenlet. Publishing never blocks: a subscriber that falls
+``SSE_QUEUE_LIMIT`` events behind drops the oldest and is told to resync.
+
+Subscribers that ask for patches get an RFC 7386 JSON Merge Patch against
+the previous version. The feed keeps the last seen payload of such datasets
+(up to ``SSE_PATCH_MAX_BYTES`` encoded) to diff against.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from modules import json_codec
+
+QUEUE_LIMIT = int(os.getenv("SSE_QUEUE_LIMIT", "64"))
+PATCH_MAX_BYTES = int(os.getenv("SSE_PATCH_MAX_BYTES", "65536"))
+
+_MISSING = object()
+
+
+class Subscription:
+    """One stream connection: a tenant, an optional dataset filter, a queue."""
+
+    __slots__ = ("slug", "datasets", "want_patch", "events", "wakeup", "overflowed")
+
+    def __init__(self, slug: str, datasets: Optional[Set[str]], want_patch: bool):
+        self.slug = slug
+        self.datasets = datasets
+        self.want_patch = want_patch
+        self.events: deque = deque(maxlen=QUEUE_LIMIT)
+        self.wakeup = threading.Event()
+        self.overflowed = False
+
+    def wants(self, dataset_id: str) -> bool:
+        return self.datasets is None or dataset_id in self.datasets
+
+    def push(self, event: Dict[str, Any]) -> None:
+        if len(self.events) == self.events.maxlen:
+            self.overflowed = True
+        self.events.append(event)
+        self.wakeup.set()
+
+    def drain(self, timeout: float) -> Tuple[List[Dict[str, Any]], bool]:
+        """Wait up to ``timeout`` seconds; return queued events and overflow flag."""
+        if not self.events:
+            self.wakeup.wait(timeout)
+        self.wakeup.clear()
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        overflowed, self.overflowed = self.overflowed, False
+        return events, overflowed
+
+
+_lock = threading.Lock()
+_subscribers: Dict[str, Tuple[Subscription, ...]] = {}
+_last_etags: Dict[Tuple[str, str], str] = {}
+_snapshots: Dict[Tuple[str, str], Any] = {}
+
+
+def _reset_after_fork() -> None:
+    global _lock, _subscribers, _last_etags, _snapshots
+    _lock = threading.Lock()
+    _subscribers, _last_etags, _snapshots = {}, {}, {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def subscribe(
+    slug: str, datasets: Optional[Iterable[str]] = None, want_patch: bool = False
+) -> Subscription:
+    subscription = Subscription(
+        slug, set(datasets) if datasets is not None else None, want_patch
+    )
+    with _lock:
+        _subscribers[slug] = _subscribers.get(slug, ()) + (subscription,)
+    return subscription
+
+
+def unsubscribe(subscription: Subscription) -> None:
+    with _lock:
+        remaining = tuple(
+            item for item in _subscribers.get(subscription.slug, ())
+            if item is not subscription
+        )
+        if remaining:
+            _subscribers[subscription.slug] = remaining
+        else:
+            _subscribers.pop(subscription.slug, None)
+            for key in [key for key in _snapshots if key[0] == subscription.slug]:
+                del _snapshots[key]
+
+
+def has_subscribers(slug: str) -> bool:
+    return bool(_subscribers.get(slug))
+
+
+def remember(slug: str, dataset_id: str, payload: Any) -> None:
+    """Seed the baseline used for merge patches, if it is small enough."""
+    if len(json_codec.dumps(payload)) <= PATCH_MAX_BYTES:
+        _snapshots.setdefault((slug, dataset_id), payload)
+
+
+def merge_patch(old: Any, new: Any) -> Any:
+    """Return the RFC 7386 merge patch that turns ``old`` into ``new``."""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+    patch = {}
+    for key in old.keys() - new.keys():
+        patch[key] = None
+    for key, value in new.items():
+        previous = old.get(key, _MISSING)
+        if previous is _MISSING:
+            patch[key] = value
+        elif previous != value:
+            patch[key] = merge_patch(previous, value)
+    return patch
+
+
+def publish(
+    slug: str,
+    dataset_id: str,
+    etag: Optional[str],
+    load: Optional[Callable[[], Any]] = None,
+) -> bool:
+    """
+    Notify subscribers of ``slug`` that ``dataset_id`` now has ``etag``
+    (None when deleted). ``load`` returns the new payload and is called at
+    most once, only when some subscriber wants a patch. Repeated notices
+    for the same etag are dropped; returns whether anything was sent.
+    """
+    subscribers = _subscribers.get(slug, ())
+    key = (slug, dataset_id)
+    with _lock:
+        if _last_etags.get(key, _MISSING) == etag:
+            return False
+        _last_etags[key] = etag
+
+    interested = [item for item in subscribers if item.wants(dataset_id)]
+    if not interested:
+        return False
+
+    event = {"dataset": dataset_id, "etag": etag}
+    patched = event
+    if load is not None and etag is not None and any(item.want_patch for item in interested):
+        previous = _snapshots.get(key, _MISSING)
+        try:
+            payload = load()
+        except Exception:
+            payload = _MISSING
+        if payload is not _MISSING:
+            if previous is not _MISSING:
+                patched = {**event, "patch": merge_patch(previous, payload)}
+            _snapshots.pop(key, None)
+            remember(slug, dataset_id, payload)
+
+    for item in interested:
+        item.push(patched if item.want_patch else event)
+    return True
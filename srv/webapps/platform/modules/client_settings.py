@@ -0,0 +1,241 @@
+# /srv/webapps/platform/modules/client_settings.py
+
+"""
+Manifest schema and the compiled, read-only settings built from it.
+
+``load_client_manifest`` (data_access/multi_tenant.py) reads a tenant's
+``msn_*.json`` once, checks its ``MSS`` block against MSS_SCHEMA, and
+compiles it into a ClientSettings. Everything the request paths need is
+precomputed there:
+
+- resolved paths
+- the backend_data file set and the dataset ID table
+- one FilePolicy per declared file
+- effective rate limits per route class
+
+Handlers read plain attributes and never re-normalize manifest values.
+
+``backend_data`` entries are filenames or objects carrying a per-file
+policy (BACKEND_DATA_FIELDS)::
+
+    {"file": "csa_recipes.json", "write": false, "max_age": 300,
+     "stale_while_revalidate": 3600}
+
+MSS keys not in the schema (``compendium``, ``dossier``, ...) belong to the
+frontend and are ignored. A known key with the wrong type is logged and
+falls back to its default.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+# MSS key -> accepted JSON types.
+MSS_SCHEMA: Dict[str, Tuple[type, ...]] = {
+    "frontend_root": (str,),
+    "default_entry": (str,),
+    "backend_data": (list,),
+    "storage_format": (str,),
+    "storage_formats": (dict,),
+    "storage_engine": (str,),
+    "receipt_partitions": (str,),
+    "rate_limits": (dict,),
+    "organization": (dict,),
+}
+
+# backend_data object entry key -> accepted JSON types.
+BACKEND_DATA_FIELDS: Dict[str, Tuple[type, ...]] = {
+    "file": (str,),
+    "read": (bool,),
+    "write": (bool,),
+    "max_body": (int,),
+    "max_age": (int,),
+    "stale_while_revalidate": (int,),
+    "public": (bool,),
+    "storage_format": (str,),
+}
+
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+
+def validate(settings: Any) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Return the schema keys of an ``MSS`` block that have valid types, and a
+    list of problems for the ones that do not.
+    """
+    if not isinstance(settings, dict):
+        return {}, ["MSS must be an object"] if settings is not None else []
+
+    valid: Dict[str, Any] = {}
+    problems = []
+    for key, types in MSS_SCHEMA.items():
+        if key not in settings or settings[key] is None:
+            continue
+        value = settings[key]
+        if isinstance(value, types):
+            valid[key] = value
+        else:
+            expected = " or ".join(kind.__name__ for kind in types)
+            problems.append(f"MSS.{key} must be {expected}, got {type(value).__name__}")
+    return valid, problems
+
+
+def validate_entry(entry: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Like :func:`validate` for one ``backend_data`` object entry."""
+    valid: Dict[str, Any] = {}
+    problems = []
+    name = entry.get("file")
+    for key, value in entry.items():
+        types = BACKEND_DATA_FIELDS.get(key)
+        if types is None:
+            problems.append(f"backend_data entry {name!r}: unknown key {key!r}")
+        elif not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            problems.append(f"backend_data entry {name!r}: {key} must be {types[0].__name__}")
+        elif isinstance(value, int) and not isinstance(value, bool) and value < 0:
+            problems.append(f"backend_data entry {name!r}: {key} must not be negative")
+        else:
+            valid[key] = value
+    return valid, problems
+
+
+def frozen_mapping(value: Optional[Dict[str, Any]]) -> Mapping[str, Any]:
+    return MappingProxyType(dict(value)) if value else _EMPTY
+
+
+class _Frozen:
+    """Base for immutable ``__slots__`` records built once per manifest load."""
+
+    __slots__ = ()
+
+    def __init__(self, **fields: Any) -> None:
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class FilePolicy(_Frozen):
+    """
+    How one ``backend_data`` file may be used.
+
+    ``path`` is resolved and already checked to be inside the data dir.
+    ``dataset_id`` is set for ``.json`` files served under /api/datasets.
+    ``max_body`` caps PUT bodies in bytes (None: no limit). ``cache_ttl``
+    and ``stale_while_revalidate`` are in seconds, and ``cache_control`` is
+    the precomputed response header built from them.
+    """
+
+    __slots__ = (
+        "filename",
+        "path",
+        "dataset_id",
+        "storage_format",
+        "read",
+        "write",
+        "max_body",
+        "cache_ttl",
+        "stale_while_revalidate",
+        "public",
+        "cache_control",
+    )
+
+    filename: str
+    path: Path
+    dataset_id: Optional[str]
+    storage_format: str
+    read: bool
+    write: bool
+    max_body: Optional[int]
+    cache_ttl: Optional[int]
+    stale_while_revalidate: Optional[int]
+    public: bool
+    cache_control: str
+
+
+def cache_control(
+    cache_ttl: Optional[int], stale_while_revalidate: Optional[int], public: bool
+) -> str:
+    """``Cache-Control`` for a policy. Without a TTL, caches must revalidate."""
+    if cache_ttl is None:
+        return "no-cache"
+    value = f"{'public' if public else 'private'}, max-age={cache_ttl}"
+    if stale_while_revalidate:
+        value += f", stale-while-revalidate={stale_while_revalidate}"
+    return value
+
+
+def combined_cache_control(policies) -> str:
+    """One ``Cache-Control`` for a response built from several files."""
+    policies = list(policies)
+    if not policies or any(policy.cache_ttl is None for policy in policies):
+        return "no-cache"
+    return cache_control(
+        min(policy.cache_ttl for policy in policies),
+        min(policy.stale_while_revalidate or 0 for policy in policies) or None,
+        all(policy.public for policy in policies),
+    )
+
+
+class ClientSettings(_Frozen):
+    """A tenant's compiled manifest. Shared between requests, never mutated."""
+
+    __slots__ = (
+        "manifest_path",
+        "client_root",
+        "frontend_dir",
+        "data_dir",
+        "default_entry",
+        "frontend_files",
+        "backend_data",
+        "backend_files",
+        "files",
+        "datasets",
+        "storage_format",
+        "storage_formats",
+        "storage_engine",
+        "uses_sqlite",
+        "receipt_partitions",
+        "rate_limits",
+        "organization",
+        "problems",
+    )
+
+    manifest_path: Optional[Path]
+    client_root: Path
+    frontend_dir: Path
+    data_dir: Path
+    default_entry: str
+    frontend_files: frozenset
+    backend_data: Tuple[str, ...]
+    backend_files: frozenset
+    files: Mapping[str, FilePolicy]
+    datasets: Mapping[str, FilePolicy]
+    storage_format: str
+    storage_formats: Mapping[str, str]
+    storage_engine: str
+    uses_sqlite: bool
+    receipt_partitions: str
+    rate_limits: Mapping[str, Mapping[str, float]]
+    organization: Mapping[str, Any]
+    problems: Tuple[str, ...]
+
+    def policy(self, filename: str) -> Optional[FilePolicy]:
+        return self.files.get(filename)
+
+    def storage_format_for(self, filename: str) -> str:
+        """On-disk format for a file in the data dir (per-file override first)."""
+        name = Path(filename).name
+        policy = self.files.get(name)
+        if policy is not None:
+            return policy.storage_format
+        return self.storage_formats.get(name, self.storage_format)
@@ -0,0 +1,334 @@
+# /srv/webapps/platform/modules/dataset_query.py
+
+"""
+Server-side filtering, sorting and projection over array-shaped datasets.
+
+``GET /api/datasets/<id>`` turns into a query when any of these parameters
+is present (``pointer``/``path`` then select the array inside the dataset):
+
+    where.<field>=<value>   equality; repeat the parameter for "any of"
+    min.<field>=<value>     inclusive lower bound
+    max.<field>=<value>     inclusive upper bound
+    sort=<field>,-<field>   ascending, or descending with "-"
+    limit=<n>&offset=<n>    page (limit defaults to DATASET_QUERY_LIMIT)
+    fields=<field>,<field>  return only these fields
+
+Fields are dotted paths into each record (``venue.city``). Query values are
+strings: equality matches a record value whose text form is the same
+(``true``, ``null``, ``3`` for ``3.0``). Bounds match numeric record values
+numerically (when the bounds are numbers) and string record values textually,
+so ISO dates and codes stored as strings (``min.zip=44010``) work.
+
+The first query on a dataset version loads its records into a table. Each
+field gets its indexes only when a query first needs them: a hash index
+(text form -> row ids) for equality, and a sorted column for bounds and
+sort. Tables are cached per process and keyed by the dataset's ETag, so a
+write (which changes the mtime) makes the next query rebuild.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from modules.json_index import parse_pointer, resolve_tokens
+
+DEFAULT_LIMIT = int(os.getenv("DATASET_QUERY_LIMIT", "100"))
+MAX_LIMIT = int(os.getenv("DATASET_QUERY_MAX_LIMIT", "1000"))
+_TABLE_CACHE_SIZE = int(os.getenv("DATASET_QUERY_CACHE", "16"))
+
+_PREFIXES = ("where.", "min.", "max.")
+_PARAMETERS = ("sort", "limit", "offset", "fields")
+
+_MISSING = object()
+
+
+class QueryError(ValueError):
+    """A malformed query, or a query target that is not an array."""
+
+
+def is_query(args) -> bool:
+    """Return whether request args ask for a query rather than the raw dataset."""
+    return any(name in _PARAMETERS or name.startswith(_PREFIXES) for name in args)
+
+
+# -------------------------------------------------------------------
+# Values
+# -------------------------------------------------------------------
+
+
+def _field_getter(field: str) -> Callable[[Any], Any]:
+    parts = field.split(".")
+
+    def get(record: Any) -> Any:
+        for part in parts:
+            if not isinstance(record, dict) or part not in record:
+                return _MISSING
+            record = record[part]
+        return record
+
+    return get
+
+
+def _text(value: Any) -> Optional[str]:
+    """The text form equality matches against (None for missing/containers)."""
+    if value is _MISSING or isinstance(value, (dict, list)):
+        return None
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _order_key(value: Any) -> Tuple[int, Any]:
+    """Sort key that orders numbers before strings and skips other values."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return (2, 0)
+
+
+def _bound_number(text: Optional[str]) -> Optional[float]:
+    if text is None:
+        return None
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+# -------------------------------------------------------------------
+# Tables
+# -------------------------------------------------------------------
+
+
+class _Column:
+    """One field's comparable values in sorted order."""
+
+    def __init__(self, rows: List[Any], field: str) -> None:
+        get = _field_getter(field)
+        pairs = sorted(
+            (key, row)
+            for row, key in enumerate(_order_key(get(record)) for record in rows)
+            if key[0] < 2
+        )
+        self.keys = [key for key, _ in pairs]
+        self.rows = [row for _, row in pairs]
+        present = set(self.rows)
+        # Rows without a number or string here; sorts put them last.
+        self.missing = [row for row in range(len(rows)) if row not in present]
+        self._descending: Optional[List[int]] = None
+
+    def between(self, kind: int, low: Any, high: Any) -> List[int]:
+        """Rows whose value is of ``kind`` (0 numbers, 1 strings) in ``[low, high]``."""
+        start = bisect.bisect_left(self.keys, (kind,) if low is None else (kind, low))
+        end = (
+            bisect.bisect_left(self.keys, (kind + 1,))
+            if high is None
+            else bisect.bisect_right(self.keys, (kind, high))
+        )
+        return self.rows[start:end]
+
+    def descending(self) -> List[int]:
+        """Rows by descending value, equal values kept in row order."""
+        if self._descending is None:
+            order: List[int] = []
+            end = len(self.keys)
+            while end:
+                start = bisect.bisect_left(self.keys, self.keys[end - 1], 0, end)
+                order.extend(self.rows[start:end])
+                end = start
+            self._descending = order
+        return self._descending
+
+
+class _Table:
+    """Rows of one dataset version, with per-field indexes built on demand."""
+
+    def __init__(self, rows: List[Any]) -> None:
+        self.rows = rows
+        self._hashes: Dict[str, Dict[str, List[int]]] = {}
+        self._columns: Dict[str, _Column] = {}
+        self._lock = threading.Lock()
+
+    def hash_index(self, field: str) -> Dict[str, List[int]]:
+        """Text form -> row ids for ``field``."""
+        index = self._hashes.get(field)
+        if index is None:
+            get = _field_getter(field)
+            index = {}
+            for row, record in enumerate(self.rows):
+                text = _text(get(record))
+                if text is not None:
+                    index.setdefault(text, []).append(row)
+            with self._lock:
+                self._hashes[field] = index
+        return index
+
+    def column(self, field: str) -> _Column:
+        column = self._columns.get(field)
+        if column is None:
+            column = _Column(self.rows, field)
+            with self._lock:
+                self._columns[field] = column
+        return column
+
+
+_tables: Dict[Tuple[str, str, str], _Table] = {}
+_tables_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    global _tables_lock
+    _tables_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _table(
+    cache_key: str, etag: str, pointer: str, load: Callable[[], Any]
+) -> _Table:
+    key = (cache_key, etag, pointer)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+
+    rows = resolve_tokens(load(), parse_pointer(pointer))
+    if not isinstance(rows, list):
+        raise QueryError("Queries need the dataset (or its pointer) to be an array")
+    table = _Table(rows)
+    with _tables_lock:
+        for stale in [existing for existing in _tables if existing[0] == cache_key]:
+            if stale[1] != etag:
+                del _tables[stale]
+        if len(_tables) >= _TABLE_CACHE_SIZE:
+            _tables.pop(next(iter(_tables)))
+        _tables[key] = table
+    return table
+
+
+# -------------------------------------------------------------------
+# Queries
+# -------------------------------------------------------------------
+
+
+def _int_arg(args, name: str, default: int) -> int:
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise QueryError(f"{name} must be an integer") from None
+    if number < 0:
+        raise QueryError(f"{name} must not be negative")
+    return number
+
+
+def _fields(value: Optional[str]) -> List[str]:
+    return [field.strip() for field in (value or "").split(",") if field.strip()]
+
+
+def _project(record: Any, fields: Sequence[str]) -> Any:
+    if not isinstance(record, dict):
+        return record
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        value = _field_getter(field)(record)
+        if value is _MISSING:
+            continue
+        *parents, last = field.split(".")
+        target = projected
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[last] = value
+    return projected
+
+
+def run(
+    args,
+    cache_key: str,
+    etag: str,
+    load: Callable[[], Any],
+    pointer: str = "",
+) -> Dict[str, Any]:
+    """
+    Run the query in ``args`` (request args) against the array at
+    ``pointer`` in the dataset that ``load`` returns, and return
+    ``{"total", "offset", "limit", "items"}``. ``cache_key`` names the
+    dataset and ``etag`` its current version. Raises QueryError for a bad
+    query and KeyError when the pointer does not resolve.
+    """
+    limit = min(_int_arg(args, "limit", DEFAULT_LIMIT), MAX_LIMIT)
+    offset = _int_arg(args, "offset", 0)
+    table = _table(cache_key, etag, pointer, load)
+
+    # Candidate rows: one sorted row list per condition, intersected
+    # smallest first.
+    lookups: List[List[int]] = []
+    bounds: Dict[str, List[Optional[str]]] = {}
+    for name in args:
+        if name.startswith("where."):
+            index = table.hash_index(name[len("where."):])
+            lookups.append(
+                sorted({row for value in args.getlist(name) for row in index.get(value, ())})
+            )
+        elif name.startswith(("min.", "max.")):
+            kind, field = name.split(".", 1)
+            pair = bounds.setdefault(field, [None, None])
+            pair[0 if kind == "min" else 1] = args[name]
+    for field, (low, high) in bounds.items():
+        column = table.column(field)
+        # String values always compare as text; numeric values only when
+        # every given bound is a number.
+        rows = column.between(1, low, high)
+        low_number, high_number = _bound_number(low), _bound_number(high)
+        if (low is None or low_number is not None) and (high is None or high_number is not None):
+            rows = rows + column.between(0, low_number, high_number)
+        lookups.append(sorted(rows))
+
+    candidates: Optional[List[int]] = None
+    for lookup in sorted(lookups, key=len):
+        if candidates is None:
+            candidates = lookup
+        else:
+            keep = set(lookup)
+            candidates = [row for row in candidates if row in keep]
+        if not candidates:
+            break
+
+    order = _fields(args.get("sort"))
+    if order and candidates is None and len(order) == 1:
+        # Whole table, one key: the column is already in order.
+        column = table.column(order[0].lstrip("-"))
+        ordered = column.descending() if order[0].startswith("-") else column.rows
+        candidates = ordered + column.missing
+    elif order:
+        if candidates is None:
+            candidates = list(range(len(table.rows)))
+        for spec in reversed(order):
+            get = _field_getter(spec.lstrip("-"))
+            keyed = [(_order_key(get(table.rows[row])), row) for row in candidates]
+            keyed.sort(key=lambda pair: pair[0], reverse=spec.startswith("-"))
+            # Rows without a comparable value go last in either direction.
+            candidates = [row for key, row in keyed if key[0] < 2] + [
+                row for key, row in keyed if key[0] == 2
+            ]
+    elif candidates is None:
+        candidates = range(len(table.rows))
+
+    page = candidates[offset:offset + limit]
+    fields = _fields(args.get("fields"))
+    items = [table.rows[row] for row in page]
+    if fields:
+        items = [_project(record, fields) for record in items]
+    return {"total": len(candidates), "offset": offset, "limit": limit, "items": items}
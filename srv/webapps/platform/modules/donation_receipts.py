@@ -3,6 +3,15 @@
 """
 Blueprint for storing and retrieving donation receipts as JSON files per client.
 
+Clients whose manifest sets ``"storage_engine": "sqlite"`` keep receipts as
+indexed rows in their SQLite store instead (see modules/sqlite_store.py).
+Clients that set ``"receipt_partitions": "month"`` or ``"year"`` keep one
+file per period, with older periods sealed and gzipped (see
+modules/receipt_partitions.py).
+
+Concurrent POSTs to the same file are group-committed (see
+modules/group_commit.py): one rewrite and fsync covers the whole batch.
+
 Registration example in app.py::
 
     from modules.donation_receipts import donation_receipts_bp
@@ -14,6 +23,8 @@ Endpoints
     Query params:
       - filename (optional): override the target JSON filename (defaults to
         "donation_receipts.json"). ".json" is appended automatically if omitted.
+      - since / until (optional): ISO 8601 bounds on "recorded_at"
+        (since inclusive, until exclusive), e.g. ``since=2025-01``.
     Returns an array of stored receipts (empty array when file is absent).
 
 - POST /api/donation-receipts
@@ -33,44 +44,52 @@ Endpoints
         "ein": "00-0000000"                # optional placeholder EIN
     }
 
-    Appends the receipt to the client-scoped JSON file.
+    Appends the receipt to the client-scoped JSON file. Each stored receipt
+    is assigned a unique "receipt_id".
+
+- POST /api/donation-receipts/import?format=ndjson|csv
+    Streamed NDJSON or CSV body; every record is validated like a single POST
+    and all of them are appended together.
+
+- GET  /api/donation-receipts/export?format=ndjson|csv
+    Streams the stored receipts (optionally since/until) with constant memory.
+
+- GET  /api/donation-receipts/<receipt_id>/document?format=html|pdf
+    Renders one receipt with the tenant's template (see
+    modules/receipt_render.py). PDF answers 501 unless WeasyPrint is installed.
+
+Scripts and jobs outside a request use the public helpers:
+``resolve_receipts_target`` to find a client's store, ``iter_receipts``
+to stream it, ``build_receipt`` to validate a record (raising
+``InvalidReceipt``) and ``bulk_append`` to store many at once.
 """
 
 from __future__ import annotations
 
-import importlib.util
+import csv
 import logging
-import sys
+import tempfile
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List
-
-from flask import Blueprint, jsonify, request
-
-MODULE_DIR = Path(__file__).resolve().parents[1]
-
-
-def _load_data_module(module_name: str, filename: str):
-    if module_name in sys.modules:
-        return sys.modules[module_name]
-
-    module_path = MODULE_DIR / filename
-    spec = importlib.util.spec_from_file_location(module_name, module_path)
-    if spec is None or spec.loader is None:
-        raise ImportError(f"Unable to load module: {filename}")
-
-    module = importlib.util.module_from_spec(spec)
-    sys.modules[module_name] = module
-    spec.loader.exec_module(module)
-    return module
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple
+from uuid import uuid4
+
+from flask import Blueprint, Response, jsonify, request
+
+from modules import (
+    edge_cache,
+    group_commit,
+    json_codec,
+    receipt_bulk,
+    receipt_partitions,
+    receipt_render,
+    sqlite_store,
+)
+from modules.storage_backend import StorageConflict
 
+from data_access import client as client_access
+from data_access import multi_tenant as multi_access
 
-multi_access = _load_data_module(
-    "multi_tennant_data_access", "multi-tennant-data-access.py"
-)
-client_access = _load_data_module(
-    "client_data_acess", "client-data-acess.py"
-)
 
 get_client_paths = multi_access.get_client_paths
 get_client_slug = multi_access.get_client_slug
@@ -79,6 +98,7 @@ load_json = multi_access.load_json
 save_json = multi_access.save_json
 
 resolve_backend_data_path = client_access.resolve_backend_data_path
+resolve_storage_format = client_access.resolve_storage_format
 
 logger = logging.getLogger(__name__)
 
@@ -100,14 +120,45 @@ def _normalize_filename(raw: str | None) -> str:
     return clean
 
 
-def _resolve_receipts_path(client_slug: str, filename: str) -> Path:
-    """Resolve the target receipts JSON path, preferring manifest-backed entries."""
+class ReceiptsTarget(NamedTuple):
+    """Where a client's receipts live and how they are stored."""
+
+    path: Path
+    paths: Dict[str, Path]
+    storage_format: str
+    storage_engine: str
+    partitions: str
+    # Declared in the manifest's backend_data (not the data-dir fallback).
+    declared: bool = False
+
+
+def resolve_receipts_target(
+    client_slug: str, filename: str | None, access: str | None = "read"
+) -> ReceiptsTarget:
+    """
+    Resolve the target receipts JSON path, preferring manifest-backed entries.
+
+    A file declared in the manifest is checked for ``access`` (``"read"``,
+    ``"write"`` or None) and raises PermissionError when its ``read`` or
+    ``write`` flag is off. Undeclared files resolve inside the data dir.
+    """
     paths = get_client_paths(client_slug)
     cleaned_name = _normalize_filename(filename)
+    storage_format = multi_access.normalize_storage_format(None)
+    storage_engine = multi_access.normalize_storage_engine(None)
+    partitions = multi_access.normalize_receipt_partitions(None)
 
     try:
         manifest = load_client_manifest(paths)
-        return resolve_backend_data_path(paths, manifest, cleaned_name)
+        storage_format = resolve_storage_format(manifest, cleaned_name)
+        storage_engine = manifest.storage_engine
+        partitions = manifest.receipt_partitions
+        target = resolve_backend_data_path(paths, manifest, cleaned_name, access=access)
+        return ReceiptsTarget(
+            target, paths, storage_format, storage_engine, partitions, declared=True
+        )
+    except PermissionError:
+        raise
     except Exception as exc:
         # Fall back to a strict data_dir resolution when manifest validation fails
         if not isinstance(exc, (FileNotFoundError, ValueError)):
@@ -119,20 +170,145 @@ def _resolve_receipts_path(client_slug: str, filename: str) -> Path:
         target.relative_to(data_dir)
     except ValueError:
         raise ValueError("Receipt filename escapes the client data directory")
-    return target
+    return ReceiptsTarget(target, paths, storage_format, storage_engine, partitions)
+
+
+def _load_receipts(
+    target: ReceiptsTarget, since: str | None = None, until: str | None = None
+) -> List[Dict[str, Any]]:
+    """
+    Load receipts recorded in ``[since, until)`` (all when both are None), or
+    an empty list if nothing is stored yet.
+    """
+    if target.storage_engine == "sqlite":
+        return sqlite_store.load_receipts(
+            sqlite_store.store_path(target.paths), target.path.name, since, until
+        )
 
+    if target.partitions != "none":
+        return list(receipt_partitions.iter_receipts(target.path, since, until))
 
-def _load_receipts(path: Path) -> List[Dict[str, Any]]:
-    """Load receipt list or return an empty list if the file does not exist."""
-    if not path.exists():
+    if not target.path.exists():
         return []
 
-    payload = load_json(path)
+    payload = load_json(target.path)
     if not isinstance(payload, list):
         raise ValueError("Receipts file must contain a JSON array")
+    if since or until:
+        payload = [receipt for receipt in payload if _in_range(receipt, since, until)]
     return payload
 
 
+def _in_range(receipt: Dict[str, Any], since: str | None, until: str | None) -> bool:
+    recorded_at = receipt.get("recorded_at") or ""
+    return (not since or recorded_at >= since) and (not until or recorded_at < until)
+
+
+def iter_receipts(
+    target: ReceiptsTarget, since: str | None = None, until: str | None = None
+) -> Iterator[Dict[str, Any]]:
+    """Like :func:`_load_receipts`, but yields receipts without loading them all."""
+    if target.storage_engine == "sqlite":
+        yield from sqlite_store.iter_receipts(
+            sqlite_store.store_path(target.paths), target.path.name, since, until
+        )
+        return
+
+    if target.partitions != "none":
+        yield from receipt_partitions.iter_receipts(target.path, since, until)
+        return
+
+    if not target.path.exists():
+        return
+    if target.storage_format == "msgpack":
+        receipts: Iterable[Dict[str, Any]] = _load_receipts(target)
+        yield from (receipt for receipt in receipts if _in_range(receipt, since, until))
+        return
+
+    with target.path.open("rb") as handle:
+        for receipt in json_codec.iter_array(handle):
+            if isinstance(receipt, dict) and _in_range(receipt, since, until):
+                yield receipt
+
+
+def _find_receipt(target: ReceiptsTarget, receipt_id: str) -> Dict[str, Any] | None:
+    """Look up one receipt by ID (indexed on SQLite, a streamed scan otherwise)."""
+    if target.storage_engine == "sqlite":
+        return sqlite_store.find_receipt(
+            sqlite_store.store_path(target.paths), target.path.name, receipt_id
+        )
+    for receipt in iter_receipts(target):
+        if receipt.get("receipt_id") == receipt_id:
+            return receipt
+    return None
+
+
+def _commit_receipts(target: ReceiptsTarget, batches: List[List[Dict[str, Any]]]) -> None:
+    """Write a group of pending appends with one transaction or one rewrite."""
+    receipts = [receipt for batch in batches for receipt in batch]
+    if target.storage_engine == "sqlite":
+        # New receipts get fresh IDs; a clash is skipped rather than failing
+        # the whole group, the same as the file engine never rejects one.
+        sqlite_store.append_receipts(
+            sqlite_store.store_path(target.paths),
+            target.path.name,
+            receipts,
+            skip_duplicates=True,
+        )
+        return
+
+    with group_commit.file_lock(target.path):
+        if target.partitions != "none":
+            receipt_partitions.append(
+                target.path, receipts, target.partitions, target.storage_format
+            )
+            return
+        multi_access.append_json_array(
+            target.path, receipts, target.storage_format, durable=True
+        )
+
+
+def _append_receipts(target: ReceiptsTarget, receipts: List[Dict[str, Any]]) -> None:
+    """
+    Append receipts to the client's store. Concurrent appends to the same
+    declared store are group-committed; this returns once the receipts are
+    on disk. Undeclared files are written directly, so arbitrary
+    ``?filename=`` values cannot each start a writer thread.
+    """
+    if not target.declared:
+        _commit_receipts(target, [receipts])
+        return
+    key = (
+        "receipts",
+        str(target.path),
+        target.storage_format,
+        target.storage_engine,
+        target.partitions,
+    )
+    group_commit.submit(key, receipts, lambda batches: _commit_receipts(target, batches))
+
+
+def _storage_conflict():
+    return (
+        jsonify(
+            {
+                "error": "conflict",
+                "message": "Receipts were changed by another instance; retry",
+            }
+        ),
+        409,
+    )
+
+
+def _refresh_cached_reads(client_slug: str, target: ReceiptsTarget) -> None:
+    """Refresh nginx's copies when the receipts file is also served as backend data."""
+    try:
+        manifest = load_client_manifest(target.paths)
+    except (FileNotFoundError, ValueError):
+        return
+    edge_cache.purge_file(client_slug, manifest, target.path.name)
+
+
 @donation_receipts_bp.route("", methods=["GET"])
 def get_donation_receipts():
     """Fetch stored donation receipts for the current client."""
@@ -140,10 +316,14 @@ def get_donation_receipts():
     filename = request.args.get("filename")
 
     try:
-        target_path = _resolve_receipts_path(client_slug, filename)
-        receipts = _load_receipts(target_path)
+        target = resolve_receipts_target(client_slug, filename, "read")
+        receipts = _load_receipts(
+            target, request.args.get("since"), request.args.get("until")
+        )
     except ValueError as exc:
         return jsonify({"error": "invalid_receipts_file", "message": str(exc)}), 400
+    except PermissionError as exc:
+        return jsonify({"error": "forbidden", "message": str(exc)}), 403
     except Exception as exc:  # pragma: no cover - defensive logging for unexpected issues
         logger.error("Failed to load donation receipts", exc_info=True)
         return (
@@ -151,7 +331,7 @@ def get_donation_receipts():
             500,
         )
 
-    return jsonify({"receipts": receipts, "source": target_path.name})
+    return jsonify({"receipts": receipts, "source": target.path.name})
 
 
 def _coerce_amount(raw: Any) -> float:
@@ -162,38 +342,60 @@ def _coerce_amount(raw: Any) -> float:
     return amount
 
 
-@donation_receipts_bp.route("", methods=["POST"])
-def save_donation_receipt():
-    """Persist a donation receipt for the current client."""
-    client_slug = get_client_slug(request)
-    filename = request.args.get("filename")
+class InvalidReceipt(ValueError):
+    """A receipt payload failed validation; ``error`` is the API error code."""
 
-    try:
-        target_path = _resolve_receipts_path(client_slug, filename)
-    except ValueError as exc:
-        return jsonify({"error": "invalid_receipts_file", "message": str(exc)}), 400
+    def __init__(self, error: str, message: str):
+        super().__init__(message)
+        self.error = error
 
-    if not request.is_json:
-        return jsonify({"error": "invalid_json", "message": "Request must be JSON"}), 400
 
+def _parse_recorded_at(raw: Any) -> str:
+    """Validate an imported ``recorded_at``; keep its text when already ISO dated."""
     try:
-        payload = request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid_json", "message": "Request body could not be parsed as JSON"}), 400
-
-    if not payload:
-        return jsonify({"error": "invalid_json", "message": "Request body is required"}), 400
+        moment = datetime.fromisoformat(str(raw))
+    except ValueError:
+        raise InvalidReceipt(
+            "invalid_recorded_at", "recorded_at must be an ISO 8601 date or timestamp"
+        ) from None
+    if moment.year >= 9999:
+        # The period after it (partition seals, range ends) must still exist.
+        raise InvalidReceipt("invalid_recorded_at", "recorded_at must be before year 9999")
+    text = str(raw)
+    return text if text.startswith(moment.date().isoformat()) else moment.isoformat()
+
+
+def build_receipt(payload: Any, imported: bool = False) -> Dict[str, Any]:
+    """
+    Validate a receipt payload and return the record to store.
+
+    Imported records keep their own ``receipt_id`` and ``recorded_at`` when
+    present (e.g. from a PayPal export); new ones always get fresh values.
+    An imported ``recorded_at`` must parse with ``datetime.fromisoformat``.
+    """
+    if not isinstance(payload, dict) or not payload:
+        raise InvalidReceipt(
+            "invalid_json",
+            "Record must be a JSON object" if imported else "Request body is required",
+        )
 
     try:
         amount = _coerce_amount(payload.get("amount"))
     except Exception:
-        return jsonify({"error": "invalid_amount", "message": "amount is required and must be a number greater than zero"}), 400
+        raise InvalidReceipt(
+            "invalid_amount", "amount is required and must be a number greater than zero"
+        ) from None
 
     donor_info = payload.get("donor") or {}
     if donor_info and not isinstance(donor_info, dict):
-        return jsonify({"error": "invalid_donor", "message": "donor must be an object with donor details"}), 400
-
-    receipt = {
+        raise InvalidReceipt("invalid_donor", "donor must be an object with donor details")
+
+    receipt_id = payload.get("receipt_id") if imported else None
+    recorded_at = payload.get("recorded_at") if imported else None
+    if recorded_at:
+        recorded_at = _parse_recorded_at(recorded_at)
+    return {
+        "receipt_id": str(receipt_id) if receipt_id else uuid4().hex,
         "amount": amount,
         "currency": payload.get("currency", "USD"),
         "donor": donor_info,
@@ -205,29 +407,280 @@ def save_donation_receipt():
             payload.get("no_goods_or_services"),
         ),
         "ein": payload.get("ein") or payload.get("ein_placeholder"),
-        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "recorded_at": recorded_at or datetime.now(timezone.utc).isoformat(),
     }
 
+
+@donation_receipts_bp.route("", methods=["POST"])
+def save_donation_receipt():
+    """Persist a donation receipt for the current client."""
+    client_slug = get_client_slug(request)
+    filename = request.args.get("filename")
+
     try:
-        receipts = _load_receipts(target_path)
+        target = resolve_receipts_target(client_slug, filename, "write")
     except ValueError as exc:
         return jsonify({"error": "invalid_receipts_file", "message": str(exc)}), 400
+    except PermissionError as exc:
+        return jsonify({"error": "forbidden", "message": str(exc)}), 403
+
+    if not request.is_json:
+        return jsonify({"error": "invalid_json", "message": "Request must be JSON"}), 400
+
+    try:
+        payload = request.get_json()
+    except Exception:
+        return jsonify({"error": "invalid_json", "message": "Request body could not be parsed as JSON"}), 400
+
+    try:
+        receipt = build_receipt(payload)
+    except InvalidReceipt as exc:
+        return jsonify({"error": exc.error, "message": str(exc)}), 400
+
+    try:
+        _append_receipts(target, [receipt])
+    except ValueError as exc:
+        return jsonify({"error": "invalid_receipts_file", "message": str(exc)}), 400
+    except StorageConflict:
+        return _storage_conflict()
     except Exception:
-        logger.error("Failed reading existing receipts", exc_info=True)
+        logger.error("Failed writing receipts file", exc_info=True)
         return (
-            jsonify({"error": "server_error", "message": "Could not read existing receipts"}),
+            jsonify({"error": "server_error", "message": "Could not save receipt"}),
             500,
         )
 
-    receipts.append(receipt)
+    _refresh_cached_reads(client_slug, target)
+    return jsonify({"status": "saved", "receipt": receipt, "source": target.path.name}), 201
+
+
+IMPORT_MAX_ERRORS = 100
+
+
+def _skip_stored(
+    target: ReceiptsTarget, receipts: Iterable[Dict[str, Any]]
+) -> Iterator[Dict[str, Any]]:
+    """Drop receipts whose ``receipt_id`` is already stored (or repeated)."""
+    # Read the stored IDs now, before the caller starts rewriting the target.
+    seen = {receipt.get("receipt_id") for receipt in iter_receipts(target)}
+    seen.discard(None)
+
+    def fresh() -> Iterator[Dict[str, Any]]:
+        for receipt in receipts:
+            receipt_id = receipt.get("receipt_id")
+            if receipt_id is not None:
+                if receipt_id in seen:
+                    continue
+                seen.add(receipt_id)
+            yield receipt
+
+    return fresh()
+
+
+def bulk_append(target: ReceiptsTarget, receipts: Iterable[Dict[str, Any]]) -> int:
+    """
+    Append a stream of receipts in one transaction (or one file rewrite).
+    Receipt IDs already stored in the target are skipped on every engine.
+    """
+    if target.storage_engine == "sqlite":
+        return sqlite_store.append_receipts(
+            sqlite_store.store_path(target.paths),
+            target.path.name,
+            receipts,
+            skip_duplicates=True,
+        )
+
+    with group_commit.file_lock(target.path):
+        receipts = _skip_stored(target, receipts)
+        if target.partitions != "none":
+            return receipt_partitions.append_stream(
+                target.path, receipts, target.partitions, target.storage_format
+            )
+        return multi_access.append_json_array(
+            target.path, receipts, target.storage_format, durable=True
+        )
+
+
+def _iter_spool(spool) -> Iterator[Dict[str, Any]]:
+    for line in spool:
+        yield json_codec.loads(line)
+
+
+@donation_receipts_bp.route("/import", methods=["POST"])
+def import_donation_receipts():
+    """
+    Bulk-append receipts streamed as NDJSON (one object per line) or CSV
+    (columns from modules/receipt_bulk.py) and commit them together.
+
+    Query params:
+      - filename (optional): as for POST /api/donation-receipts
+      - format (optional): ``ndjson`` or ``csv`` (default from Content-Type)
+      - skip_invalid (optional): ``1`` to store the valid records even when
+        some fail validation; otherwise any invalid record rejects the import
+
+    Every record is validated like a single POST. ``receipt_id`` and
+    ``recorded_at`` are kept when supplied. Receipt IDs that are already
+    stored in the target file are skipped, so an import can be retried.
+    """
+    client_slug = get_client_slug(request)
+    filename = request.args.get("filename")
+
+    try:
+        target = resolve_receipts_target(client_slug, filename, "write")
+    except ValueError as exc:
+        return jsonify({"error": "invalid_receipts_file", "message": str(exc)}), 400
+    except PermissionError as exc:
+        return jsonify({"error": "forbidden", "message": str(exc)}), 403
+
+    fmt = receipt_bulk.detect_format(request.args.get("format"), request.mimetype)
+    skip_invalid = request.args.get("skip_invalid") == "1"
+    errors: List[Dict[str, Any]] = []
+    rejected = accepted = 0
+
+    # Validate into a spool file first so nothing is written unless the
+    # whole upload is acceptable, without holding it in memory.
+    with tempfile.TemporaryFile() as spool:
+        try:
+            for line_number, payload in receipt_bulk.iter_payloads(request.stream, fmt):
+                try:
+                    receipt = build_receipt(payload, imported=True)
+                except InvalidReceipt as exc:
+                    rejected += 1
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append(
+                            {"line": line_number, "error": exc.error, "message": str(exc)}
+                        )
+                    continue
+                spool.write(json_codec.dumps(receipt) + b"\n")
+                accepted += 1
+        except (UnicodeDecodeError, csv.Error) as exc:
+            return jsonify({"error": "invalid_import", "message": str(exc)}), 400
+
+        if rejected and not skip_invalid:
+            return (
+                jsonify(
+                    {
+                        "error": "invalid_records",
+                        "message": f"{rejected} of {accepted + rejected} records are invalid",
+                        "errors": errors,
+                    }
+                ),
+                400,
+            )
+
+        spool.seek(0)
+        try:
+            written = bulk_append(target, _iter_spool(spool))
+        except ValueError as exc:
+            return jsonify({"error": "invalid_receipts_file", "message": str(exc)}), 400
+        except StorageConflict:
+            return _storage_conflict()
+        except Exception:
+            logger.error("Failed importing receipts", exc_info=True)
+            return (
+                jsonify({"error": "server_error", "message": "Could not import receipts"}),
+                500,
+            )
+
+    _refresh_cached_reads(client_slug, target)
+    return (
+        jsonify(
+            {
+                "status": "imported",
+                "imported": written,
+                "skipped": accepted - written,
+                "rejected": rejected,
+                "errors": errors,
+                "source": target.path.name,
+            }
+        ),
+        201,
+    )
+
+
+@donation_receipts_bp.route("/export", methods=["GET"])
+def export_donation_receipts():
+    """
+    Stream stored receipts as NDJSON or CSV with constant memory.
+
+    Query params:
+      - filename, since, until (optional): as for GET /api/donation-receipts
+      - format (optional): ``ndjson`` or ``csv`` (default from Accept)
+    """
+    client_slug = get_client_slug(request)
+    filename = request.args.get("filename")
+
+    try:
+        target = resolve_receipts_target(client_slug, filename, "read")
+    except ValueError as exc:
+        return jsonify({"error": "invalid_receipts_file", "message": str(exc)}), 400
+    except PermissionError as exc:
+        return jsonify({"error": "forbidden", "message": str(exc)}), 403
+
+    fmt = receipt_bulk.detect_format(
+        request.args.get("format"), request.accept_mimetypes.best
+    )
+    receipts = iter_receipts(target, request.args.get("since"), request.args.get("until"))
+    download = f"{target.path.stem}.{fmt}"
+    return Response(
+        receipt_bulk.encode(receipts, fmt),
+        mimetype=receipt_bulk.MIMETYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{download}"'},
+    )
+
+
+@donation_receipts_bp.route("/<string:receipt_id>/document", methods=["GET"])
+def render_donation_receipt(receipt_id: str):
+    """
+    Render a stored receipt as a donor-facing document.
+
+    Query params:
+      - filename (optional): as for GET /api/donation-receipts
+      - format (optional): ``html`` (default) or ``pdf``
+
+    The response ETag is the render cache digest, so unchanged receipts
+    answer ``If-None-Match`` with 304.
+    """
+    client_slug = get_client_slug(request)
+    filename = request.args.get("filename")
+    fmt = request.args.get("format", "html")
+    if fmt not in receipt_render.FORMATS:
+        return jsonify({"error": "invalid_format", "message": "format must be html or pdf"}), 400
+    if fmt == "pdf" and not receipt_render.pdf_available():
+        return (
+            jsonify({"error": "pdf_unavailable", "message": "PDF rendering is not installed"}),
+            501,
+        )
+
+    try:
+        target = resolve_receipts_target(client_slug, filename, "read")
+        receipt = _find_receipt(target, receipt_id)
+    except ValueError as exc:
+        return jsonify({"error": "invalid_receipts_file", "message": str(exc)}), 400
+    except PermissionError as exc:
+        return jsonify({"error": "forbidden", "message": str(exc)}), 403
+    if receipt is None:
+        return jsonify({"error": "not_found", "message": "Receipt not found"}), 404
 
     try:
-        save_json(target_path, receipts)
+        manifest = load_client_manifest(target.paths)
+    except (FileNotFoundError, ValueError):
+        manifest = None
+    organization = receipt_render.organization_for(manifest, client_slug)
+
+    try:
+        document = receipt_render.render(target.paths, receipt, organization, fmt)
     except Exception:
-        logger.error("Failed writing receipts file", exc_info=True)
+        logger.error("Failed rendering receipt %s", receipt_id, exc_info=True)
         return (
-            jsonify({"error": "server_error", "message": "Could not save receipt"}),
+            jsonify({"error": "server_error", "message": "Could not render receipt"}),
             500,
         )
 
-    return jsonify({"status": "saved", "receipt": receipt, "source": target_path.name}), 201
+    response = Response(document.body, mimetype=document.mimetype)
+    response.set_etag(document.digest)
+    response.headers["Cache-Control"] = "private, no-cache"
+    if fmt == "pdf":
+        download = receipt_render.document_name(receipt, fmt)
+        response.headers["Content-Disposition"] = f'inline; filename="{download}"'
+    return response.make_conditional(request)
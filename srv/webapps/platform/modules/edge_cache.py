@@ -0,0 +1,130 @@
+# /srv/webapps/platform/modules/edge_cache.py
+
+"""
+nginx micro-cache integration: shared-cache lifetimes and refresh on write.
+
+Each site's ``location /api/`` keeps a ``proxy_cache`` zone keyed on host and
+URI (see etc/nginx/sites-available/*.conf). nginx stores a response only
+when the app says so:
+
+- Files with a manifest ``max_age`` send ``Cache-Control: public, max-age=N``
+  and nginx honors it, including ``stale-while-revalidate``.
+- Everything else that is public and ``no-cache`` for browsers also gets
+  ``X-Accel-Expires: EDGE_CACHE_SECONDS`` (default 10). nginx caches it for
+  that long and strips the header before it reaches clients. Files with
+  ``"public": false`` never get it, so nginx does not store them.
+
+Stock nginx has no purge, so writes refresh instead. After a backend_data PUT
+or a receipt write, :func:`purge_file` asks nginx (``EDGE_CACHE_PURGE_URL``,
+e.g. ``http://127.0.0.1:8080``) to re-fetch every cached URI that serves the
+file. It sends the request with ``X-Cache-Refresh: 1``, which the site config
+turns into ``proxy_cache_bypass`` for loopback clients only. nginx then
+replaces the entry with the fresh response. Refreshes run on a background
+thread, so writes never wait for them. Without ``EDGE_CACHE_PURGE_URL`` they
+are skipped.
+"""
+
+from __future__ import annotations
+
+import http.client
+import logging
+import os
+import queue
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+PURGE_URL = os.getenv("EDGE_CACHE_PURGE_URL", "")
+MICROCACHE_SECONDS = int(os.getenv("EDGE_CACHE_SECONDS", "10"))
+REFRESH_HEADER = "X-Cache-Refresh"
+
+_queue: "queue.SimpleQueue[Tuple[str, str]]" = queue.SimpleQueue()
+_worker_pid: Optional[int] = None
+_worker_lock = threading.Lock()
+
+
+def shared_headers(cache_control: str, public: bool) -> Dict[str, str]:
+    """
+    Response headers for a read with the given browser ``Cache-Control``.
+    Only ``public`` responses may be kept in the shared micro-cache.
+    """
+    headers = {"Cache-Control": cache_control}
+    if public and cache_control == "no-cache" and MICROCACHE_SECONDS > 0:
+        headers["X-Accel-Expires"] = str(MICROCACHE_SECONDS)
+    return headers
+
+
+def is_refresh(request) -> bool:
+    """Whether nginx forwarded this request as a local cache refresh."""
+    return request.headers.get(REFRESH_HEADER) == "1"
+
+
+def uris_for_file(manifest, filename: str) -> List[str]:
+    """Cacheable API URIs whose response depends on ``filename``."""
+    policy = manifest.files.get(filename)
+    if policy is None:
+        return []
+    uris = [f"/api/backend-data/{quote(filename)}"]
+    if policy.dataset_id:
+        uris += [f"/api/datasets/{quote(policy.dataset_id)}", "/api/datasets"]
+    return uris
+
+
+def purge_file(client_slug: str, manifest, filename: str) -> None:
+    """Refresh nginx's cached copies of every URI that serves ``filename``."""
+    purge(client_slug, uris_for_file(manifest, filename))
+
+
+def purge(client_slug: str, uris: Iterable[str]) -> None:
+    """Queue cache refreshes for ``uris`` under the tenant's hostnames."""
+    if not PURGE_URL:
+        return
+    uris = list(uris)
+    if not uris:
+        return
+    _ensure_worker()
+    for host in (client_slug, f"www.{client_slug}"):
+        for uri in uris:
+            _queue.put((host, uri))
+
+
+def _ensure_worker() -> None:
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid != os.getpid():
+            threading.Thread(target=_run, name="edge-cache-refresh", daemon=True).start()
+            _worker_pid = os.getpid()
+
+
+def _drain() -> List[Tuple[str, str]]:
+    """Block for one refresh, then take everything queued behind it (deduplicated)."""
+    pending = {_queue.get(): None}
+    while True:
+        try:
+            pending[_queue.get_nowait()] = None
+        except queue.Empty:
+            return list(pending)
+
+
+def _run() -> None:
+    target = urlsplit(PURGE_URL)
+    connection: Optional[http.client.HTTPConnection] = None
+    while True:
+        for host, uri in _drain():
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(
+                        target.hostname, target.port or 80, timeout=10
+                    )
+                connection.request("GET", uri, headers={"Host": host, REFRESH_HEADER: "1"})
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                logger.warning("Edge cache refresh failed for %s%s", host, uri, exc_info=True)
+                if connection is not None:
+                    connection.close()
+                connection = None
@@ -0,0 +1,133 @@
+# /srv/webapps/platform/modules/group_commit.py
+
+"""
+Write-behind group commit for tenant files.
+
+Concurrent writes to the same target are queued and applied by one writer
+thread per target in batches: a batch closes after ``GROUP_COMMIT_FLUSH_MS``
+milliseconds or ``GROUP_COMMIT_MAX_RECORDS`` queued writes, whichever comes
+first, and is committed with a single rewrite and fsync. :func:`submit`
+returns only once the caller's batch is durable, and re-raises the batch's
+error if it failed.
+
+A writer thread that has been idle for ``GROUP_COMMIT_IDLE_S`` seconds
+(default 30) exits and is started again by the next write, so a worker
+keeps threads only for files written recently.
+
+Batching happens inside a worker process (threaded workers or concurrent
+requests in one worker). Across workers, commits to the same file are
+serialised with :func:`file_lock`, so a read-modify-write never loses
+another worker's data.
+
+Usage::
+
+    from modules import group_commit
+
+    group_commit.submit(("receipts", path), receipts, commit_batch)
+"""
+
+from __future__ import annotations
+
+import fcntl
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Tuple
+
+ENABLED = os.getenv("GROUP_COMMIT", "on") != "off"
+FLUSH_SECONDS = float(os.getenv("GROUP_COMMIT_FLUSH_MS", "5")) / 1000
+MAX_RECORDS = int(os.getenv("GROUP_COMMIT_MAX_RECORDS", "256"))
+IDLE_SECONDS = float(os.getenv("GROUP_COMMIT_IDLE_S", "30"))
+
+Commit = Callable[[List[Any]], None]
+
+_registry_lock = threading.Lock()
+_batchers: Dict[Hashable, "_Batcher"] = {}
+
+
+def _reset_after_fork() -> None:
+    # Writer threads do not survive fork; the child starts its own.
+    global _registry_lock, _batchers
+    _registry_lock = threading.Lock()
+    _batchers = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive cross-process lock for ``path`` (on a sibling file)."""
+    lock_path = path.parent / f".{path.name}.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+class _Batcher(threading.Thread):
+    def __init__(self, key: Hashable, commit: Commit):
+        super().__init__(name=f"group-commit-{key!r}"[:64], daemon=True)
+        self.key = key
+        self.commit = commit
+        self.pending: "queue.SimpleQueue[Tuple[Any, Future]]" = queue.SimpleQueue()
+
+    def run(self) -> None:
+        while True:
+            try:
+                first = self.pending.get(timeout=IDLE_SECONDS)
+            except queue.Empty:
+                # submit() enqueues under the registry lock, so nothing can
+                # arrive between this check and leaving the registry.
+                with _registry_lock:
+                    if self.pending.empty():
+                        if _batchers.get(self.key) is self:
+                            del _batchers[self.key]
+                        return
+                continue
+            batch = [first]
+            deadline = time.monotonic() + FLUSH_SECONDS
+            while len(batch) < MAX_RECORDS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self.commit([item for item, _ in batch])
+            except BaseException as exc:
+                for _, waiter in batch:
+                    waiter.set_exception(exc)
+            else:
+                for _, waiter in batch:
+                    waiter.set_result(None)
+
+
+def submit(key: Hashable, item: Any, commit: Commit) -> None:
+    """
+    Queue ``item`` for ``key`` and block until ``commit`` has written the
+    batch containing it. ``commit`` receives the items in arrival order;
+    the first submit for a key decides which ``commit`` serves it.
+    """
+    if not ENABLED or FLUSH_SECONDS <= 0:
+        commit([item])
+        return
+
+    waiter: Future = Future()
+    with _registry_lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            batcher = _batchers[key] = _Batcher(key, commit)
+            batcher.start()
+        batcher.pending.put((item, waiter))
+    waiter.result()
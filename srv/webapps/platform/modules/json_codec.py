@@ -0,0 +1,174 @@
+# /srv/webapps/platform/modules/json_codec.py
+
+"""
+JSON encode/decode helpers shared by the data-access layer and Flask.
+
+orjson is used when it is installed and the stdlib ``json`` module otherwise.
+Both paths return ``bytes`` from :func:`dumps` so callers can write files or
+build responses without an intermediate ``str``.
+
+Non-finite floats (``NaN``, ``Infinity``) are written as ``null`` by both
+backends, as orjson (and JavaScript's ``JSON.stringify``) does. Files and
+responses therefore always stay valid JSON that either backend can read
+back, instead of raising on write or emitting the stdlib's non-standard
+``NaN``. Request bodies cannot carry them (orjson and modules/json_stream.py
+reject them), so they only arise from values computed in Python.
+
+Other differences are edge cases the platform does not rely on: orjson
+reads integers wider than 64 bits as floats, and reading ``NaN`` is an
+error with orjson but not with the stdlib. Values orjson cannot encode fall
+back to the stdlib.
+"""
+
+from __future__ import annotations
+
+import codecs
+import dataclasses
+import decimal
+import json
+import math
+import os
+import uuid
+from datetime import date
+from typing import Any, BinaryIO, Iterator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Set JSON_BACKEND=json to force the stdlib even when orjson is installed.
+BACKEND = (
+    "orjson"
+    if orjson is not None and os.getenv("JSON_BACKEND", "orjson") != "json"
+    else "json"
+)
+
+
+def _default(value: Any) -> Any:
+    """Encode the extra types Flask's default provider understands."""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _finite(value: Any) -> Any:
+    """``value`` with non-finite floats replaced by None (as orjson writes them)."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def _stdlib_encode(obj: Any, indent: bool, sort_keys: bool) -> str:
+    if indent:
+        return json.dumps(
+            obj, indent=2, sort_keys=sort_keys, default=_default, allow_nan=False
+        )
+    return json.dumps(
+        obj,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        sort_keys=sort_keys,
+        default=_default,
+        allow_nan=False,
+    )
+
+
+def _stdlib_dumps(obj: Any, indent: bool, sort_keys: bool) -> bytes:
+    try:
+        text = _stdlib_encode(obj, indent, sort_keys)
+    except ValueError as exc:
+        if "Out of range float" not in str(exc):
+            raise
+        # Rare: only then pay for a copy without NaN/Infinity.
+        text = _stdlib_encode(_finite(obj), indent, sort_keys)
+    return text.encode("utf-8")
+
+
+def dumps(obj: Any, *, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """Serialize ``obj`` to UTF-8 JSON bytes (compact unless ``indent``)."""
+    if BACKEND == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=_default, option=option)
+        except TypeError:
+            # e.g. integers wider than 64 bits; the stdlib handles these.
+            pass
+    return _stdlib_dumps(obj, indent, sort_keys)
+
+
+def loads(data: bytes | bytearray | memoryview | str) -> Any:
+    """Deserialize JSON from bytes or text."""
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+_WHITESPACE = " \t\r\n"
+_decoder = json.JSONDecoder()
+
+
+def iter_array(handle: BinaryIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array read from a binary file,
+    holding only one element (plus one chunk) in memory at a time.
+    """
+    decode = codecs.getincrementaldecoder("utf-8")().decode
+    buffer, pos, eof, opened = "", 0, False, False
+
+    def more() -> None:
+        nonlocal buffer, pos, eof
+        chunk = handle.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + decode(chunk, final=eof)
+        pos = 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            more()
+            continue
+
+        char = buffer[pos]
+        if not opened:
+            if char != "[":
+                raise ValueError("Expected a JSON array")
+            opened = True
+            pos += 1
+        elif char == "]":
+            return
+        elif char == ",":
+            pos += 1
+        else:
+            try:
+                value, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more()
+                continue
+            if end == len(buffer) and not eof:
+                # A number may continue in the next chunk.
+                more()
+                continue
+            yield value
+            pos = end
@@ -0,0 +1,236 @@
+# /srv/webapps/platform/modules/json_index.py
+
+"""
+Byte-offset indexes for JSON datasets and JSON Pointer subtree reads.
+
+When ``save_json`` writes a dataset it encodes the top levels of the document
+itself (everything deeper is encoded in one call) and records the byte span of
+every value down to ``DATASET_INDEX_DEPTH``. The spans are stored next to the
+file in ``.index/<filename>.idx`` together with the file's inode, size and
+mtime; an index that does not match the file on disk is ignored.
+
+``read_subtree`` answers a JSON Pointer (RFC 6901) by memory-mapping the file
+and slicing the indexed span, so nothing outside the requested branch is read
+or parsed. Pointers that reach below the indexed depth parse only the deepest
+indexed ancestor. Files without a current index (written by hand, or in
+MessagePack) fall back to a full parse.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from modules import json_codec
+
+INDEX_DEPTH = int(os.getenv("DATASET_INDEX_DEPTH", "2"))
+INDEX_MIN_BYTES = int(os.getenv("DATASET_INDEX_MIN_BYTES", "65536"))
+INDEX_DIRNAME = ".index"
+
+Spans = Dict[str, Tuple[int, int]]
+
+
+def index_path(path: Path) -> Path:
+    return path.parent / INDEX_DIRNAME / f"{path.name}.idx"
+
+
+# -------------------------------------------------------------------
+# Pointers
+# -------------------------------------------------------------------
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Split a JSON Pointer into unescaped reference tokens."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError("JSON Pointer must be empty or start with '/'")
+    return [
+        token.replace("~1", "/").replace("~0", "~")
+        for token in pointer[1:].split("/")
+    ]
+
+
+def pointer_from_path(path: str) -> str:
+    """Convert a dotted path (``events.0.title``) into a JSON Pointer."""
+    return "".join(f"/{_escape(part)}" for part in path.split(".") if part)
+
+
+def _pointer(tokens: List[str]) -> str:
+    return "".join(f"/{_escape(token)}" for token in tokens)
+
+
+def resolve_tokens(value: Any, tokens: List[str]) -> Any:
+    """Walk ``value`` by reference tokens; raise KeyError when absent."""
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise KeyError(token)
+            value = value[token]
+        elif isinstance(value, list):
+            if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+                raise KeyError(token)
+            position = int(token)
+            if position >= len(value):
+                raise KeyError(token)
+            value = value[position]
+        else:
+            raise KeyError(token)
+    return value
+
+
+# -------------------------------------------------------------------
+# Writing
+# -------------------------------------------------------------------
+
+
+def encode_indexed(
+    payload: Any, indent: bool, max_depth: int = INDEX_DEPTH
+) -> Tuple[bytes, Spans]:
+    """
+    Encode ``payload`` exactly like ``json_codec.dumps`` and return the byte
+    span of every value whose depth is between 1 and ``max_depth``.
+    """
+    out = bytearray()
+    spans: Spans = {}
+    separator = b": " if indent else b":"
+
+    def emit(value: Any, pointer: str, depth: int) -> None:
+        start = len(out)
+        if depth < max_depth and isinstance(value, (dict, list)) and value:
+            pad = b"\n" + b"  " * (depth + 1) if indent else b""
+            close = b"\n" + b"  " * depth if indent else b""
+            if isinstance(value, dict):
+                out.extend(b"{")
+                for position, (key, item) in enumerate(value.items()):
+                    if position:
+                        out.extend(b",")
+                    out.extend(pad)
+                    out.extend(json_codec.dumps(str(key)))
+                    out.extend(separator)
+                    emit(item, f"{pointer}/{_escape(str(key))}", depth + 1)
+                out.extend(close + b"}")
+            else:
+                out.extend(b"[")
+                for position, item in enumerate(value):
+                    if position:
+                        out.extend(b",")
+                    out.extend(pad)
+                    emit(item, f"{pointer}/{position}", depth + 1)
+                out.extend(close + b"]")
+        else:
+            chunk = json_codec.dumps(value, indent=indent)
+            if indent and depth:
+                chunk = chunk.replace(b"\n", b"\n" + b"  " * depth)
+            out.extend(chunk)
+        if depth:
+            spans[pointer] = (start, len(out))
+
+    emit(payload, "", 0)
+    return bytes(out), spans
+
+
+def write_index(path: Path, spans: Optional[Spans]) -> None:
+    """Store spans for the file just written at ``path`` (None removes it)."""
+    target = index_path(path)
+    if spans is None:
+        target.unlink(missing_ok=True)
+        return
+
+    stat = path.stat()
+    body = json_codec.dumps(
+        {
+            "inode": stat.st_ino,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "spans": spans,
+        }
+    )
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(body)
+    os.replace(tmp, target)
+
+
+# -------------------------------------------------------------------
+# Reading
+# -------------------------------------------------------------------
+
+
+_INDEX_CACHE_SIZE = 64
+_index_cache: Dict[Tuple[str, int, int, int], Dict[str, List[int]]] = {}
+_index_cache_lock = threading.Lock()
+
+
+def _load_spans(path: Path, stat: os.stat_result) -> Optional[Dict[str, List[int]]]:
+    """Return the spans for this exact file version, or None if not indexed."""
+    key = (str(path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    spans = _index_cache.get(key)
+    if spans is not None:
+        return spans
+
+    try:
+        index = json_codec.loads(index_path(path).read_bytes())
+    except (OSError, ValueError):
+        return None
+    if (index.get("inode"), index.get("size"), index.get("mtime_ns")) != key[1:]:
+        return None
+
+    spans = index.get("spans") or {}
+    with _index_cache_lock:
+        if len(_index_cache) >= _INDEX_CACHE_SIZE:
+            _index_cache.pop(next(iter(_index_cache)))
+        _index_cache[key] = spans
+    return spans
+
+
+def preload_index(path: Path) -> bool:
+    """Load the index for ``path`` into the cache; return whether it is current."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return False
+    return _load_spans(path, stat) is not None
+
+
+def read_subtree(
+    path: Path, tokens: List[str], load: Callable[[Path], Any]
+) -> bytes:
+    """
+    Return the JSON encoding of the value at ``tokens`` inside ``path``.
+
+    Uses the offset index when it matches the file; ``load`` is the fallback
+    full-document loader. Raises KeyError when the pointer does not resolve.
+    """
+    if not tokens:
+        return json_codec.dumps(load(path))
+
+    with path.open("rb") as handle:
+        stat = os.fstat(handle.fileno())
+        spans = _load_spans(path, stat)
+        if spans is None or stat.st_size == 0:
+            return json_codec.dumps(resolve_tokens(load(path), tokens))
+
+        for depth in range(len(tokens), 0, -1):
+            span = spans.get(_pointer(tokens[:depth]))
+            if span is not None:
+                break
+        else:
+            if spans:
+                # Every top-level member is indexed, so the pointer is absent.
+                raise KeyError(tokens[0])
+            return json_codec.dumps(resolve_tokens(load(path), tokens))
+
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            chunk = mapped[span[0]:span[1]]
+
+    if depth == len(tokens):
+        return chunk
+    return json_codec.dumps(resolve_tokens(json_codec.loads(chunk), tokens[depth:]))
@@ -0,0 +1,50 @@
+# /srv/webapps/platform/modules/json_provider.py
+
+"""
+Flask JSON provider backed by :mod:`modules.json_codec`.
+
+Registration example in app.py::
+
+    from modules.json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
+``jsonify`` in the app and every blueprint then encodes through orjson when it
+is installed, writing the encoded bytes straight into the response body.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from flask.json.provider import JSONProvider
+
+from modules import json_codec
+
+
+class FastJSONProvider(JSONProvider):
+    """JSON provider that produces ``bytes`` responses without a ``str`` hop."""
+
+    sort_keys = True
+    """Sort object keys, matching Flask's default provider."""
+
+    compact: bool | None = None
+    """Pretty-print when ``False``, or when ``None`` and the app is in debug."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        indent = bool(kwargs.get("indent"))
+        sort_keys = kwargs.get("sort_keys", self.sort_keys)
+        return json_codec.dumps(obj, indent=indent, sort_keys=sort_keys).decode("utf-8")
+
+    def dumps_bytes(self, obj: Any, *, indent: bool = False) -> bytes:
+        return json_codec.dumps(obj, indent=indent, sort_keys=self.sort_keys)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return json_codec.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = self.dumps_bytes(obj, indent=indent) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,260 @@
+# /srv/webapps/platform/modules/json_stream.py
+
+"""
+Validate and re-encode JSON as it streams in, without building the document.
+
+``backend_data`` PUTs pass the request body through ``JsonStreamWriter``
+chunk by chunk, and it writes the file's new contents as it goes:
+
+- The top ``DATASET_INDEX_DEPTH`` levels (the ones modules/json_index.py
+  indexes) are tokenized here, checked against the JSON grammar and laid out
+  in the file's storage layout (``compact`` or ``pretty``).
+- Each value below them is parsed on its own by the stdlib's C scanner and
+  re-encoded with ``json_codec.dumps``.
+- The byte spans json_index needs for JSON Pointer reads are recorded on the
+  way.
+
+The output is byte-for-byte what ``save_json`` writes for the same document.
+Memory use is bounded by the largest value below the indexed levels (for a
+``{"items": [...]}`` dataset, one item), not by the document. ``spool`` ties
+it together for a request stream with a size limit.
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from typing import Any, BinaryIO, List, Optional, Tuple
+
+from modules import json_codec
+from modules.json_index import INDEX_DEPTH, Spans, _escape
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_KEY = re.compile(r'"(?:[^"\\\x00-\x1f]|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*"')
+# Characters a JSON value can start with.
+_VALUE_START = frozenset('{["-0123456789tfn')
+_NUMBER_START = frozenset("-0123456789")
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+# Parser states: what the next token may be.
+_VALUE, _FIRST_VALUE, _FIRST_KEY, _KEY_NEXT, _COLON, _AFTER, _DONE = range(7)
+
+
+class BodyTooLarge(Exception):
+    """The stream exceeded the size limit passed to ``spool``."""
+
+
+def _reject_constant(name: str) -> Any:
+    raise ValueError(f"{name} is not valid JSON")
+
+
+_decoder = json.JSONDecoder(parse_constant=_reject_constant)
+
+
+class JsonStreamWriter:
+    """
+    Feed raw JSON bytes in with ``feed`` and call ``close`` at the end.
+    Invalid input raises ValueError naming the character offset.
+    """
+
+    def __init__(self, out: BinaryIO, indent: bool, max_depth: int = INDEX_DEPTH) -> None:
+        self.out = out
+        self.indent = indent
+        self.max_depth = max_depth
+        self.spans: Spans = {}
+        self.written = 0
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._offset = 0  # input offset of _buffer[0]
+        self._retry_at = 0  # buffer length worth another try at a split value
+        self._state = _VALUE
+        # One frame per open container: [closing char, pointer, item count, start, key]
+        self._stack: List[list] = []
+
+    # -- output ---------------------------------------------------------
+
+    def _write(self, data: bytes) -> None:
+        self.out.write(data)
+        self.written += len(data)
+
+    def _newline(self, depth: int) -> None:
+        if self.indent:
+            self._write(b"\n" + b"  " * depth)
+
+    # -- input ----------------------------------------------------------
+
+    def feed(self, chunk: bytes) -> None:
+        try:
+            self._buffer += self._utf8.decode(chunk)
+        except UnicodeDecodeError as exc:
+            raise ValueError(
+                f"Invalid UTF-8 near character {self._offset + len(self._buffer)}"
+            ) from exc
+        if len(self._buffer) >= self._retry_at:
+            self._scan(final=False)
+
+    def close(self) -> Spans:
+        """Finish the document and return the recorded spans."""
+        try:
+            self._buffer += self._utf8.decode(b"", final=True)
+        except UnicodeDecodeError as exc:
+            raise ValueError("Truncated UTF-8 sequence at end of body") from exc
+        self._scan(final=True)
+        if self._state != _DONE:
+            self._fail(len(self._buffer), "unexpected end of body")
+        return self.spans
+
+    def _fail(self, position: int, problem: str) -> None:
+        raise ValueError(f"Invalid JSON at character {self._offset + position}: {problem}")
+
+    def _scan(self, final: bool) -> None:
+        buffer = self._buffer
+        size = len(buffer)
+        position = 0
+        self._retry_at = 0
+        try:
+            while True:
+                position = _WHITESPACE.match(buffer, position).end()
+                if position == size:
+                    break
+                consumed = self._step(buffer, position, final)
+                if consumed is None:
+                    # A value split across chunks. Parsing it again costs as
+                    # much as it did now, so wait until the buffer has doubled.
+                    self._retry_at = (size - position) * 2
+                    break
+                position = consumed
+        finally:
+            self._offset += position
+            self._buffer = buffer[position:]
+
+    # -- grammar --------------------------------------------------------
+
+    def _step(self, buffer: str, position: int, final: bool) -> Optional[int]:
+        """Consume one token or value at ``position``; None means incomplete."""
+        char = buffer[position]
+        state = self._state
+
+        if char in "}]":
+            if state not in (_AFTER, _FIRST_VALUE, _FIRST_KEY) or char != self._stack[-1][0]:
+                self._fail(position, f"unexpected {char}")
+            frame = self._stack.pop()
+            if frame[2]:
+                self._newline(len(self._stack))
+            self._write(char.encode())
+            self._end_value(frame[1], frame[3])
+            return position + 1
+
+        if state in (_FIRST_KEY, _KEY_NEXT):
+            key = _KEY.match(buffer, position)
+            if key is None:
+                if char == '"' and not final:
+                    return None
+                self._fail(position, "expected an object key")
+            frame = self._stack[-1]
+            if frame[2]:
+                self._write(b",")
+            self._newline(len(self._stack))
+            frame[4] = json.loads(key.group())
+            self._write(json_codec.dumps(frame[4]))
+            frame[2] += 1
+            self._state = _COLON
+            return key.end()
+
+        if state == _COLON:
+            if char != ":":
+                self._fail(position, "expected ':'")
+            self._write(b": " if self.indent else b":")
+            self._state = _VALUE
+            return position + 1
+
+        if state == _AFTER:
+            if char != ",":
+                self._fail(position, "expected ',' or a closing bracket")
+            self._state = _KEY_NEXT if self._stack[-1][0] == "}" else _VALUE
+            return position + 1
+
+        if state == _DONE:
+            self._fail(position, "unexpected data after the document")
+        if char not in _VALUE_START:
+            self._fail(position, "expected a value")
+
+        # A value: in an array, after a key, or at the top level.
+        pointer = self._child_pointer()
+        depth = len(self._stack)
+        if char in "{[" and depth < self.max_depth:
+            self._begin_item()
+            self._stack.append(["}" if char == "{" else "]", pointer, 0, self.written, None])
+            self._write(char.encode())
+            self._state = _FIRST_KEY if char == "{" else _FIRST_VALUE
+            return position + 1
+
+        try:
+            value, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as exc:
+            if final:
+                self._fail(exc.pos, exc.msg)
+            return None
+        if not final and char in _NUMBER_START and _NUMBER_TAIL.match(buffer, end).end() == len(buffer):
+            return None  # "-2" of "-2.5e3": the number may continue in the next chunk
+        self._begin_item()
+        start = self.written
+        chunk = json_codec.dumps(value, indent=self.indent)
+        if self.indent and depth:
+            chunk = chunk.replace(b"\n", b"\n" + b"  " * depth)
+        self._write(chunk)
+        self._end_value(pointer, start)
+        return end
+
+    def _begin_item(self) -> None:
+        """Write the separator before a new array item."""
+        if self._stack and self._stack[-1][0] == "]":
+            frame = self._stack[-1]
+            if frame[2]:
+                self._write(b",")
+            self._newline(len(self._stack))
+            frame[2] += 1
+
+    def _child_pointer(self) -> Optional[str]:
+        """JSON Pointer of the value about to start (None for the root)."""
+        if not self._stack:
+            return None
+        frame = self._stack[-1]
+        parent = frame[1] or ""
+        if frame[0] == "}":
+            return f"{parent}/{_escape(frame[4])}"
+        return f"{parent}/{frame[2]}"
+
+    def _end_value(self, pointer: Optional[str], start: int) -> None:
+        if pointer is not None:
+            self.spans[pointer] = (start, self.written)
+        self._state = _AFTER if self._stack else _DONE
+
+
+def spool(
+    stream: BinaryIO,
+    out: BinaryIO,
+    indent: bool,
+    limit: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Tuple[int, Spans]:
+    """
+    Copy a JSON body from ``stream`` to ``out`` through JsonStreamWriter.
+    Return the number of body bytes read and the spans. Raises BodyTooLarge
+    as soon as more than ``limit`` bytes arrive and ValueError for invalid
+    JSON.
+    """
+    writer = JsonStreamWriter(out, indent)
+    received = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        received += len(chunk)
+        if limit is not None and received > limit:
+            raise BodyTooLarge(received)
+        writer.feed(chunk)
+    return received, writer.close()
@@ -9,13 +9,15 @@ This module provides a Flask Blueprint with endpoints for:
 - Webhook handling (stub for future implementation)
 
 All PayPal API credentials are read from environment variables.
+Jobs outside a request page through the account's transaction history
+with list_transactions() (see modules/paypal_reconcile.py).
 
 REGISTRATION IN app.py:
 -----------------------
-To register this Blueprint in your Flask app, add to app.py:
+app.py registers this Blueprint when "payments" is listed in the
+PLATFORM_BLUEPRINTS environment variable:
 
-    from modules.paypal_gateway import paypal_bp
-    app.register_blueprint(paypal_bp)
+    PLATFORM_BLUEPRINTS=receipts,payments
 
 This will register the following endpoints:
 - POST /api/payments/paypal/create-order
@@ -39,12 +41,16 @@ from __future__ import annotations
 
 import os
 import logging
+import threading
 from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
 
 import requests
 from flask import Blueprint, request, jsonify
 
+from data_access import multi_tenant as multi_access
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -58,9 +64,34 @@ PAYPAL_API_BASE = os.getenv(
     "PAYPAL_API_BASE", 
     "https://api-m.sandbox.paypal.com"  # Default to sandbox for safety
 )
+TRANSACTIONS_ENDPOINT = "/v1/reporting/transactions"
 
-# In-memory token cache (in production, consider Redis or similar)
+# In-memory token cache (in production, consider Redis or similar).
+# Worker threads share it; _token_lock makes only one of them refresh it.
 _token_cache: Optional[Dict[str, Any]] = None
+_token_lock = threading.Lock()
+
+# One keep-alive requests.Session per thread, so calls to PayPal reuse TLS
+# connections instead of handshaking every time.
+_local = threading.local()
+
+
+def _reset_after_fork() -> None:
+    global _token_lock, _local
+    _token_lock = threading.Lock()
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _http() -> requests.Session:
+    """This thread's pooled session for PayPal API calls."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
 
 
 class PayPalClientError(Exception):
@@ -72,7 +103,8 @@ def get_paypal_access_token() -> str:
     """
     Obtain or refresh a PayPal OAuth access token.
     
-    Uses client credentials flow. Caches the token until it expires.
+    Uses client credentials flow. Caches the token until it expires; when it
+    has, one thread fetches a new one while the others wait for it.
     
     Returns:
         str: Access token for PayPal API requests
@@ -80,25 +112,37 @@ def get_paypal_access_token() -> str:
     Raises:
         PayPalClientError: If authentication fails
     """
+    cached = _cached_token()
+    if cached:
+        return cached
+
+    with _token_lock:
+        # Another thread may have refreshed it while we waited
+        cached = _cached_token()
+        if cached:
+            return cached
+        return _fetch_access_token()
+
+
+def _cached_token() -> Optional[str]:
+    token = _token_cache
+    if token and token.get("expires_at") and datetime.now() < token["expires_at"]:
+        return token["access_token"]
+    return None
+
+
+def _fetch_access_token() -> str:
     global _token_cache
-    
-    # Check if we have a valid cached token
-    if _token_cache and _token_cache.get("expires_at"):
-        expires_at = _token_cache.get("expires_at")
-        if datetime.now() < expires_at:
-            return _token_cache["access_token"]
-    
+
     # Validate credentials are configured
     if not PAYPAL_CLIENT_ID or not PAYPAL_CLIENT_SECRET:
         raise PayPalClientError(
             "PayPal credentials not configured. Set PAYPAL_CLIENT_ID and PAYPAL_CLIENT_SECRET."
         )
     
-    # Determine OAuth endpoint based on API base URL
-    if "sandbox" in PAYPAL_API_BASE:
-        oauth_url = "https://api-m.sandbox.paypal.com/v1/oauth2/token"
-    else:
-        oauth_url = "https://api-m.paypal.com/v1/oauth2/token"
+    # OAuth endpoint lives on the same host as the rest of the API
+    # (sandbox, live, or a local stub such as scripts/paypal_stub.py)
+    oauth_url = f"{PAYPAL_API_BASE}/v1/oauth2/token"
     
     # Request access token
     auth = (PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET)
@@ -109,7 +153,7 @@ def get_paypal_access_token() -> str:
     data = {"grant_type": "client_credentials"}
     
     try:
-        response = requests.post(
+        response = _http().post(
             oauth_url,
             auth=auth,
             headers=headers,
@@ -136,7 +180,7 @@ def get_paypal_access_token() -> str:
         return access_token
         
     except requests.RequestException as exc:
-        logger.error(f"PayPal OAuth request failed: {exc}")
+        logger.error("PayPal OAuth request failed: %s", exc)
         raise PayPalClientError(f"Failed to obtain PayPal access token: {exc}")
 
 
@@ -174,11 +218,11 @@ def _make_paypal_request(
     
     try:
         if method.upper() == "POST":
-            response = requests.post(url, json=data, headers=request_headers, timeout=30)
+            response = _http().post(url, json=data, headers=request_headers, timeout=30)
         elif method.upper() == "GET":
-            response = requests.get(url, headers=request_headers, timeout=30)
+            response = _http().get(url, headers=request_headers, timeout=30)
         elif method.upper() == "PATCH":
-            response = requests.patch(url, json=data, headers=request_headers, timeout=30)
+            response = _http().patch(url, json=data, headers=request_headers, timeout=30)
         else:
             raise PayPalClientError(f"Unsupported HTTP method: {method}")
         
@@ -193,14 +237,53 @@ def _make_paypal_request(
         except (ValueError, AttributeError):
             error_detail = str(exc)
         
-        logger.error(f"PayPal API request failed: {method} {endpoint} - {error_detail}")
+        logger.error("PayPal API request failed: %s %s - %s", method, endpoint, error_detail)
         raise PayPalClientError(f"PayPal API error: {error_detail}")
         
     except requests.RequestException as exc:
-        logger.error(f"PayPal API request exception: {exc}")
+        logger.error("PayPal API request exception: %s", exc)
         raise PayPalClientError(f"PayPal API request failed: {exc}")
 
 
+def list_transactions(
+    start: datetime,
+    end: datetime,
+    page: int = 1,
+    page_size: int = 100,
+    fields: str = "transaction_info,payer_info",
+) -> Dict[str, Any]:
+    """
+    Fetch one page of the account's transaction history (reporting API).
+    
+    Args:
+        start: Start of the range (inclusive, timezone-aware)
+        end: End of the range (exclusive); at most 31 days after start
+        page: 1-based page number
+        page_size: Transactions per page (at most 500)
+        fields: Comma-separated field groups to return
+        
+    Returns:
+        dict: The page, with "transaction_details" and "total_pages"
+        
+    Raises:
+        PayPalClientError: If the request fails
+    """
+    query = urlencode(
+        {
+            "start_date": _paypal_time(start),
+            "end_date": _paypal_time(end),
+            "fields": fields,
+            "page_size": page_size,
+            "page": page,
+        }
+    )
+    return _make_paypal_request("GET", f"{TRANSACTIONS_ENDPOINT}?{query}")
+
+
+def _paypal_time(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S%z")
+
+
 @paypal_bp.route("/create-order", methods=["POST"])
 def create_order():
     """
@@ -304,7 +387,9 @@ def create_order():
     # Format amount as string with 2 decimal places
     amount_str = f"{amount_float:.2f}"
     
-    # Build PayPal order request
+    # Build PayPal order request. All tenants share one PayPal account, so
+    # custom_id records which tenant the payment belongs to; it comes back as
+    # custom_field in the transaction history (see paypal_reconcile).
     order_data = {
         "intent": "CAPTURE",
         "purchase_units": [
@@ -312,7 +397,8 @@ def create_order():
                 "amount": {
                     "currency_code": currency.upper(),
                     "value": amount_str
-                }
+                },
+                "custom_id": multi_access.get_client_slug(request)
             }
         ]
     }
@@ -363,16 +449,16 @@ def create_order():
         # Log client identifier if provided (for multi-tenant tracking)
         client_id = data.get("client_id")
         if client_id:
-            logger.info(f"PayPal order created for client: {client_id}, order_id: {order_id}")
+            logger.info("PayPal order created for client: %s, order_id: %s", client_id, order_id)
         
         return jsonify(result), 201
         
     except PayPalClientError as exc:
-        logger.error(f"PayPal order creation failed: {exc}")
+        logger.error("PayPal order creation failed: %s", exc)
         return jsonify({"error": str(exc)}), 502
     
     except Exception as exc:
-        logger.error(f"Unexpected error creating PayPal order: {exc}", exc_info=True)
+        logger.error("Unexpected error creating PayPal order: %s", exc, exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -442,15 +528,15 @@ def capture_order():
             "full_response": response  # Include full response for debugging/future use
         }
         
-        logger.info(f"PayPal order captured: {order_id}, status: {status}")
+        logger.info("PayPal order captured: %s, status: %s", order_id, status)
         return jsonify(result), 200
         
     except PayPalClientError as exc:
-        logger.error(f"PayPal order capture failed: {exc}")
+        logger.error("PayPal order capture failed: %s", exc)
         return jsonify({"error": str(exc)}), 502
     
     except Exception as exc:
-        logger.error(f"Unexpected error capturing PayPal order: {exc}", exc_info=True)
+        logger.error("Unexpected error capturing PayPal order: %s", exc, exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -475,7 +561,7 @@ def webhook():
     event_data = request.get_json()
     event_type = event_data.get("event_type") if event_data else None
     
-    logger.info(f"PayPal webhook received: {event_type}")
+    logger.info("PayPal webhook received: %s", event_type)
     
     # TODO: Implement webhook signature verification
     # TODO: Process webhook events based on event_type
@@ -0,0 +1,300 @@
+# /srv/webapps/platform/modules/paypal_reconcile.py
+
+"""
+Reconcile PayPal captures with a tenant's stored donation receipts.
+
+Receipts are written by the frontend after ``capture-order`` succeeds, so a
+closed tab or a failed POST leaves a capture without a receipt. This job
+finds those captures in PayPal's transaction history and backfills them:
+
+1. The date range is split into windows of at most 31 days (the reporting
+   API's limit). The first page of every window, and then the remaining
+   pages, are fetched on ``concurrency`` threads through
+   modules/paypal_gateway.py, so they share its token cache and each thread
+   reuses its own keep-alive session.
+2. Completed payments (event codes ``T00xx``, status ``S``) are looked up
+   in an index of the receipts already stored around the range, keyed on
+   the PayPal transaction (capture) ID: ``provider_metadata.transaction_id``
+   or ``capture_id``, or a ``receipt_id`` of ``paypal-<transaction id>``.
+3. Captures with no receipt become receipts with ``receipt_id``
+   ``paypal-<transaction id>``, validated like an import, and are appended
+   in one bulk write. Duplicate IDs are skipped on every storage engine, so
+   a run that overlaps an earlier one adds nothing twice.
+
+All tenants share one PayPal account, so a run covers exactly one tenant.
+``create-order`` tags every order with the tenant slug as the purchase
+unit's ``custom_id``, which the reporting API returns as ``custom_field``;
+payments tagged for another tenant are skipped. Untagged payments (made
+before orders were tagged) cannot be attributed, so they are only taken for
+the one tenant named in PAYPAL_RECONCILE_UNTAGGED_TENANT, and skipped for
+every other.
+
+Usage (see scripts/reconcile_paypal.py for the CLI)::
+
+    from modules import paypal_reconcile
+    report = paypal_reconcile.reconcile("cuyahogaterravita.com", since, until)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from modules import paypal_gateway, receipt_render
+from modules.donation_receipts import (
+    InvalidReceipt,
+    build_receipt,
+    bulk_append,
+    iter_receipts,
+    load_client_manifest,
+    resolve_receipts_target,
+)
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = int(os.getenv("PAYPAL_RECONCILE_CONCURRENCY", "4"))
+PAGE_SIZE = int(os.getenv("PAYPAL_RECONCILE_PAGE_SIZE", "500"))
+RETRIES = int(os.getenv("PAYPAL_RECONCILE_RETRIES", "2"))
+# The tenant that owns untagged payments, while only one tenant took payments.
+UNTAGGED_TENANT = os.getenv("PAYPAL_RECONCILE_UNTAGGED_TENANT", "").strip()
+
+MAX_WINDOW = timedelta(days=31)
+# Receipts are recorded shortly after the capture; look this far either side.
+INDEX_SLACK = timedelta(days=7)
+RECEIPT_ID_PREFIX = "paypal-"
+METADATA_KEYS = ("transaction_id", "capture_id")
+PAYMENT_EVENT_PREFIX = "T00"
+COMPLETED_STATUS = "S"
+
+
+class Window(NamedTuple):
+    """One reporting API query range, ``[start, end)``."""
+
+    start: datetime
+    end: datetime
+
+
+def windows(since: datetime, until: datetime) -> List[Window]:
+    """Split ``[since, until)`` into ranges the reporting API accepts."""
+    ranges = []
+    start = since
+    while start < until:
+        end = min(start + MAX_WINDOW, until)
+        ranges.append(Window(start, end))
+        start = end
+    return ranges
+
+
+def fetch_page(window: Window, page: int) -> Dict[str, Any]:
+    """One page of a window's transactions, retried on PayPal errors."""
+    for attempt in range(RETRIES + 1):
+        try:
+            return paypal_gateway.list_transactions(window.start, window.end, page, PAGE_SIZE)
+        except paypal_gateway.PayPalClientError:
+            if attempt == RETRIES:
+                raise
+            time.sleep(0.5 * 2**attempt)
+    raise AssertionError("unreachable")
+
+
+def iter_pages(
+    since: datetime, until: datetime, concurrency: int = CONCURRENCY
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every page of transactions in ``[since, until)`` as it arrives
+    (not in date order). At most ``concurrency`` pages are requested at once.
+    """
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        pending = {
+            pool.submit(fetch_page, window, 1): (window, 1) for window in windows(since, until)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                window, page = pending.pop(future)
+                payload = future.result()
+                if page == 1:
+                    for later in range(2, int(payload.get("total_pages") or 1) + 1):
+                        pending[pool.submit(fetch_page, window, later)] = (window, later)
+                yield payload
+
+
+def transaction_ids(receipt: Dict[str, Any]) -> Iterator[str]:
+    """The PayPal transaction IDs a stored receipt accounts for."""
+    receipt_id = str(receipt.get("receipt_id") or "")
+    if receipt_id.startswith(RECEIPT_ID_PREFIX):
+        yield receipt_id[len(RECEIPT_ID_PREFIX):]
+    metadata = receipt.get("provider_metadata")
+    if isinstance(metadata, dict):
+        for key in METADATA_KEYS:
+            if metadata.get(key):
+                yield str(metadata[key])
+
+
+def build_index(receipts: Iterable[Dict[str, Any]]) -> Set[str]:
+    """Transaction IDs that already have a receipt."""
+    return {transaction_id for receipt in receipts for transaction_id in transaction_ids(receipt)}
+
+
+def is_completed_payment(transaction: Dict[str, Any]) -> bool:
+    info = transaction.get("transaction_info") or {}
+    return (
+        str(info.get("transaction_event_code", "")).startswith(PAYMENT_EVENT_PREFIX)
+        and info.get("transaction_status") == COMPLETED_STATUS
+        and bool(info.get("transaction_id"))
+    )
+
+
+def tenant_of(transaction: Dict[str, Any]) -> Optional[str]:
+    """The tenant slug the order was tagged with, or None if untagged."""
+    info = transaction.get("transaction_info") or {}
+    return str(info.get("custom_field") or "").strip() or None
+
+
+def _recorded_at(raw: Optional[str]) -> Optional[str]:
+    if not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw).astimezone(timezone.utc).isoformat()
+    except ValueError:
+        return raw
+
+
+def receipt_for(transaction: Dict[str, Any], organization: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the receipt for a captured payment (raises InvalidReceipt)."""
+    info = transaction.get("transaction_info") or {}
+    payer = transaction.get("payer_info") or {}
+    name = payer.get("payer_name") or {}
+    amount = info.get("transaction_amount") or {}
+    transaction_id = str(info["transaction_id"])
+
+    donor = {
+        "name": name.get("alternate_full_name")
+        or " ".join(part for part in (name.get("given_name"), name.get("surname")) if part),
+        "email": payer.get("email_address"),
+    }
+    metadata = {
+        "transaction_id": transaction_id,
+        "event_code": info.get("transaction_event_code"),
+        "reconciled": True,
+    }
+    if info.get("paypal_reference_id"):
+        metadata["reference_id"] = info["paypal_reference_id"]
+    return build_receipt(
+        {
+            "receipt_id": f"{RECEIPT_ID_PREFIX}{transaction_id}",
+            "recorded_at": _recorded_at(info.get("transaction_initiation_date")),
+            "amount": amount.get("value"),
+            "currency": amount.get("currency_code", "USD"),
+            "donor": {key: value for key, value in donor.items() if value},
+            "designation": info.get("transaction_subject"),
+            "provider": "paypal",
+            "provider_metadata": metadata,
+            "ein": organization.get("ein"),
+        },
+        imported=True,
+    )
+
+
+def reconcile(
+    client_slug: str,
+    since: datetime,
+    until: datetime,
+    concurrency: int = CONCURRENCY,
+    filename: Optional[str] = None,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """
+    Backfill receipts for the tenant's captures in ``[since, until)``.
+
+    Returns counts (pages, transactions, payments, other_tenant, untagged,
+    matched, missing, invalid, written) and timings. With ``dry_run``
+    nothing is written.
+    """
+    started = time.perf_counter()
+    target = resolve_receipts_target(client_slug, filename, "read" if dry_run else "write")
+    try:
+        manifest = load_client_manifest(target.paths)
+    except (FileNotFoundError, ValueError):
+        manifest = None
+    organization = receipt_render.organization_for(manifest, client_slug)
+
+    index = build_index(
+        iter_receipts(
+            target,
+            (since - INDEX_SLACK).isoformat(),
+            (until + INDEX_SLACK).isoformat(),
+        )
+    )
+    indexed = time.perf_counter()
+
+    report = {
+        "pages": 0,
+        "transactions": 0,
+        "payments": 0,
+        "other_tenant": 0,
+        "untagged": 0,
+        "matched": 0,
+        "invalid": 0,
+    }
+    missing: List[Dict[str, Any]] = []
+    seen: Set[str] = set()
+    for page in iter_pages(since, until, concurrency):
+        report["pages"] += 1
+        for transaction in page.get("transaction_details") or []:
+            report["transactions"] += 1
+            if not is_completed_payment(transaction):
+                continue
+            transaction_id = str(transaction["transaction_info"]["transaction_id"])
+            if transaction_id in seen:
+                continue  # on a window boundary
+            seen.add(transaction_id)
+            tenant = tenant_of(transaction)
+            if tenant is None and client_slug != UNTAGGED_TENANT:
+                report["untagged"] += 1
+                continue
+            if tenant is not None and tenant != client_slug:
+                report["other_tenant"] += 1
+                continue
+            report["payments"] += 1
+            if transaction_id in index:
+                report["matched"] += 1
+                continue
+            try:
+                missing.append(receipt_for(transaction, organization))
+            except InvalidReceipt as exc:
+                report["invalid"] += 1
+                logger.warning("Skipping PayPal transaction %s: %s", transaction_id, exc)
+    fetched = time.perf_counter()
+
+    written = 0
+    if missing and not dry_run:
+        missing.sort(key=lambda receipt: receipt["recorded_at"])
+        written = bulk_append(target, missing)
+    finished = time.perf_counter()
+
+    report.update(
+        missing=len(missing),
+        written=written,
+        windows=len(windows(since, until)),
+        indexed=len(index),
+        source=target.path.name,
+        index_s=round(indexed - started, 3),
+        fetch_s=round(fetched - indexed, 3),
+        write_s=round(finished - fetched, 3),
+        elapsed_s=round(finished - started, 3),
+    )
+    logger.info(
+        "PayPal reconciliation for %s: %d payments, %d matched, %d missing, %d written",
+        client_slug,
+        report["payments"],
+        report["matched"],
+        report["missing"],
+        written,
+        extra={"tenant": client_slug, "reconcile": report},
+    )
+    return report
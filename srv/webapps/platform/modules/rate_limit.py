@@ -0,0 +1,316 @@
+# /srv/webapps/platform/modules/rate_limit.py
+
+"""
+Per-tenant token-bucket rate limits and in-flight quotas.
+
+Every request is assigned a route class (``static``, ``datasets``,
+``writes``, ``receipts`` or ``payments``) and checked against the limits
+for its tenant slug and class:
+
+- ``rate`` / ``burst``: token bucket refilled at ``rate`` requests per second
+  up to ``burst`` tokens.
+- ``max_in_flight``: requests of that class the tenant may have running at
+  once across all workers.
+
+Defaults are in DEFAULT_LIMITS; a tenant overrides them per class in its
+manifest::
+
+    "MSS": { "rate_limits": { "datasets": {"rate": 5, "burst": 10, "max_in_flight": 2} } }
+
+A value of 0 disables that check. Rejected requests get an immediate 429 with
+``Retry-After``. Payment capture is never limited; receipt writes and
+imports have their own generous ``receipts`` class, so a burst of them
+cannot starve the tenant's other writes or other tenants.
+
+State is shared by all workers through a small memory-mapped file
+(``RATE_LIMIT_STATE``, default under /dev/shm) guarded by ``flock``. In-flight
+counts are recorded per worker pid, so counts held by a worker that died are
+reclaimed the next time the quota is reached. Set RATE_LIMITS=off to disable.
+
+Registration example in app.py::
+
+    from modules import rate_limit
+    rate_limit.init_app(app, resolve_limits)
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from flask import g, jsonify, request
+
+from modules import shm_state
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("RATE_LIMITS", "on") != "off"
+STATE_PATH = shm_state.state_path("RATE_LIMIT_STATE", "platform-rate-limits")
+
+ROUTE_CLASSES = ("static", "datasets", "writes", "receipts", "payments")
+LIMIT_FIELDS = ("rate", "burst", "max_in_flight")
+
+DEFAULT_LIMITS: Dict[str, Dict[str, float]] = {
+    "static": {"rate": 50, "burst": 100, "max_in_flight": 8},
+    "datasets": {"rate": 20, "burst": 40, "max_in_flight": 4},
+    "writes": {"rate": 5, "burst": 10, "max_in_flight": 2},
+    "receipts": {"rate": 20, "burst": 60, "max_in_flight": 4},
+    "payments": {"rate": 2, "burst": 5, "max_in_flight": 2},
+}
+
+# Capture follows a payment the donor has already approved; refusing it
+# loses the donation.
+UNLIMITED_ENDPOINTS = frozenset({"paypal.capture_order"})
+RECEIPT_ENDPOINTS = frozenset(
+    {"donation_receipts.save_donation_receipt", "donation_receipts.import_donation_receipts"}
+)
+
+# Slot: key hash, tokens, last refill, then (pid, count) pairs for in-flight.
+_PID_ENTRIES = 8
+_SLOT = struct.Struct(f"<Qdd{_PID_ENTRIES * 2}i")
+_SLOTS = 1024
+_PROBES = 32
+
+_thread_lock = threading.Lock()
+_state: Optional[Tuple[int, mmap.mmap]] = None
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: float = 0.0
+    slot: Optional[int] = None
+
+
+def _reset_after_fork() -> None:
+    # flock is tied to the open file description, so each process reopens.
+    global _state, _thread_lock
+    _state = None
+    _thread_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def reset_state() -> None:
+    """Start with empty buckets (called once by the Gunicorn master)."""
+    shm_state.reset(STATE_PATH)
+
+
+def _open_state() -> Tuple[int, mmap.mmap]:
+    global _state
+    if _state is None:
+        _state = shm_state.open_state(STATE_PATH, _SLOT.size * _SLOTS)
+    return _state
+
+
+class _locked:
+    def __enter__(self):
+        _thread_lock.acquire()
+        fd, mapped = _open_state()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self.fd = fd
+        return mapped
+
+    def __exit__(self, exc_type, exc, tb):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        _thread_lock.release()
+
+
+def _key_hash(slug: str, route_class: str) -> int:
+    digest = hashlib.blake2b(f"{slug}\0{route_class}".encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little") or 1
+
+
+def _find_slot(mapped: mmap.mmap, key: int) -> Optional[int]:
+    start = key % _SLOTS
+    for probe in range(_PROBES):
+        slot = (start + probe) % _SLOTS
+        stored = struct.unpack_from("<Q", mapped, slot * _SLOT.size)[0]
+        if stored in (key, 0):
+            return slot
+    return None
+
+
+def _in_flight(entries: list) -> int:
+    return sum(entries[index + 1] for index in range(0, len(entries), 2))
+
+
+def _reap_dead(entries: list) -> None:
+    for index in range(0, len(entries), 2):
+        if entries[index] and not shm_state.pid_alive(entries[index]):
+            entries[index] = entries[index + 1] = 0
+
+
+def _adjust_pid(entries: list, pid: int, delta: int) -> bool:
+    free = None
+    for index in range(0, len(entries), 2):
+        if entries[index] == pid:
+            entries[index + 1] = max(entries[index + 1] + delta, 0)
+            if entries[index + 1] == 0:
+                entries[index] = 0
+            return True
+        if free is None and entries[index + 1] == 0:
+            free = index
+    if delta > 0 and free is not None:
+        entries[free], entries[free + 1] = pid, delta
+        return True
+    return False
+
+
+def acquire(slug: str, route_class: str, limits: Mapping[str, float]) -> Decision:
+    """Take a token and an in-flight slot, or explain how long to back off."""
+    rate = float(limits.get("rate") or 0)
+    burst = float(limits.get("burst") or max(rate, 1))
+    max_in_flight = int(limits.get("max_in_flight") or 0)
+    if not rate and not max_in_flight:
+        return Decision(True)
+
+    key = _key_hash(slug, route_class)
+    now = time.monotonic()
+    pid = os.getpid()
+
+    with _locked() as mapped:
+        slot = _find_slot(mapped, key)
+        if slot is None:
+            logger.warning("Rate limit table full; allowing %s/%s", slug, route_class)
+            return Decision(True)
+
+        offset = slot * _SLOT.size
+        stored, tokens, updated, *entries = _SLOT.unpack_from(mapped, offset)
+        if stored == 0:
+            tokens, updated = burst, now
+
+        if max_in_flight and _in_flight(entries) >= max_in_flight:
+            _reap_dead(entries)
+            if _in_flight(entries) >= max_in_flight:
+                _SLOT.pack_into(mapped, offset, key, tokens, updated, *entries)
+                return Decision(False, 1.0)
+
+        if rate:
+            tokens = min(burst, tokens + max(now - updated, 0.0) * rate)
+            updated = now
+            if tokens < 1:
+                _SLOT.pack_into(mapped, offset, key, tokens, updated, *entries)
+                return Decision(False, (1 - tokens) / rate)
+            tokens -= 1
+
+        tracked = bool(max_in_flight)
+        if tracked and not _adjust_pid(entries, pid, 1):
+            _reap_dead(entries)
+            tracked = _adjust_pid(entries, pid, 1)
+        _SLOT.pack_into(mapped, offset, key, tokens, updated, *entries)
+
+    return Decision(True, slot=slot if tracked else None)
+
+
+def release(slot: int) -> None:
+    """Return the in-flight slot taken by :func:`acquire`."""
+    with _locked() as mapped:
+        offset = slot * _SLOT.size
+        stored, tokens, updated, *entries = _SLOT.unpack_from(mapped, offset)
+        _adjust_pid(entries, os.getpid(), -1)
+        _SLOT.pack_into(mapped, offset, stored, tokens, updated, *entries)
+
+
+def normalize_limits(value: Any) -> Dict[str, Dict[str, float]]:
+    """Validate a manifest ``rate_limits`` block (unknown keys are dropped)."""
+    if not isinstance(value, dict):
+        return {}
+    limits = {}
+    for route_class, fields in value.items():
+        if route_class not in ROUTE_CLASSES or not isinstance(fields, dict):
+            continue
+        limits[route_class] = {
+            name: max(float(fields[name]), 0.0)
+            for name in LIMIT_FIELDS
+            if isinstance(fields.get(name), (int, float)) and not isinstance(fields[name], bool)
+        }
+    return limits
+
+
+def limits_for(route_class: str, overrides: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    return {**DEFAULT_LIMITS.get(route_class, {}), **overrides.get(route_class, {})}
+
+
+def compile_limits(value: Any) -> Mapping[str, Mapping[str, float]]:
+    """Effective limits for every route class from a manifest ``rate_limits`` block."""
+    overrides = normalize_limits(value)
+    return MappingProxyType({
+        route_class: MappingProxyType(limits_for(route_class, overrides))
+        for route_class in ROUTE_CLASSES
+    })
+
+
+DEFAULT_COMPILED_LIMITS = compile_limits(None)
+UNLIMITED: Mapping[str, Mapping[str, float]] = MappingProxyType(
+    {route_class: MappingProxyType({}) for route_class in ROUTE_CLASSES}
+)
+
+
+def route_class_for(endpoint: Optional[str], method: str) -> Optional[str]:
+    """Classify a request; None means it is not limited."""
+    if endpoint is None or endpoint in ("health", "metrics", "static"):
+        return None
+    if endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    if endpoint in RECEIPT_ENDPOINTS and method == "POST":
+        return "receipts"
+    if endpoint.startswith("paypal."):
+        return "payments"
+    if method not in ("GET", "HEAD", "OPTIONS"):
+        return "writes"
+    if endpoint.startswith("client_"):
+        return "static"
+    return "datasets"
+
+
+def _too_many(retry_after: float):
+    seconds = max(int(math.ceil(retry_after)), 1)
+    response = jsonify(
+        {
+            "error": "rate_limited",
+            "message": "Too many requests for this site; retry later",
+            "retry_after": seconds,
+        }
+    )
+    response.status_code = 429
+    response.headers["Retry-After"] = str(seconds)
+    return response
+
+
+def init_app(
+    app, resolve: Callable[[Any], Tuple[str, Mapping[str, Mapping[str, float]]]]
+) -> None:
+    """
+    Install the limiter. ``resolve(request)`` returns the tenant slug and its
+    effective limits per route class (see :func:`compile_limits`).
+    """
+    if not ENABLED:
+        return
+
+    @app.before_request
+    def _rate_limit_before():
+        route_class = route_class_for(request.endpoint, request.method)
+        if route_class is None:
+            return None
+        slug, limits = resolve(request)
+        decision = acquire(slug, route_class, limits[route_class])
+        if not decision.allowed:
+            return _too_many(decision.retry_after)
+        g.rate_limit_slot = decision.slot
+        return None
+
+    @app.teardown_request
+    def _rate_limit_teardown(exc):
+        slot = g.pop("rate_limit_slot", None)
+        if slot is not None:
+            release(slot)
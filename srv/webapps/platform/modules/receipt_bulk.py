@@ -0,0 +1,144 @@
+# /srv/webapps/platform/modules/receipt_bulk.py
+
+"""
+NDJSON and CSV codecs for bulk receipt import and export.
+
+Everything here works on streams one record at a time: readers take the raw
+request stream, writers are generators of encoded chunks for a streamed
+response. Memory stays flat regardless of how many receipts pass through.
+
+CSV uses the flat columns in CSV_FIELDS. Donor details are split into
+``donor_name``/``donor_email``/``donor_address``, and ``provider_metadata``
+is a JSON-encoded cell.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
+
+from modules import json_codec
+
+FORMATS = ("ndjson", "csv")
+MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+CSV_FIELDS = (
+    "receipt_id",
+    "recorded_at",
+    "amount",
+    "currency",
+    "donor_name",
+    "donor_email",
+    "donor_address",
+    "designation",
+    "provider",
+    "provider_metadata",
+    "no_goods_or_services_statement",
+    "ein",
+)
+_DONOR_FIELDS = ("name", "email", "address")
+
+# Rows are flushed to the response in chunks of about this many bytes.
+_CHUNK_BYTES = 64 * 1024
+
+
+def detect_format(requested: Optional[str], mimetype: Optional[str]) -> str:
+    """Pick a bulk format from ``?format=`` or a Content-Type/Accept value."""
+    if requested in FORMATS:
+        return requested
+    if mimetype and "csv" in mimetype:
+        return "csv"
+    return "ndjson"
+
+
+# -------------------------------------------------------------------
+# Reading
+# -------------------------------------------------------------------
+
+
+def _row_to_payload(row: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        key: value for key, value in row.items()
+        if key in CSV_FIELDS and value not in (None, "")
+    }
+    donor = {
+        field: payload.pop(f"donor_{field}")
+        for field in _DONOR_FIELDS
+        if f"donor_{field}" in payload
+    }
+    if donor:
+        payload["donor"] = donor
+    if "provider_metadata" in payload:
+        try:
+            payload["provider_metadata"] = json_codec.loads(payload["provider_metadata"])
+        except ValueError:
+            pass
+    return payload
+
+
+def iter_payloads(stream: BinaryIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield ``(line number, payload)`` for each record in ``stream``. The
+    payload is None when a line cannot be parsed; blank lines are skipped.
+    """
+    reader = stream if isinstance(stream, io.BufferedIOBase) else io.BufferedReader(stream)
+    if fmt == "csv":
+        text = io.TextIOWrapper(reader, encoding="utf-8-sig", newline="")
+        rows = csv.DictReader(text)
+        for row in rows:
+            yield rows.line_num, _row_to_payload(row)
+        return
+
+    for line_number, line in enumerate(reader, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json_codec.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+# -------------------------------------------------------------------
+# Writing
+# -------------------------------------------------------------------
+
+
+def _receipt_to_row(receipt: Dict[str, Any]) -> Dict[str, Any]:
+    donor = receipt.get("donor") if isinstance(receipt.get("donor"), dict) else {}
+    row = {field: receipt.get(field) for field in CSV_FIELDS}
+    for field in _DONOR_FIELDS:
+        row[f"donor_{field}"] = donor.get(field)
+    if row["provider_metadata"] is not None:
+        row["provider_metadata"] = json_codec.dumps(row["provider_metadata"]).decode("utf-8")
+    return row
+
+
+def encode_ndjson(receipts: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    buffer = bytearray()
+    for receipt in receipts:
+        buffer += json_codec.dumps(receipt)
+        buffer += b"\n"
+        if len(buffer) >= _CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def encode_csv(receipts: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for receipt in receipts:
+        writer.writerow(_receipt_to_row(receipt))
+        if text.tell() >= _CHUNK_BYTES:
+            yield text.getvalue().encode("utf-8")
+            text.seek(0)
+            text.truncate()
+    if text.tell():
+        yield text.getvalue().encode("utf-8")
+
+
+def encode(receipts: Iterable[Dict[str, Any]], fmt: str) -> Iterator[bytes]:
+    return encode_csv(receipts) if fmt == "csv" else encode_ndjson(receipts)
@@ -0,0 +1,274 @@
+# /srv/webapps/platform/modules/receipt_partitions.py
+
+"""
+Time-partitioned receipt files with sealed, compressed archives.
+
+Tenants that set ``"receipt_partitions": "month"`` (or ``"year"``) in their
+manifest ``MSS`` block keep receipts for ``data/donation_receipts.json`` in a
+sibling directory instead of one growing file::
+
+    data/donation_receipts/
+        index.json          summary of every partition
+        2025-03.json        open partition (tenant storage format)
+        2025-02.json.gz     sealed partition (gzipped compact JSON)
+
+Receipts are assigned to a partition by the period of their
+``recorded_at``. Appends rewrite only the partition they land in, and
+range reads (``since``/``until``) use the summary to open only the
+partitions that overlap. Open partitions are sealed once their period has
+been over for ``RECEIPT_SEAL_GRACE_DAYS``. Sealed partitions can still take
+a late append; they are rewritten compressed.
+
+An existing single receipts file is split into partitions on the first
+append after a tenant opts in.
+
+All writers hold the receipts file lock (modules/group_commit.py).
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from modules import json_codec, json_index
+
+from data_access import multi_tenant as multi_access
+
+INDEX_FILENAME = "index.json"
+SEAL_GRACE = timedelta(days=float(os.getenv("RECEIPT_SEAL_GRACE_DAYS", "3")))
+
+_KEY_LENGTHS = {"month": 7, "year": 4}
+
+
+def partition_dir(path: Path) -> Path:
+    """Directory holding the partitions for receipts file ``path``."""
+    return path.with_suffix("")
+
+
+def _valid_key(key: str) -> bool:
+    # The period after the key must exist too (see _period_end).
+    if len(key) == 4:
+        return key.isdigit() and key < "9999"
+    return (
+        len(key) == 7
+        and _valid_key(key[:4])
+        and key[4] == "-"
+        and key[5:].isdigit()
+        and 1 <= int(key[5:]) <= 12
+    )
+
+
+def partition_key(receipt: Dict[str, Any], scheme: str, now: datetime) -> str:
+    """``YYYY-MM`` or ``YYYY`` from ``recorded_at`` (``now`` when missing)."""
+    recorded_at = receipt.get("recorded_at")
+    key = recorded_at[: _KEY_LENGTHS[scheme]] if isinstance(recorded_at, str) else ""
+    return key if _valid_key(key) else now.isoformat()[: _KEY_LENGTHS[scheme]]
+
+
+def _period_end(key: str) -> datetime:
+    if len(key) == 4:
+        return datetime(int(key) + 1, 1, 1, tzinfo=timezone.utc)
+    year, month = int(key[:4]), int(key[5:7])
+    if month == 12:
+        return datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    return datetime(year, month + 1, 1, tzinfo=timezone.utc)
+
+
+# -------------------------------------------------------------------
+# Summary index
+# -------------------------------------------------------------------
+
+
+def load_summary(directory: Path) -> Dict[str, Dict[str, Any]]:
+    """Return ``{partition key: summary}`` (empty when not partitioned yet)."""
+    multi_access.refresh_local(directory / INDEX_FILENAME)
+    try:
+        summary = json_codec.loads((directory / INDEX_FILENAME).read_bytes())
+    except FileNotFoundError:
+        return {}
+    return summary.get("partitions", {})
+
+
+def _write_summary(directory: Path, partitions: Dict[str, Dict[str, Any]]) -> None:
+    body = json_codec.dumps({"partitions": dict(sorted(partitions.items()))}, indent=True)
+    multi_access.save_bytes(directory / INDEX_FILENAME, body, durable=True)
+
+
+def _summarize(key: str, filename: str, sealed: bool, receipts: List[Dict[str, Any]]):
+    stamps = [
+        receipt["recorded_at"] for receipt in receipts
+        if isinstance(receipt.get("recorded_at"), str)
+    ]
+    totals: Dict[str, float] = {}
+    for receipt in receipts:
+        amount = receipt.get("amount")
+        if isinstance(amount, (int, float)):
+            currency = str(receipt.get("currency") or "USD")
+            totals[currency] = round(totals.get(currency, 0.0) + amount, 2)
+    return {
+        "file": filename,
+        "sealed": sealed,
+        "count": len(receipts),
+        "first": min(stamps, default=None),
+        "last": max(stamps, default=None),
+        "totals": totals,
+    }
+
+
+# -------------------------------------------------------------------
+# Partition files
+# -------------------------------------------------------------------
+
+
+def _load_partition(directory: Path, entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+    path = directory / entry["file"]
+    if entry.get("sealed"):
+        multi_access.refresh_local(path)
+        return json_codec.loads(gzip.decompress(path.read_bytes()))
+    return multi_access.load_json(path)
+
+
+def _store_partition(
+    directory: Path,
+    key: str,
+    receipts: List[Dict[str, Any]],
+    sealed: bool,
+    storage_format: str,
+) -> Dict[str, Any]:
+    if sealed:
+        filename = f"{key}.json.gz"
+        body = gzip.compress(json_codec.dumps(receipts), mtime=0)
+        multi_access.save_bytes(directory / filename, body, durable=True)
+    else:
+        filename = f"{key}.json"
+        multi_access.save_json(directory / filename, receipts, storage_format, durable=True)
+    return _summarize(key, filename, sealed, receipts)
+
+
+def _is_due(key: str, now: datetime) -> bool:
+    return _period_end(key) + SEAL_GRACE <= now
+
+
+def append(
+    path: Path,
+    receipts: Iterable[Dict[str, Any]],
+    scheme: str,
+    storage_format: str,
+    now: Optional[datetime] = None,
+) -> None:
+    """Append receipts to their partitions and seal partitions that are due."""
+    now = now or datetime.now(timezone.utc)
+    directory = partition_dir(path)
+    partitions = load_summary(directory)
+
+    incoming: Dict[str, List[Dict[str, Any]]] = {}
+    if not partitions and path.exists():
+        # First write after opting in: split the single legacy file.
+        legacy = multi_access.load_json(path)
+        if not isinstance(legacy, list):
+            raise ValueError("Receipts file must contain a JSON array")
+        for receipt in legacy:
+            incoming.setdefault(partition_key(receipt, scheme, now), []).append(receipt)
+    for receipt in receipts:
+        incoming.setdefault(partition_key(receipt, scheme, now), []).append(receipt)
+
+    # Partitions sealed by this call; only their open files need removing.
+    sealed_now = []
+    for key, added in sorted(incoming.items()):
+        entry = partitions.get(key)
+        existing = _load_partition(directory, entry) if entry else []
+        sealed = bool(entry and entry["sealed"]) or _is_due(key, now)
+        if sealed and entry and not entry["sealed"]:
+            sealed_now.append(key)
+        partitions[key] = _store_partition(
+            directory, key, existing + added, sealed, storage_format
+        )
+
+    for key, entry in sorted(partitions.items()):
+        if not entry["sealed"] and _is_due(key, now):
+            receipts_in = _load_partition(directory, entry)
+            partitions[key] = _store_partition(directory, key, receipts_in, True, storage_format)
+            sealed_now.append(key)
+
+    # Superseded files go only after the summary stops pointing at them.
+    _write_summary(directory, partitions)
+    for key in sealed_now:
+        multi_access.remove_file(directory / f"{key}.json")
+        json_index.write_index(directory / f"{key}.json", None)
+    if path.exists():
+        multi_access.remove_file(path)
+        json_index.write_index(path, None)
+
+
+def append_stream(
+    path: Path,
+    receipts: Iterable[Dict[str, Any]],
+    scheme: str,
+    storage_format: str,
+) -> int:
+    """
+    Append a stream of receipts of any size, one partition at a time.
+
+    The stream is first split into a temporary spool file per partition, so
+    memory holds only one partition (its stored and new receipts), never the
+    whole stream. Returns the number of receipts appended.
+
+    Unlike :func:`append`, this is not one atomic write: each partition is
+    committed in turn, so if writing one fails the partitions before it
+    stay committed. Callers skip receipt IDs that are already stored, so
+    retrying the same stream completes it without duplicates.
+    """
+    now = datetime.now(timezone.utc)
+    spools: Dict[str, BinaryIO] = {}
+    count = 0
+    try:
+        for receipt in receipts:
+            key = partition_key(receipt, scheme, now)
+            spool = spools.get(key)
+            if spool is None:
+                spool = spools[key] = tempfile.TemporaryFile()
+            spool.write(json_codec.dumps(receipt) + b"\n")
+            count += 1
+        for key in sorted(spools):
+            spool = spools[key]
+            spool.seek(0)
+            append(path, [json_codec.loads(line) for line in spool], scheme, storage_format, now)
+    finally:
+        for spool in spools.values():
+            spool.close()
+    return count
+
+
+def iter_receipts(
+    path: Path, since: Optional[str] = None, until: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield receipts recorded in ``[since, until)`` (ISO 8601 strings compared
+    as text), oldest partition first. Partitions outside the range are not
+    opened; sealed partitions are decompressed only when needed.
+    """
+    directory = partition_dir(path)
+    partitions = load_summary(directory)
+    if not partitions and path.exists():
+        # Opted in, but nothing has been appended since: still one file.
+        sources = [multi_access.load_json(path)]
+    else:
+        sources = (
+            _load_partition(directory, entry)
+            for _, entry in sorted(partitions.items())
+            if not (since and entry.get("last") and entry["last"] < since)
+            and not (until and entry.get("first") and entry["first"] >= until)
+        )
+
+    for receipts in sources:
+        for receipt in receipts:
+            recorded_at = receipt.get("recorded_at") or ""
+            if since and recorded_at < since:
+                continue
+            if until and recorded_at >= until:
+                continue
+            yield receipt
@@ -0,0 +1,295 @@
+# /srv/webapps/platform/modules/receipt_render.py
+
+"""
+Render donation receipts as HTML or PDF documents for donors.
+
+Each tenant can supply its own Jinja2 layout in
+``<client_root>/templates/receipt.html``. Without one, DEFAULT_TEMPLATE
+is used. Templates see:
+
+- ``receipt``: the stored receipt (amount, donor, recorded_at, ein, ...)
+- ``organization``: the manifest ``MSS.organization`` block (name, ein,
+  address, ...). ``name`` defaults to the client slug.
+
+Caching happens at two levels:
+
+- A compiled template is kept per tenant and recompiled only when the
+  template file's mtime or size changes.
+- Rendered documents are kept in an LRU keyed by a SHA-256 of the template
+  source and the render context (``RECEIPT_RENDER_CACHE`` entries, default
+  256). The same digest is used as the document's ETag.
+
+PDF output needs the optional ``weasyprint`` package. Without it,
+``pdf_available()`` is False and callers should answer 501. WeasyPrint
+takes longer to import than the rest of the app together, so it is only
+imported by the first PDF render.
+
+``render_batch`` renders many receipts on a process pool and writes one
+file per receipt. scripts/render_receipts.py uses it for year-end runs.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from jinja2 import Environment, Template, select_autoescape
+
+from modules import json_codec
+from modules.client_settings import ClientSettings
+
+from data_access import multi_tenant as multi_access
+
+TEMPLATE_DIRNAME = "templates"
+TEMPLATE_NAME = "receipt.html"
+OUTPUT_DIRNAME = "receipt_documents"
+FORMATS = ("html", "pdf")
+MIMETYPES = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+RENDER_CACHE_SIZE = int(os.getenv("RECEIPT_RENDER_CACHE", "256"))
+
+DEFAULT_TEMPLATE = """\
+<!doctype html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Donation receipt {{ receipt.receipt_id }}</title>
+<style>
+  body { font-family: Helvetica, Arial, sans-serif; margin: 2.5em; color: #222; }
+  h1 { font-size: 1.4em; margin-bottom: 0.2em; }
+  table { border-collapse: collapse; margin: 1.5em 0; }
+  th { text-align: left; padding: 0.3em 1.5em 0.3em 0; font-weight: normal; color: #555; }
+  td { padding: 0.3em 0; }
+  .statement { margin-top: 2em; font-size: 0.9em; }
+</style>
+</head>
+<body>
+<h1>{{ organization.name }}</h1>
+{% if organization.address %}<div>{{ organization.address }}</div>{% endif %}
+{% set ein = receipt.ein or organization.ein %}
+{% if ein %}<div>EIN {{ ein }}</div>{% endif %}
+
+<h2>Donation receipt</h2>
+<table>
+  <tr><th>Receipt</th><td>{{ receipt.receipt_id }}</td></tr>
+  <tr><th>Date</th><td>{{ (receipt.recorded_at or "")[:10] }}</td></tr>
+  <tr><th>Donor</th><td>{{ receipt.donor.name if receipt.donor else "" }}</td></tr>
+  {% if receipt.donor and receipt.donor.address %}
+  <tr><th>Address</th><td>{{ receipt.donor.address }}</td></tr>
+  {% endif %}
+  <tr><th>Amount</th><td>{{ "%.2f"|format(receipt.amount or 0) }} {{ receipt.currency or "USD" }}</td></tr>
+  {% if receipt.designation %}
+  <tr><th>Designation</th><td>{{ receipt.designation }}</td></tr>
+  {% endif %}
+</table>
+
+<p class="statement">
+{{ receipt.no_goods_or_services_statement
+   or "No goods or services were provided in exchange for this contribution." }}
+</p>
+</body>
+</html>
+"""
+
+
+_environment = Environment(autoescape=select_autoescape(default_for_string=True))
+
+# client_root -> (validator, compiled template, source digest)
+_templates: Dict[Path, Tuple[Tuple[int, ...], Template, bytes]] = {}
+_rendered: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+_rendered_lock = threading.Lock()
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class Rendered(NamedTuple):
+    """A rendered receipt document."""
+
+    digest: str
+    body: bytes
+    mimetype: str
+
+
+_PDF_AVAILABLE = importlib.util.find_spec("weasyprint") is not None
+
+
+def pdf_available() -> bool:
+    return _PDF_AVAILABLE
+
+
+def _write_pdf(html: str, base_url: str) -> bytes:
+    import weasyprint  # Optional and slow to import: load on first use.
+
+    return weasyprint.HTML(string=html, base_url=base_url).write_pdf()
+
+
+def template_path(paths: Dict[str, Path]) -> Path:
+    return paths["client_root"] / TEMPLATE_DIRNAME / TEMPLATE_NAME
+
+
+def output_dir(paths: Dict[str, Path]) -> Path:
+    """Tenant directory that batch runs write documents into."""
+    return paths["client_root"] / OUTPUT_DIRNAME
+
+
+def _template_validator(path: Path) -> Tuple[int, ...]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return ()
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def compiled_template(paths: Dict[str, Path]) -> Tuple[Template, bytes]:
+    """Return the tenant's compiled template and a digest of its source."""
+    global _templates
+    path = template_path(paths)
+    validator = _template_validator(path)
+    cached = _templates.get(paths["client_root"])
+    if cached is not None and cached[0] == validator:
+        return cached[1], cached[2]
+
+    source = path.read_text(encoding="utf-8") if validator else DEFAULT_TEMPLATE
+    template = _environment.from_string(source)
+    digest = hashlib.sha256(source.encode("utf-8")).digest()
+    _templates = {**_templates, paths["client_root"]: (validator, template, digest)}
+    return template, digest
+
+
+def organization_for(manifest: Optional[ClientSettings], client_slug: str) -> Dict[str, Any]:
+    organization = dict(manifest.organization) if manifest is not None else {}
+    organization.setdefault("name", client_slug)
+    return organization
+
+
+def _remember(key: Tuple[str, str], body: bytes) -> None:
+    with _rendered_lock:
+        _rendered[key] = body
+        _rendered.move_to_end(key)
+        while len(_rendered) > RENDER_CACHE_SIZE:
+            _rendered.popitem(last=False)
+
+
+def render(
+    paths: Dict[str, Path],
+    receipt: Dict[str, Any],
+    organization: Dict[str, Any],
+    fmt: str = "html",
+    cache: bool = True,
+) -> Rendered:
+    """
+    Render one receipt. Raises RuntimeError for ``pdf`` when WeasyPrint is
+    not installed.
+    """
+    if fmt == "pdf" and not _PDF_AVAILABLE:
+        raise RuntimeError("PDF rendering requires the weasyprint package")
+
+    template, template_digest = compiled_template(paths)
+    context = {"receipt": receipt, "organization": organization}
+    digest = hashlib.sha256(
+        template_digest + json_codec.dumps(context, sort_keys=True)
+    ).hexdigest()
+
+    key = (digest, fmt)
+    if cache:
+        with _rendered_lock:
+            body = _rendered.get(key)
+            if body is not None:
+                _rendered.move_to_end(key)
+                return Rendered(digest, body, MIMETYPES[fmt])
+
+    body = template.render(context).encode("utf-8")
+    if fmt == "pdf":
+        base_url = str(template_path(paths).parent)
+        body = _write_pdf(body.decode("utf-8"), base_url)
+    if cache:
+        _remember(key, body)
+    return Rendered(digest, body, MIMETYPES[fmt])
+
+
+def document_name(receipt: Dict[str, Any], fmt: str) -> str:
+    """Filesystem-safe file name for a receipt document."""
+    receipt_id = _UNSAFE_NAME.sub("_", str(receipt.get("receipt_id") or "receipt"))
+    return f"{receipt_id}.{fmt}"
+
+
+# -------------------------------------------------------------------
+# Batch rendering
+# -------------------------------------------------------------------
+
+_batch: Dict[str, Any] = {}
+
+
+def _init_batch_worker(paths, organization, fmt, destination) -> None:
+    _batch.update(paths=paths, organization=organization, fmt=fmt, destination=destination)
+    compiled_template(paths)
+
+
+def _render_chunk(receipts: List[Dict[str, Any]]) -> int:
+    for receipt in receipts:
+        document = render(
+            _batch["paths"], receipt, _batch["organization"], _batch["fmt"], cache=False
+        )
+        destination = _batch["destination"] / document_name(receipt, _batch["fmt"])
+        multi_access.save_local_bytes(destination, document.body)
+    return len(receipts)
+
+
+def render_batch(
+    paths: Dict[str, Path],
+    receipts: Iterable[Dict[str, Any]],
+    organization: Dict[str, Any],
+    destination: Path,
+    fmt: str = "html",
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+) -> int:
+    """
+    Render ``receipts`` into ``destination`` (one file per receipt) on a
+    pool of ``workers`` processes and return how many were written.
+
+    Receipts are handed out in chunks of ``chunk_size`` with at most two
+    chunks per worker in flight, so a large year streams through without
+    being loaded at once.
+    """
+    if fmt == "pdf" and not _PDF_AVAILABLE:
+        raise RuntimeError("PDF rendering requires the weasyprint package")
+    # Only batch runs need a process pool; the web app never imports it.
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    destination.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    written = 0
+    pending = set()
+    chunk: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_batch_worker,
+        initargs=(paths, organization, fmt, destination),
+    ) as pool:
+
+        def submit(batch: List[Dict[str, Any]]) -> None:
+            nonlocal written
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    written += future.result()
+            pending.add(pool.submit(_render_chunk, batch))
+
+        for receipt in receipts:
+            chunk.append(receipt)
+            if len(chunk) >= chunk_size:
+                submit(chunk)
+                chunk = []
+        if chunk:
+            submit(chunk)
+        for future in pending:
+            written += future.result()
+    return written
@@ -0,0 +1,56 @@
+# /srv/webapps/platform/modules/shm_state.py
+
+"""
+Small memory-mapped state files shared by the workers of one node.
+
+Admission control (modules/admission.py) and the rate limiter
+(modules/rate_limit.py) each keep fixed-size slot tables in a file under
+/dev/shm (the temp dir where there is none), named by an environment
+variable. The Gunicorn master removes the files on start so every run
+begins empty, and slots owned by a worker that died are recognised by its
+pid.
+
+Usage::
+
+    from modules import shm_state
+    STATE_PATH = shm_state.state_path("ADMISSION_STATE", "platform-admission")
+    fd, mapped = shm_state.open_state(STATE_PATH, _SLOT.size * _SLOTS)
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+
+def state_path(env_name: str, filename: str) -> Path:
+    """``$<env_name>``, or ``filename`` under /dev/shm (or the temp dir)."""
+    default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return Path(os.getenv(env_name, str(Path(default_dir) / filename)))
+
+
+def reset(path: Path) -> None:
+    """Remove the state file so the next open starts from zeroes."""
+    path.unlink(missing_ok=True)
+
+
+def open_state(path: Path, size: int) -> Tuple[int, mmap.mmap]:
+    """Open (creating and zero-filling up to ``size``) and map the file."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+    return fd, mmap.mmap(fd, size)
+
+
+def pid_alive(pid: int) -> bool:
+    """Whether a process with ``pid`` still exists (on this node)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
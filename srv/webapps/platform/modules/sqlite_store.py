@@ -0,0 +1,291 @@
+# /srv/webapps/platform/modules/sqlite_store.py
+
+"""
+SQLite storage engine for tenant backend data and donation receipts.
+
+Tenants opt in with ``"storage_engine": "sqlite"`` in their manifest ``MSS``
+block. Each tenant then gets one database at ``data/tenant.sqlite3``:
+
+- ``documents`` holds backend data files as versioned JSON documents keyed by
+  filename. A write inserts a new version instead of rewriting a file; the
+  latest ``SQLITE_DOCUMENT_HISTORY`` versions are kept.
+- ``receipts`` holds one row per receipt, indexed by source file and
+  ``recorded_at`` so appends never rewrite history. A ``receipt_id`` is
+  unique within its source file.
+
+The database runs in WAL mode, which allows concurrent readers alongside a
+single writer and survives crashes without partial files. With
+``synchronous=FULL`` (``SQLITE_SYNCHRONOUS``) every commit is on disk before
+it returns, matching the fsync that file writes get. Connections are
+opened once per thread and reused (the per-worker pool); after a fork the
+child discards the parent's connections.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from modules import json_codec
+
+STORE_FILENAME = "tenant.sqlite3"
+DOCUMENT_HISTORY = int(os.getenv("SQLITE_DOCUMENT_HISTORY", "10"))
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# FULL syncs the WAL on every commit, so an acknowledged write survives power
+# loss. NORMAL is faster but may lose the last commits.
+SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "FULL").upper()
+if SYNCHRONOUS not in ("FULL", "EXTRA", "NORMAL"):
+    raise ValueError("SQLITE_SYNCHRONOUS must be FULL, EXTRA or NORMAL")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    saved_at TEXT NOT NULL,
+    PRIMARY KEY (name, version)
+);
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    receipt_id TEXT,
+    recorded_at TEXT,
+    amount REAL,
+    currency TEXT,
+    provider TEXT,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS receipts_source_recorded
+    ON receipts (source, recorded_at);
+DROP INDEX IF EXISTS receipts_receipt_id;
+CREATE UNIQUE INDEX IF NOT EXISTS receipts_source_receipt_id
+    ON receipts (source, receipt_id) WHERE receipt_id IS NOT NULL;
+"""
+
+_local = threading.local()
+
+
+def _reset_pool() -> None:
+    global _local
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_pool)
+
+
+def store_path(paths: Dict[str, Path]) -> Path:
+    """Return the SQLite database path for a client."""
+    return paths["data_dir"] / STORE_FILENAME
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    pool = getattr(_local, "connections", None)
+    if pool is None:
+        pool = _local.connections = {}
+
+    key = str(db_path)
+    connection = pool.get(key)
+    if connection is not None:
+        return connection
+
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(key, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    connection.executescript(_SCHEMA)
+    pool[key] = connection
+    return connection
+
+
+class _write_transaction:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT`` so concurrent writers queue up."""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# -------------------------------------------------------------------
+# Documents
+# -------------------------------------------------------------------
+
+
+def document_exists(db_path: Path, name: str) -> bool:
+    if not db_path.exists():
+        return False
+    row = _connect(db_path).execute(
+        "SELECT 1 FROM documents WHERE name = ? LIMIT 1", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def load_document(db_path: Path, name: str) -> Any:
+    """Return the latest version of a document or raise FileNotFoundError."""
+    row = None
+    if db_path.exists():
+        row = _connect(db_path).execute(
+            "SELECT body FROM documents WHERE name = ? ORDER BY version DESC LIMIT 1",
+            (name,),
+        ).fetchone()
+    if row is None:
+        raise FileNotFoundError(f"No stored document named {name}")
+    return json_codec.loads(row[0])
+
+
+def load_document_bytes(db_path: Path, name: str) -> Tuple[int, bytes]:
+    """Return ``(version, json_bytes)`` for the latest version of a document."""
+    row = None
+    if db_path.exists():
+        row = _connect(db_path).execute(
+            "SELECT version, body FROM documents WHERE name = ? "
+            "ORDER BY version DESC LIMIT 1",
+            (name,),
+        ).fetchone()
+    if row is None:
+        raise FileNotFoundError(f"No stored document named {name}")
+    return row[0], bytes(row[1])
+
+
+def document_version(db_path: Path, name: str) -> Optional[int]:
+    """Return the latest version number of a document, or None."""
+    if not db_path.exists():
+        return None
+    (version,) = _connect(db_path).execute(
+        "SELECT MAX(version) FROM documents WHERE name = ?", (name,)
+    ).fetchone()
+    return version
+
+
+def save_document(db_path: Path, name: str, payload: Any) -> int:
+    """Store a new version of a document and return its version number."""
+    body = json_codec.dumps(payload)
+    with _write_transaction(_connect(db_path)) as connection:
+        (current,) = connection.execute(
+            "SELECT COALESCE(MAX(version), 0) FROM documents WHERE name = ?", (name,)
+        ).fetchone()
+        version = current + 1
+        connection.execute(
+            "INSERT INTO documents (name, version, body, saved_at) VALUES (?, ?, ?, ?)",
+            (name, version, body, _now()),
+        )
+        connection.execute(
+            "DELETE FROM documents WHERE name = ? AND version <= ?",
+            (name, version - max(DOCUMENT_HISTORY, 1)),
+        )
+    return version
+
+
+def list_documents(db_path: Path) -> List[str]:
+    if not db_path.exists():
+        return []
+    rows = _connect(db_path).execute("SELECT DISTINCT name FROM documents ORDER BY name")
+    return [name for (name,) in rows]
+
+
+# -------------------------------------------------------------------
+# Receipts
+# -------------------------------------------------------------------
+
+
+def iter_receipts(
+    db_path: Path,
+    source: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield receipts stored for ``source`` in insertion order, optionally only
+    those with ``since <= recorded_at < until`` (uses the recorded_at index).
+    Rows are fetched lazily from the cursor.
+    """
+    if not db_path.exists():
+        return
+    query = "SELECT body FROM receipts WHERE source = ?"
+    params: List[Any] = [source]
+    if since:
+        query += " AND recorded_at >= ?"
+        params.append(since)
+    if until:
+        query += " AND recorded_at < ?"
+        params.append(until)
+    for (body,) in _connect(db_path).execute(query + " ORDER BY id", params):
+        yield json_codec.loads(body)
+
+
+def load_receipts(
+    db_path: Path,
+    source: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Return :func:`iter_receipts` as a list."""
+    return list(iter_receipts(db_path, source, since, until))
+
+
+def find_receipt(db_path: Path, source: str, receipt_id: str) -> Optional[Dict[str, Any]]:
+    """Return one receipt by ``receipt_id`` (uses the unique index), or None."""
+    if not db_path.exists():
+        return None
+    row = _connect(db_path).execute(
+        "SELECT body FROM receipts WHERE receipt_id = ? AND source = ?",
+        (receipt_id, source),
+    ).fetchone()
+    return json_codec.loads(row[0]) if row else None
+
+
+def append_receipts(
+    db_path: Path,
+    source: str,
+    receipts: Iterable[Dict[str, Any]],
+    skip_duplicates: bool = False,
+) -> int:
+    """
+    Insert receipts in one transaction and return how many were written.
+
+    ``receipts`` is consumed lazily, so large imports stream through. With
+    ``skip_duplicates`` receipts whose ``receipt_id`` is already stored in
+    ``source`` are ignored instead of failing the transaction.
+    """
+    rows = (
+        (
+            source,
+            receipt.get("receipt_id"),
+            receipt.get("recorded_at"),
+            receipt.get("amount"),
+            receipt.get("currency"),
+            receipt.get("provider"),
+            json_codec.dumps(receipt),
+        )
+        for receipt in receipts
+    )
+    verb = "INSERT OR IGNORE" if skip_duplicates else "INSERT"
+    with _write_transaction(_connect(db_path)) as connection:
+        cursor = connection.executemany(
+            f"{verb} INTO receipts "
+            "(source, receipt_id, recorded_at, amount, currency, provider, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+    return cursor.rowcount
+
+
+def list_receipt_sources(db_path: Path) -> List[str]:
+    if not db_path.exists():
+        return []
+    rows = _connect(db_path).execute("SELECT DISTINCT source FROM receipts ORDER BY source")
+    return [source for (source,) in rows]
@@ -0,0 +1,445 @@
+# /srv/webapps/platform/modules/storage_backend.py
+
+"""
+Where tenant files live: the local CLIENTS_ROOT, or a shared object store
+mirrored into it.
+
+With ``STORAGE_BACKEND=none`` (the default), CLIENTS_ROOT itself holds the
+data and nothing here runs. With ``local`` or ``s3``, the source of truth is
+shared between instances:
+
+- ``local``: a directory every node mounts (``STORAGE_LOCAL_ROOT``, e.g. EFS
+  or NFS). This is also the local stand-in for exercising the mirror without
+  S3.
+- ``s3``: an S3-compatible bucket (``STORAGE_S3_BUCKET``, ``STORAGE_S3_PREFIX``,
+  ``STORAGE_S3_ENDPOINT_URL`` for MinIO or another stand-in). Needs the
+  optional ``boto3`` package.
+
+Each node's CLIENTS_ROOT then becomes a read-through disk cache of the
+backend (Mirror). Objects are keyed by their path under CLIENTS_ROOT, so
+everything that reads files (frontend, indexes, the watcher) keeps working
+on local disk:
+
+- ``sync`` lists the backend and downloads changed objects. Warmup runs it,
+  and a background thread repeats it every ``STORAGE_SYNC_SECONDS``. Only one
+  process per node syncs at a time.
+- ``refresh`` revalidates one file with a conditional GET (``If-None-Match``
+  with the ETag recorded beside it). It runs at most once per
+  ``STORAGE_REVALIDATE_SECONDS`` per file and process.
+- ``write`` writes the local file, then uploads it with ``If-Match`` on the
+  ETag this node last saw, or ``If-None-Match: *`` for new files. If another
+  node wrote first, the backend answers 412. The local copy is then reset to
+  the backend's version and StorageConflict is raised, so a stale node can
+  never overwrite a newer version.
+
+ETags are kept in ``.<name>.etag`` files next to the cached copies. The
+sidecars double as per-file locks shared by a node's workers. Paths matching
+NODE_LOCAL_PATTERNS stay node-local: they are never uploaded, listed or
+synced. These are names starting with "." (locks, indexes, temp files),
+SQLite stores with their WAL and shared-memory files, and rendered receipt
+documents.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import logging
+from fnmatch import fnmatch
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from modules import group_commit
+
+try:  # Optional: S3-compatible object store
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - optional dependency
+    boto3 = None
+    ClientError = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("none", "local", "s3")
+BACKEND = os.getenv("STORAGE_BACKEND", "none").lower()
+REVALIDATE_SECONDS = float(os.getenv("STORAGE_REVALIDATE_SECONDS", "1"))
+SYNC_SECONDS = float(os.getenv("STORAGE_SYNC_SECONDS", "5"))
+
+# Path components that mark a file as belonging to this node only. Copying
+# them between nodes would clobber live state: a SQLite database replaced
+# under its open WAL is corrupted. Keep in step with sqlite_store.STORE_FILENAME
+# and receipt_render.OUTPUT_DIRNAME.
+NODE_LOCAL_PATTERNS = (
+    ".*",
+    "tenant.sqlite3",
+    "tenant.sqlite3-*",
+    "receipt_documents",
+)
+
+
+def is_node_local(key: str) -> bool:
+    """Whether a key (a "/"-separated path under CLIENTS_ROOT) stays on its node."""
+    return any(
+        fnmatch(part, pattern) for part in key.split("/") for pattern in NODE_LOCAL_PATTERNS
+    )
+
+
+class StorageConflict(Exception):
+    """A conditional write lost to a newer version written elsewhere."""
+
+
+class ObjectInfo(NamedTuple):
+    key: str
+    etag: str
+
+
+# -------------------------------------------------------------------
+# Backends
+# -------------------------------------------------------------------
+# get(key, etag) -> (data, etag). data is None when ``etag`` still matches;
+#   raises FileNotFoundError when the object does not exist.
+# put(key, data, if_match) -> new etag. ``if_match`` is the expected current
+#   etag, or None to require that the object does not exist yet. Raises
+#   StorageConflict when the precondition fails.
+# delete(key) removes an object (missing objects are ignored).
+# list(prefix) -> ObjectInfo for every object under ``prefix``.
+
+
+class LocalBackend:
+    """Objects as files under a shared directory; ETags from ``stat``."""
+
+    name = "local"
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    @staticmethod
+    def _etag(stat: os.stat_result) -> str:
+        return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+    def _current(self, path: Path) -> Optional[str]:
+        try:
+            return self._etag(path.stat())
+        except FileNotFoundError:
+            return None
+
+    def get(self, key: str, etag: Optional[str] = None) -> Tuple[Optional[bytes], str]:
+        with self._path(key).open("rb") as handle:
+            current = self._etag(os.fstat(handle.fileno()))
+            if current == etag:
+                return None, current
+            return handle.read(), current
+
+    def put(self, key: str, data: bytes, if_match: Optional[str]) -> str:
+        path = self._path(key)
+        with group_commit.file_lock(path):
+            if self._current(path) != if_match:
+                raise StorageConflict(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            return self._etag(path.stat())
+
+    def delete(self, key: str) -> None:
+        path = self._path(key)
+        with group_commit.file_lock(path):
+            path.unlink(missing_ok=True)
+
+    def list(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        base = self.root / prefix if prefix else self.root
+        for root, dirnames, filenames in os.walk(base):
+            dirnames[:] = [name for name in dirnames if not is_node_local(name)]
+            for name in filenames:
+                path = Path(root) / name
+                key = path.relative_to(self.root).as_posix()
+                if is_node_local(key):
+                    continue
+                try:
+                    etag = self._etag(path.stat())
+                except FileNotFoundError:
+                    continue
+                yield ObjectInfo(key, etag)
+
+
+class S3Backend:
+    """Objects in an S3-compatible bucket, using S3 conditional requests."""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None) -> None:
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires the boto3 package")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    @staticmethod
+    def _status(exc: Exception) -> int:
+        return int(exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0))
+
+    def get(self, key: str, etag: Optional[str] = None) -> Tuple[Optional[bytes], str]:
+        options = {"IfNoneMatch": etag} if etag else {}
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.prefix + key, **options
+            )
+        except ClientError as exc:
+            status = self._status(exc)
+            if status == 304:
+                return None, etag
+            if status == 404:
+                raise FileNotFoundError(key) from exc
+            raise
+        return response["Body"].read(), response["ETag"]
+
+    def put(self, key: str, data: bytes, if_match: Optional[str]) -> str:
+        condition = {"IfMatch": if_match} if if_match else {"IfNoneMatch": "*"}
+        try:
+            response = self.client.put_object(
+                Bucket=self.bucket, Key=self.prefix + key, Body=data, **condition
+            )
+        except ClientError as exc:
+            # 409 ConditionalRequestConflict: a concurrent conditional write.
+            if self._status(exc) in (409, 412):
+                raise StorageConflict(key) from exc
+            raise
+        return response["ETag"]
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def list(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        start = len(self.prefix)
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get("Contents", ()):
+                key = item["Key"][start:]
+                if not is_node_local(key):
+                    yield ObjectInfo(key, item["ETag"])
+
+
+def from_env():
+    """The backend selected by STORAGE_BACKEND, or None for ``none``."""
+    if BACKEND not in BACKENDS:
+        raise RuntimeError(f"STORAGE_BACKEND must be one of {', '.join(BACKENDS)}")
+    if BACKEND == "local":
+        root = os.getenv("STORAGE_LOCAL_ROOT")
+        if not root:
+            raise RuntimeError("STORAGE_BACKEND=local requires STORAGE_LOCAL_ROOT")
+        return LocalBackend(Path(root))
+    if BACKEND == "s3":
+        bucket = os.getenv("STORAGE_S3_BUCKET")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires STORAGE_S3_BUCKET")
+        return S3Backend(
+            bucket,
+            os.getenv("STORAGE_S3_PREFIX", "clients/"),
+            os.getenv("STORAGE_S3_ENDPOINT_URL"),
+        )
+    return None
+
+
+# -------------------------------------------------------------------
+# Read-through mirror
+# -------------------------------------------------------------------
+
+
+class _EtagRecord:
+    """The locked ``.<name>.etag`` sidecar of a cached file."""
+
+    def __init__(self, fd: int) -> None:
+        self.fd = fd
+
+    def read(self) -> Optional[str]:
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        return os.read(self.fd, 1024).decode("utf-8").strip() or None
+
+    def write(self, etag: Optional[str]) -> None:
+        os.ftruncate(self.fd, 0)
+        os.pwrite(self.fd, (etag or "").encode("utf-8"), 0)
+
+
+def etag_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.etag")
+
+
+def _replace_file(path: Path, data: bytes) -> None:
+    """Atomically replace a cached copy (temp file + rename)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class Mirror:
+    """A node-local, read-through copy of a backend under ``root``."""
+
+    def __init__(self, backend, root: Path) -> None:
+        self.backend = backend
+        self.root = root
+        self._checked: Dict[Path, float] = {}
+        self._sync_thread_pid: Optional[int] = None
+
+    def key_for(self, path: Path) -> Optional[str]:
+        """Backend key for a path under the mirror root (None: node-local)."""
+        try:
+            parts = path.relative_to(self.root).parts
+        except ValueError:
+            return None
+        key = "/".join(parts)
+        if not parts or is_node_local(key):
+            return None
+        return key
+
+    @contextmanager
+    def _locked(self, path: Path) -> Iterator[_EtagRecord]:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(etag_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield _EtagRecord(fd)
+        finally:
+            os.close(fd)
+
+    def _fetch(self, path: Path, key: str, record: _EtagRecord) -> None:
+        """Bring the local copy up to date with the backend (lock held)."""
+        etag = record.read() if path.exists() else None
+        try:
+            data, current = self.backend.get(key, etag)
+        except FileNotFoundError:
+            if etag is not None:
+                # Deleted in the backend: drop the cached copy.
+                path.unlink(missing_ok=True)
+                record.write(None)
+            return
+        if data is not None:
+            _replace_file(path, data)
+            record.write(current)
+
+    def refresh(self, path: Path, force: bool = False) -> None:
+        """Revalidate a cached file (at most once per REVALIDATE_SECONDS)."""
+        key = self.key_for(path)
+        if key is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked.get(path, float("-inf")) < REVALIDATE_SECONDS:
+            return
+        with self._locked(path) as record:
+            self._fetch(path, key, record)
+        self._checked[path] = now
+
+    def write(
+        self,
+        path: Path,
+        write_local: Callable[[], None],
+        retries: int = 0,
+        refresh_first: bool = False,
+    ) -> None:
+        """
+        Run ``write_local`` (which replaces ``path``) and upload the result
+        conditionally. With ``refresh_first`` the local copy is brought up to
+        date before each attempt, and a conflict is retried up to ``retries``
+        times. That suits appends, which ``write_local`` re-applies to the newest
+        version. Otherwise the first conflict raises StorageConflict.
+        """
+        key = self.key_for(path)
+        if key is None:
+            write_local()
+            return
+        for attempt in range(retries + 1):
+            with self._locked(path) as record:
+                if refresh_first:
+                    self._fetch(path, key, record)
+                etag = record.read() if path.exists() else None
+                write_local()
+                try:
+                    record.write(self.backend.put(key, path.read_bytes(), etag))
+                    self._checked[path] = time.monotonic()
+                    return
+                except StorageConflict:
+                    # Put the winning version back so local readers see it.
+                    record.write(etag)
+                    self._fetch(path, key, record)
+                    self._checked[path] = time.monotonic()
+                    if attempt == retries:
+                        raise
+                    logger.info("Storage conflict on %s, retrying", key)
+
+    def delete(self, path: Path) -> None:
+        """Remove a file here and in the backend."""
+        key = self.key_for(path)
+        if key is None:
+            path.unlink(missing_ok=True)
+            return
+        with self._locked(path) as record:
+            self.backend.delete(key)
+            path.unlink(missing_ok=True)
+            record.write(None)
+
+    def sync(self, prefix: str = "") -> int:
+        """Download every object under ``prefix`` whose ETag changed; return the count."""
+        base = self.root / prefix if prefix else self.root
+        fetched = 0
+        seen = set()
+        for info in self.backend.list(prefix):
+            path = self.root / info.key
+            seen.add(path)
+            try:
+                known = etag_path(path).read_text(encoding="utf-8").strip()
+            except OSError:
+                known = ""
+            if known == info.etag and path.exists():
+                continue
+            with self._locked(path) as record:
+                self._fetch(path, info.key, record)
+            fetched += 1
+
+        # Cached copies whose object is gone (untracked local files stay).
+        for record in base.rglob(".*.etag") if base.exists() else ():
+            path = record.with_name(record.name[1:-len(".etag")])
+            key = self.key_for(path)
+            if path not in seen and key and record.read_text(encoding="utf-8").strip():
+                with self._locked(path) as locked:
+                    self._fetch(path, key, locked)
+        return fetched
+
+    def start_sync(self, interval: float = SYNC_SECONDS) -> None:
+        """Keep the mirror current from a background thread in this process."""
+        if interval <= 0 or self._sync_thread_pid == os.getpid():
+            return
+        self._sync_thread_pid = os.getpid()
+        threading.Thread(
+            target=self._sync_forever, args=(interval,), name="storage-sync", daemon=True
+        ).start()
+
+    def _sync_forever(self, interval: float) -> None:
+        lock_path = self.root / ".storage-sync.lock"
+        while True:
+            time.sleep(interval)
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    # One process per node does the listing; the rest skip.
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    continue
+                try:
+                    self.sync()
+                finally:
+                    os.close(fd)
+            except Exception:
+                logger.warning("Storage sync with %s failed", self.backend.name, exc_info=True)
+
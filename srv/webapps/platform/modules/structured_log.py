@@ -0,0 +1,317 @@
+# /srv/webapps/platform/modules/structured_log.py
+
+"""
+Structured (JSON lines) logging that never blocks a request thread.
+
+Loggers keep working as usual (``logger.info("Synced %d files", n)``), but
+the root logger's only handler is a ``QueueHandler``. It attaches the
+request context to the record and puts it on a bounded queue. A listener
+thread in each worker then formats the record and writes it to stderr,
+which systemd sends to the journal. So formatting and journal writes happen
+off the request path:
+
+- The message is formatted by the listener (``msg % args``). Arguments that
+  are not plain scalars (str, bytes, numbers, bool, None) are formatted up
+  front instead, because the caller may change them after the call returns.
+- Tracebacks are rendered up front so the record does not keep frames alive.
+- When the queue is full (``LOG_QUEUE_SIZE`` records, default 10000), new
+  records are dropped and counted instead of waiting. ``stats()`` reports
+  the count.
+
+Records logged while a request is running carry ``request_id`` (the
+``X-Request-ID`` header nginx sets, otherwise a new one, and echoed on the
+response), ``tenant`` (the client slug) and ``elapsed_ms`` since the request
+started. ``extra={...}`` fields are added as top-level keys::
+
+    {"ts": "2025-01-01T12:00:00.123+00:00", "level": "INFO",
+     "logger": "modules.paypal_gateway", "msg": "PayPal order captured: 5O1 (COMPLETED)",
+     "request_id": "9f0c...", "tenant": "cuyahogaterravita.com", "elapsed_ms": 412.5}
+
+``init_app`` also writes one access record per request to the
+``platform.access`` logger (method, path, status, bytes, duration_ms).
+``ACCESS_LOG_SAMPLE`` (0-1, default 1) keeps that fraction of them. 5xx
+responses other than 503 and requests slower than ``ACCESS_LOG_SLOW_MS``
+(default 1000) are always kept.
+
+``LOG_LEVEL`` sets the root level (default INFO). Set STRUCTURED_LOGS=off
+to leave logging configuration to Gunicorn/Flask.
+
+Registration example in app.py::
+
+    from modules import structured_log
+    structured_log.init_app(app, get_client_slug)
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from flask import request
+
+from modules import json_codec
+
+ENABLED = os.getenv("STRUCTURED_LOGS", "on") != "off"
+LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+ACCESS_SAMPLE = float(os.getenv("ACCESS_LOG_SAMPLE", "1"))
+ACCESS_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "1000"))
+REQUEST_ID_HEADER = "X-Request-ID"
+
+access_logger = logging.getLogger("platform.access")
+
+# Arguments that can be formatted later without changing the message.
+_SCALARS = (str, bytes, int, float, bool, type(None))
+# LogRecord attributes that are not ``extra`` fields.
+_RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None))
+) | {"message", "asctime"}
+
+
+class _RequestContext:
+    __slots__ = ("request_id", "tenant", "started")
+
+    def __init__(self, request_id: str, tenant: Optional[str], started: float) -> None:
+        self.request_id = request_id
+        self.tenant = tenant
+        self.started = started
+
+
+_context: ContextVar[Optional[_RequestContext]] = ContextVar("structured_log", default=None)
+
+_stats = {"dropped": 0, "sampled_out": 0}
+
+
+def current_request_id() -> Optional[str]:
+    """The running request's correlation ID, for passing on to other services."""
+    context = _context.get()
+    return context.request_id if context is not None else None
+
+
+# -------------------------------------------------------------------
+# Formatting (listener thread)
+# -------------------------------------------------------------------
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value if isinstance(value, _SCALARS + (list, dict)) else str(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        try:
+            return json_codec.dumps(entry).decode("utf-8")
+        except TypeError:
+            # An extra field holding something JSON cannot encode.
+            return json_codec.dumps({key: str(value) for key, value in entry.items()}).decode("utf-8")
+
+
+# -------------------------------------------------------------------
+# Queue (request threads)
+# -------------------------------------------------------------------
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records with their request context and without formatting them."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A lone dict argument becomes ``args`` itself, and it is mutable.
+        if record.args and (
+            isinstance(record.args, dict)
+            or not all(isinstance(arg, _SCALARS) for arg in record.args)
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        context = _context.get()
+        if context is not None:
+            record.request_id = context.request_id
+            record.tenant = context.tenant
+            record.elapsed_ms = round((time.perf_counter() - context.started) * 1000, 2)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if _listener_pid != os.getpid():
+            _start_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room, so records queued before exit are still written.
+        self.queue.put(self._sentinel, timeout=5)
+
+
+_formatter = JsonFormatter()
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(QUEUE_SIZE)
+_handler = _QueueHandler(_queue)
+_listener: Optional[_Listener] = None
+_listener_pid: Optional[int] = None
+_listener_lock = threading.Lock()
+_stream = sys.stderr
+
+
+def _output_handler() -> logging.Handler:
+    handler = logging.StreamHandler(_stream)
+    handler.setFormatter(_formatter)
+    return handler
+
+
+def _start_listener() -> None:
+    global _listener, _listener_pid
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener = _Listener(_queue, _output_handler())
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def _stop_listener() -> None:
+    """Write out what is queued (at exit)."""
+    global _listener_pid
+    with _listener_lock:
+        if _listener is None or _listener_pid != os.getpid():
+            return
+        try:
+            _listener.stop()
+        except queue.Full:
+            pass
+        _listener_pid = None
+
+
+def _reset_after_fork() -> None:
+    # The listener thread does not survive fork; the first record logged in
+    # the child starts a new one on a fresh queue.
+    global _queue, _listener, _listener_pid, _listener_lock
+    _queue = queue.Queue(QUEUE_SIZE)
+    _handler.queue = _queue
+    _listener = None
+    _listener_pid = None
+    _listener_lock = threading.Lock()
+    _stats.update(dropped=0, sampled_out=0)
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_stop_listener)
+
+
+def install(level: str = LEVEL, stream=None) -> None:
+    """
+    Make the queue handler the root logger's only handler (idempotent).
+    ``stream`` replaces stderr as the listener's output.
+    """
+    global _stream
+    if stream is not None:
+        _stream = stream
+    root = logging.getLogger()
+    if _handler not in root.handlers:
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(_handler)
+    root.setLevel(level)
+
+
+def stats() -> Dict[str, int]:
+    """Records waiting, dropped because the queue was full, and sampled out."""
+    return {"queued": _queue.qsize(), **_stats}
+
+
+# -------------------------------------------------------------------
+# Flask integration
+# -------------------------------------------------------------------
+
+
+def _new_request_id() -> str:
+    return os.urandom(8).hex()
+
+
+def init_app(app, tenant: Callable[[Any], Optional[str]]) -> None:
+    """
+    Install the pipeline and per-request context. ``tenant(request)`` returns
+    the client slug to tag records with. Register before other
+    ``before_request`` hooks (such as the rate limiter) so their responses
+    are logged with the request's context too.
+    """
+    if not ENABLED:
+        return
+    install()
+    from flask.logging import default_handler
+
+    app.logger.removeHandler(default_handler)
+
+    @app.before_request
+    def _structured_log_before():
+        request_id = request.headers.get(REQUEST_ID_HEADER) or _new_request_id()
+        try:
+            slug = tenant(request)
+        except Exception:
+            slug = None
+        _context.set(_RequestContext(request_id[:64], slug, time.perf_counter()))
+
+    @app.after_request
+    def _structured_log_after(response):
+        context = _context.get()
+        if context is None:
+            return response
+        response.headers.setdefault(REQUEST_ID_HEADER, context.request_id)
+        duration_ms = (time.perf_counter() - context.started) * 1000
+        # Errors are always kept, but not 503s: under overload those are
+        # shed requests (modules/admission.py), counted in /api/metrics.
+        if (
+            (response.status_code >= 500 and response.status_code != 503)
+            or duration_ms >= ACCESS_SLOW_MS
+            or ACCESS_SAMPLE >= 1
+            or random.random() < ACCESS_SAMPLE
+        ):
+            if access_logger.isEnabledFor(logging.INFO):
+                access_logger.info(
+                    "%s %s %d",
+                    request.method,
+                    request.path,
+                    response.status_code,
+                    extra={
+                        "method": request.method,
+                        "path": request.path,
+                        "status": response.status_code,
+                        "bytes": response.content_length,
+                        "duration_ms": round(duration_ms, 2),
+                    },
+                )
+        else:
+            _stats["sampled_out"] += 1
+        return response
+
+    @app.teardown_request
+    def _structured_log_teardown(exc):
+        _context.set(None)
@@ -0,0 +1,322 @@
+# /srv/webapps/platform/modules/tenant_watcher.py
+
+"""
+Filesystem watcher over CLIENTS_ROOT that publishes tenant change events.
+
+Each Gunicorn worker starts its own watcher thread after fork (see
+gunicorn.conf.py), so every worker sees every change without any
+cross-process messaging. Linux inotify is used when available (through
+ctypes, no extra dependency); otherwise the tree is polled.
+
+Events are debounced and grouped, then handed to every subscriber as a list
+of :class:`ChangeEvent`. Subscribers rebuild whatever they cache and swap it
+in; request threads never wait on the watcher.
+
+Usage::
+
+    from modules import tenant_watcher
+
+    tenant_watcher.subscribe(lambda events: ...)
+    tenant_watcher.start(CLIENTS_ROOT)
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+WATCH_MODE = os.getenv("TENANT_WATCHER", "auto")  # auto | inotify | poll | off
+POLL_INTERVAL = float(os.getenv("TENANT_WATCHER_POLL_SECONDS", "2"))
+DEBOUNCE_SECONDS = float(os.getenv("TENANT_WATCHER_DEBOUNCE_SECONDS", "0.2"))
+
+
+class ChangeEvent(NamedTuple):
+    """
+    One changed area of a tenant.
+
+    ``kind`` is ``"client"`` (directory added/removed), ``"manifest"``,
+    ``"frontend"`` or ``"data"``; ``name`` is the data filename for
+    ``"data"`` events.
+    """
+
+    kind: str
+    slug: str
+    name: Optional[str] = None
+
+
+Subscriber = Callable[[List[ChangeEvent]], None]
+
+_subscribers: Tuple[Subscriber, ...] = ()
+_watcher: Optional["_BaseWatcher"] = None
+
+
+def subscribe(callback: Subscriber) -> None:
+    """Register a callback for batches of change events."""
+    global _subscribers
+    _subscribers = _subscribers + (callback,)
+
+
+def publish(events: List[ChangeEvent]) -> None:
+    """Deliver events to every subscriber (also used for in-process writes)."""
+    for callback in _subscribers:
+        try:
+            callback(events)
+        except Exception:
+            logger.error("Tenant change subscriber failed", exc_info=True)
+
+
+def classify(clients_root: Path, path: Path) -> Optional[ChangeEvent]:
+    """Map a changed path under ``clients_root`` to a ChangeEvent."""
+    try:
+        parts = path.relative_to(clients_root).parts
+    except ValueError:
+        return None
+    if not parts or parts[0].startswith("."):
+        return None
+
+    slug = parts[0]
+    if len(parts) == 1:
+        return ChangeEvent("client", slug)
+    if len(parts) == 2 and parts[1].startswith("msn_") and parts[1].endswith(".json"):
+        return ChangeEvent("manifest", slug)
+    if parts[1] == "data":
+        if len(parts) == 3 and not parts[2].startswith("."):
+            return ChangeEvent("data", slug, parts[2])
+        return None
+    if parts[1] == "frontend":
+        return ChangeEvent("frontend", slug)
+    return None
+
+
+def _descend(clients_root: Path, directory: Path) -> bool:
+    """
+    Whether changes below ``directory`` can matter to :func:`classify`:
+    tenant roots, the top of ``data/`` and all of ``frontend/``. Version
+    history, rendered receipts and partition directories are never walked.
+    """
+    parts = directory.relative_to(clients_root).parts
+    if any(part.startswith(".") for part in parts):
+        return False
+    return len(parts) <= 1 or parts[1] == "frontend" or parts[1:] == ("data",)
+
+
+def is_running() -> bool:
+    return _watcher is not None and _watcher.is_alive()
+
+
+def start(clients_root: Path, mode: str = WATCH_MODE) -> Optional[str]:
+    """Start the watcher thread for this process; return the backend used."""
+    global _watcher
+    if mode == "off":
+        return None
+    if is_running():
+        return _watcher.backend
+
+    watcher: Optional[_BaseWatcher] = None
+    if mode in ("auto", "inotify"):
+        try:
+            watcher = _InotifyWatcher(clients_root)
+        except OSError:
+            if mode == "inotify":
+                raise
+            logger.info("inotify unavailable, polling %s", clients_root)
+    if watcher is None:
+        watcher = _PollingWatcher(clients_root)
+
+    watcher.start()
+    _watcher = watcher
+    return watcher.backend
+
+
+def stop() -> None:
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
+
+
+def _after_fork() -> None:
+    # Threads do not survive fork; the child starts its own watcher.
+    global _watcher
+    _watcher = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class _BaseWatcher(threading.Thread):
+    backend = "base"
+
+    def __init__(self, clients_root: Path):
+        super().__init__(name=f"tenant-watcher-{self.backend}", daemon=True)
+        self.clients_root = clients_root
+        self._stopping = threading.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _emit(self, paths: Set[Path]) -> None:
+        events = {classify(self.clients_root, path) for path in paths}
+        events.discard(None)
+        if events:
+            publish(sorted(events))
+
+
+class _PollingWatcher(_BaseWatcher):
+    """Compares a stat signature of every file under CLIENTS_ROOT."""
+
+    backend = "poll"
+
+    def _snapshot(self) -> Dict[Path, Tuple[int, int, int]]:
+        snapshot = {}
+        for root, dirnames, filenames in os.walk(self.clients_root):
+            dirnames[:] = [
+                name for name in dirnames if _descend(self.clients_root, Path(root, name))
+            ]
+            for name in filenames:
+                path = Path(root, name)
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        for entry in self.clients_root.iterdir() if self.clients_root.exists() else ():
+            if entry.is_dir():
+                snapshot[entry] = (0, 0, 0)
+        return snapshot
+
+    def run(self) -> None:
+        previous = self._snapshot()
+        while not self._stopping.wait(POLL_INTERVAL):
+            try:
+                current = self._snapshot()
+            except OSError:
+                logger.warning("Polling %s failed", self.clients_root, exc_info=True)
+                continue
+            changed = {
+                path
+                for path in previous.keys() | current.keys()
+                if previous.get(path) != current.get(path)
+            }
+            previous = current
+            if changed:
+                self._emit(changed)
+
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_EVENT_HEADER = struct.Struct("iIII")
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+)
+
+
+class _InotifyWatcher(_BaseWatcher):
+    """One inotify watch per directory under CLIENTS_ROOT."""
+
+    backend = "inotify"
+
+    def __init__(self, clients_root: Path):
+        super().__init__(clients_root)
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not supported on this platform")
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs: Dict[int, Path] = {}
+        self._add_tree(clients_root)
+
+    def _add_watch(self, directory: Path) -> None:
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), _WATCH_MASK
+        )
+        if wd >= 0:
+            self._dirs[wd] = directory
+
+    def _add_tree(self, top: Path) -> None:
+        self._add_watch(top)
+        for root, dirnames, _ in os.walk(top):
+            dirnames[:] = [
+                name for name in dirnames if _descend(self.clients_root, Path(root, name))
+            ]
+            for name in dirnames:
+                self._add_watch(Path(root, name))
+
+    def _read_events(self) -> Set[Path]:
+        changed: Set[Path] = set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                # Events were dropped: treat every client as changed.
+                changed.update(
+                    entry for entry in self.clients_root.iterdir() if entry.is_dir()
+                )
+                continue
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            path = directory / os.fsdecode(name) if name else directory
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                if _descend(self.clients_root, path):
+                    self._add_tree(path)
+            changed.add(path)
+        return changed
+
+    def run(self) -> None:
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        try:
+            while not self._stopping.is_set():
+                if not poller.poll(500):
+                    continue
+                changed = self._read_events()
+                # Let bursts (rsync, editors) settle into one batch.
+                deadline = time.monotonic() + DEBOUNCE_SECONDS
+                while time.monotonic() < deadline:
+                    if poller.poll(max(int((deadline - time.monotonic()) * 1000), 0)):
+                        changed |= self._read_events()
+                if changed:
+                    self._emit(changed)
+        finally:
+            os.close(self._fd)
@@ -0,0 +1,249 @@
+# /srv/webapps/platform/modules/version_history.py
+
+"""
+Content-addressed version history for backend data files.
+
+Every write to a backend data file records the bytes it left on disk as a
+new version. Version contents live in a per-client object store, keyed by
+their SHA-256 and zlib-compressed::
+
+    versions/
+        events.json.log.json      version log (compact JSON array)
+        objects/3f/a1c2...        one blob per distinct content or chunk
+        objects/9b/04de....chunks chunk list of a large version
+
+Identical contents are stored once, whichever file or version they belong
+to. Files of at least ``DATASET_VERSION_CHUNK_BYTES`` are split into chunks
+at content-defined boundaries. A later version that changes one item then
+stores only the chunks around it, and the rest are shared.
+
+A version log entry is ``{"version", "saved_at", "sha256", "size",
+"chunks"}``. Writers call :func:`record` while holding the file's lock
+(modules/group_commit.py), so versions are numbered in commit order.
+Objects and logs are written through the data-access layer like any tenant
+file, so a shared storage backend replicates them too.
+"""
+
+from __future__ import annotations
+
+import difflib
+import hashlib
+import mmap
+import os
+import re
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from modules import json_codec
+from modules.json_index import _escape
+from modules.storage_backend import StorageConflict
+
+from data_access import multi_tenant as _multi
+
+ENABLED = os.getenv("DATASET_VERSIONS", "on") != "off"
+CHUNK_BYTES = int(os.getenv("DATASET_VERSION_CHUNK_BYTES", str(1024 * 1024)))
+VERSIONS_DIRNAME = "versions"
+
+# Content-defined chunking: cut after the end of an array item or object
+# member (``},`` / ``],``) once the 64 bytes before it hash to zero under
+# _CUT_MASK, within these bounds. Cuts move with the content, so an insert
+# near the start of a file does not shift every later chunk.
+_MIN_CHUNK = 16 * 1024
+_MAX_CHUNK = 256 * 1024
+_CUT_MASK = 0x3F
+_CUT_WINDOW = 64
+_DELIMITER = re.compile(rb"[}\]],")
+
+
+# -------------------------------------------------------------------
+# Object store
+# -------------------------------------------------------------------
+
+
+def history_dir(paths: Dict[str, Path]) -> Path:
+    return paths["client_root"] / VERSIONS_DIRNAME
+
+
+def log_path(paths: Dict[str, Path], name: str) -> Path:
+    return history_dir(paths) / f"{name}.log.json"
+
+
+def _object_path(paths: Dict[str, Path], digest: str, suffix: str = "") -> Path:
+    return history_dir(paths) / "objects" / digest[:2] / f"{digest[2:]}{suffix}"
+
+
+def _put_object(path: Path, data: bytes) -> int:
+    """Store ``data`` compressed unless it is already there; return bytes written."""
+    if path.exists():
+        return 0
+    blob = zlib.compress(data, 1)
+    try:
+        _multi.save_bytes(path, blob)
+    except StorageConflict:
+        # Another node stored the same content first.
+        return 0
+    return len(blob)
+
+
+def _get_object(path: Path) -> bytes:
+    _multi.refresh_local(path)
+    return zlib.decompress(path.read_bytes())
+
+
+def split_chunks(data: bytes) -> List[bytes]:
+    """Split ``data`` at content-defined boundaries between JSON items."""
+    chunks = []
+    start = 0
+    size = len(data)
+    while size - start > _MAX_CHUNK:
+        cut = start + _MAX_CHUNK
+        for match in _DELIMITER.finditer(data, start + _MIN_CHUNK, start + _MAX_CHUNK):
+            end = match.end()
+            if not zlib.crc32(data[end - _CUT_WINDOW:end]) & _CUT_MASK:
+                cut = end
+                break
+        chunks.append(data[start:cut])
+        start = cut
+    chunks.append(data[start:])
+    return chunks
+
+
+# -------------------------------------------------------------------
+# Versions
+# -------------------------------------------------------------------
+
+
+def load_log(paths: Dict[str, Path], name: str) -> List[Dict[str, Any]]:
+    """Return the version log of ``name`` (oldest first; empty if none)."""
+    path = log_path(paths, name)
+    _multi.refresh_local(path)
+    if not path.exists():
+        return []
+    return _multi.decode_payload(path.read_bytes())
+
+
+def record(paths: Dict[str, Path], name: str, data: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Record ``data`` as the newest version of ``name`` and return its log
+    entry. Writing the same bytes as the newest version records nothing and
+    returns None. Call with the file's lock held.
+    """
+    if not ENABLED:
+        return None
+    digest = hashlib.sha256(data).hexdigest()
+    log = load_log(paths, name)
+    if log and log[-1]["sha256"] == digest:
+        return None
+
+    chunks = 0
+    if len(data) >= CHUNK_BYTES:
+        manifest = _object_path(paths, digest, ".chunks")
+        if not manifest.exists():
+            digests = []
+            for chunk in split_chunks(data):
+                chunk_digest = hashlib.sha256(chunk).hexdigest()
+                _put_object(_object_path(paths, chunk_digest), chunk)
+                digests.append(chunk_digest)
+            _put_object(manifest, json_codec.dumps(digests))
+            chunks = len(digests)
+        else:
+            chunks = len(json_codec.loads(_get_object(manifest)))
+    else:
+        _put_object(_object_path(paths, digest), data)
+
+    entry = {
+        "version": log[-1]["version"] + 1 if log else 1,
+        "saved_at": datetime.now(timezone.utc).isoformat(),
+        "sha256": digest,
+        "size": len(data),
+        "chunks": chunks,
+    }
+    _multi.append_json_array(log_path(paths, name), [entry], "compact")
+    return entry
+
+
+def record_file(paths: Dict[str, Path], name: str, path: Path) -> Optional[Dict[str, Any]]:
+    """Record the current content of ``path`` (memory-mapped, not read into memory)."""
+    if not ENABLED:
+        return None
+    with path.open("rb") as handle:
+        if not os.fstat(handle.fileno()).st_size:
+            return record(paths, name, b"")
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return record(paths, name, data)
+
+
+def find_version(paths: Dict[str, Path], name: str, version: int) -> Dict[str, Any]:
+    """Return the log entry of ``version``; raise KeyError when unknown."""
+    for entry in load_log(paths, name):
+        if entry["version"] == version:
+            return entry
+    raise KeyError(version)
+
+
+def read_version(paths: Dict[str, Path], entry: Dict[str, Any]) -> bytes:
+    """Return the stored bytes of a version log entry."""
+    digest = entry["sha256"]
+    if entry["chunks"]:
+        digests = json_codec.loads(_get_object(_object_path(paths, digest, ".chunks")))
+        data = b"".join(_get_object(_object_path(paths, chunk)) for chunk in digests)
+    else:
+        data = _get_object(_object_path(paths, digest))
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Version {entry['version']} of its file is corrupt")
+    return data
+
+
+# -------------------------------------------------------------------
+# Diffs
+# -------------------------------------------------------------------
+
+
+def diff(old: Any, new: Any, pointer: str = "") -> List[Dict[str, Any]]:
+    """
+    Return a JSON Patch (RFC 6902) turning ``old`` into ``new``. Objects are
+    compared by key. Arrays are aligned on unchanged items first, so one
+    inserted item is one ``add`` rather than a change to every later item.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch: List[Dict[str, Any]] = []
+        for key, value in old.items():
+            child = f"{pointer}/{_escape(str(key))}"
+            if key not in new:
+                patch.append({"op": "remove", "path": child})
+            else:
+                patch.extend(diff(value, new[key], child))
+        for key, value in new.items():
+            if key not in old:
+                child = f"{pointer}/{_escape(str(key))}"
+                patch.append({"op": "add", "path": child, "value": value})
+        return patch
+    if isinstance(old, list) and isinstance(new, list):
+        return _diff_array(old, new, pointer)
+    if old == new and type(old) is type(new):
+        return []
+    return [{"op": "replace", "path": pointer, "value": new}]
+
+
+def _diff_array(old: List[Any], new: List[Any], pointer: str) -> List[Dict[str, Any]]:
+    matcher = difflib.SequenceMatcher(
+        None, [json_codec.dumps(item) for item in old], [json_codec.dumps(item) for item in new]
+    )
+    patch: List[Dict[str, Any]] = []
+    # Changed runs are patched back to front, so each run's positions in
+    # ``old`` are still valid when it is applied.
+    for tag, old_start, old_end, new_start, new_end in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            continue
+        paired = min(old_end - old_start, new_end - new_start)
+        for position in range(old_end - 1, old_start + paired - 1, -1):
+            patch.append({"op": "remove", "path": f"{pointer}/{position}"})
+        for offset in range(paired):
+            child = f"{pointer}/{old_start + offset}"
+            patch.extend(diff(old[old_start + offset], new[new_start + offset], child))
+        for offset in range(paired, new_end - new_start):
+            child = f"{pointer}/{old_start + offset}"
+            patch.append({"op": "add", "path": child, "value": new[new_start + offset]})
+    return patch
@@ -0,0 +1,169 @@
+# /srv/webapps/platform/scripts/bench_admission.py
+
+"""
+Overload a fixed worker pool with and without admission control.
+
+Simulates ``--workers`` sync workers behind nginx. Requests arrive at
+``--rate`` per second (Poisson) for ``--seconds`` and wait in a shared queue
+until a worker is free, the way they wait in Gunicorn's backlog. Each is
+stamped with ``X-Request-Start`` at arrival. Workers run the request
+through the app against a scratch tenant and then spend ``--service-ms``
+more, for the database or upstream time real handlers have. Shed requests
+skip that. The mix (``--mix low,normal,critical``) is the dataset listing,
+a dataset read and a receipt write.
+
+Reports, per priority and mode: requests, share shed, and the latency of
+the admitted ones from arrival to response (p50 / p99).
+
+Usage::
+
+    python scripts/bench_admission.py
+    python scripts/bench_admission.py --rate 250 --service-ms 20 --seconds 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+SLUG = "bench.example"
+REQUESTS = {
+    "low": ("GET", "/api/datasets", None),
+    "normal": ("GET", "/api/datasets/catalog", None),
+    "critical": ("POST", "/api/donation-receipts", {"amount": 10, "donor": {"name": "Bench"}}),
+}
+
+
+def _percentile(values: list, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _make_tenant(root: Path) -> None:
+    client = root / SLUG
+    (client / "frontend").mkdir(parents=True)
+    (client / "frontend" / "index.html").write_text("<h1>bench</h1>")
+    (client / "data").mkdir()
+    items = [{"id": index, "name": f"item {index}", "price": index % 50} for index in range(200)]
+    (client / "data" / "catalog.json").write_text(json.dumps({"items": items}))
+    (client / "msn_1.json").write_text(
+        json.dumps({"MSS": {"backend_data": ["catalog.json", "donation_receipts.json"]}})
+    )
+
+
+def run(mode: str, args, root: Path) -> dict:
+    os.environ.update(
+        CLIENTS_ROOT=str(root),
+        ADMISSION="on" if mode == "admission" else "off",
+        ADMISSION_STATE=str(root / ".admission"),
+        ADMISSION_CAPACITY=str(args.workers),
+        RATE_LIMITS="off",
+        LOG_LEVEL="WARNING",
+        PLATFORM_BLUEPRINTS="receipts",
+    )
+    import app as platform_app
+
+    platform_app.warm_tenant_caches()
+    client = platform_app.app.test_client()
+    weights = [float(part) for part in args.mix.split(",")]
+    arrivals: "queue.Queue" = queue.Queue()
+    results: list = []
+    lock = threading.Lock()
+
+    def worker() -> None:
+        while True:
+            item = arrivals.get()
+            if item is None:
+                return
+            arrived, priority = item
+            method, path, body = REQUESTS[priority]
+            headers = {"Host": SLUG, "X-Request-Start": f"t={arrived:.3f}"}
+            response = client.open(path, method=method, headers=headers, json=body)
+            if response.status_code != 503:
+                time.sleep(args.service_ms / 1000)
+            with lock:
+                results.append((priority, response.status_code, time.time() - arrived))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    end = time.time() + args.seconds
+    rng = random.Random(1)
+    next_arrival = time.time()
+    while next_arrival < end:
+        delay = next_arrival - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        arrivals.put((next_arrival, rng.choices(list(REQUESTS), weights)[0]))
+        next_arrival += rng.expovariate(args.rate)
+    for _ in threads:
+        arrivals.put(None)
+    for thread in threads:
+        thread.join()
+
+    summary = {}
+    for priority in REQUESTS:
+        mine = [result for result in results if result[0] == priority]
+        served = [latency * 1000 for _, status, latency in mine if status != 503]
+        summary[priority] = {
+            "requests": len(mine),
+            "shed": sum(1 for _, status, _ in mine if status == 503) / max(len(mine), 1),
+            "p50_ms": _percentile(served, 0.50),
+            "p99_ms": _percentile(served, 0.99),
+        }
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=200, help="arrivals per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--service-ms", type=float, default=15)
+    parser.add_argument("--mix", default="0.5,0.4,0.1", help="low,normal,critical weights")
+    parser.add_argument("--mode", choices=("off", "admission"), action="append")
+    args = parser.parse_args(argv)
+
+    print(
+        f"{args.workers} workers, {args.rate:g} req/s for {args.seconds:g}s, "
+        f"+{args.service_ms:g} ms per admitted request, mix {args.mix}"
+    )
+    print(f"{'mode':<11}{'priority':<10}{'requests':>9}{'shed':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode in args.mode or ["off", "admission"]:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Each mode imports the app fresh, with its own settings and tenant.
+            os.close(read_fd)
+            with tempfile.TemporaryDirectory() as tmp:
+                _make_tenant(Path(tmp))
+                summary = run(mode, args, Path(tmp))
+            os.write(write_fd, json.dumps(summary).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as reader:
+            summary = json.loads(reader.read())
+        os.waitpid(pid, 0)
+        for priority, row in summary.items():
+            print(
+                f"{mode:<11}{priority:<10}{row['requests']:>9}{row['shed']:>8.0%}"
+                f"{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# /srv/webapps/platform/scripts/bench_edge_cache.py
+
+"""
+Measure how much API read traffic the nginx micro-cache keeps off Gunicorn.
+
+Sends ``--requests`` GETs spread over ``--paths`` through nginx with
+``--concurrency`` threads. Every ``--write-every`` reads it PUTs a new value
+to ``--write-file`` and checks that reads of ``--write-path`` see it once the
+refresh has landed. Reports throughput, latency, the ``X-Cache-Status``
+breakdown and the origin offload (the share of reads answered from the
+cache), plus how long reads stayed stale after each write.
+
+Run it against a site, or against the local refresh listener with an
+explicit Host::
+
+    python scripts/bench_edge_cache.py --base-url https://cuyahogaterravita.com
+    python scripts/bench_edge_cache.py --base-url http://127.0.0.1:8080 \\
+        --host cuyahogaterravita.com --paths /api/datasets /api/datasets/csa_recipes
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CACHED = ("HIT", "STALE", "UPDATING", "REVALIDATED")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", required=True)
+    parser.add_argument("--host", help="Host header (default: from --base-url)")
+    parser.add_argument("--paths", nargs="+", default=["/api/datasets"])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-every", type=int, default=0)
+    parser.add_argument("--write-file", help="backend_data file to PUT, e.g. strings.json")
+    parser.add_argument("--write-path", help="cached read that serves --write-file")
+    args = parser.parse_args(argv)
+    if args.write_every and not (args.write_file and args.write_path):
+        parser.error("--write-every needs --write-file and --write-path")
+
+    headers = {"Host": args.host} if args.host else {}
+    local = threading.local()
+    statuses: Counter = Counter()
+    latencies: list[float] = []
+    lock = threading.Lock()
+    writes: list[tuple[int, float]] = []  # (version, written at)
+    stale_for: list[float] = []
+
+    def session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def write(version: int) -> None:
+        response = session().put(
+            f"{args.base_url}/api/backend-data/{args.write_file}",
+            json={"bench_version": version},
+            headers=headers,
+            timeout=10,
+        )
+        response.raise_for_status()
+        with lock:
+            writes.append((version, time.perf_counter()))
+
+    def read(index: int) -> None:
+        if args.write_every and index % args.write_every == 0:
+            write(index)
+        path = args.paths[index % len(args.paths)]
+        started = time.perf_counter()
+        response = session().get(f"{args.base_url}{path}", headers=headers, timeout=10)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.headers.get("X-Cache-Status", "-")] += 1
+        if args.write_every:
+            check = session().get(f"{args.base_url}{args.write_path}", headers=headers, timeout=10)
+            seen = (check.json() or {}).get("bench_version") if check.ok else None
+            with lock:
+                if writes and seen != writes[-1][0]:
+                    stale_for.append(time.perf_counter() - writes[-1][1])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(read, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    cached = sum(statuses[status] for status in CACHED)
+    print(f"{args.requests} reads over {len(args.paths)} paths, {args.concurrency} threads")
+    print(f"{args.requests / elapsed:.0f} req/s, p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+    print("X-Cache-Status: " + ", ".join(f"{k} {v}" for k, v in statuses.most_common()))
+    print(f"origin offload: {cached / args.requests:.1%} of reads served by nginx")
+    if args.write_every:
+        worst = f", longest {max(stale_for) * 1000:.0f} ms after a write" if stale_for else ""
+        print(f"{len(writes)} writes, {len(stale_for)} stale reads{worst}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
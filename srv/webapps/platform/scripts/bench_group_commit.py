@@ -0,0 +1,131 @@
+# /srv/webapps/platform/scripts/bench_group_commit.py
+
+"""
+Compare receipt append throughput: per-request rewrite vs group commit.
+
+Each mode starts from a receipts file holding ``--existing`` receipts and has
+``--threads`` concurrent writers append ``--per-thread`` receipts each (the
+load a threaded worker sees during a donation spike). Modes:
+
+- ``rewrite``: the previous behaviour, one unlocked read-modify-write per
+  receipt without fsync (concurrent writers can lose receipts).
+- ``rewrite+fsync``: one locked, fsynced rewrite per receipt.
+- ``group``: modules/group_commit.py, one locked, fsynced rewrite per batch.
+
+Usage::
+
+    python scripts/bench_group_commit.py
+    python scripts/bench_group_commit.py --threads 32 --existing 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+from modules import group_commit  # noqa: E402
+from modules.donation_receipts import (  # noqa: E402
+    ReceiptsTarget,
+    _append_receipts,
+    _load_receipts,
+)
+from data_access import multi_tenant as multi_access  # noqa: E402
+
+
+def _receipt(index: int) -> dict:
+    return {
+        "receipt_id": f"bench-{index}",
+        "amount": 25.0,
+        "currency": "USD",
+        "donor": {"name": f"Donor {index}", "email": f"donor{index}@example.com"},
+        "provider": "paypal",
+        "recorded_at": "2025-01-01T00:00:00+00:00",
+    }
+
+
+def _rewrite(target: ReceiptsTarget, receipts: list) -> None:
+    existing = _load_receipts(target)
+    existing.extend(receipts)
+    multi_access.save_json(target.path, existing, target.storage_format)
+
+
+def _rewrite_fsync(target: ReceiptsTarget, receipts: list) -> None:
+    with group_commit.file_lock(target.path):
+        existing = _load_receipts(target)
+        existing.extend(receipts)
+        multi_access.save_json(target.path, existing, target.storage_format, durable=True)
+
+
+MODES = {
+    "rewrite": _rewrite,
+    "rewrite+fsync": _rewrite_fsync,
+    "group": _append_receipts,
+}
+
+
+def run_mode(append, target: ReceiptsTarget, args) -> tuple:
+    multi_access.save_json(
+        target.path, [_receipt(-index - 1) for index in range(args.existing)],
+        target.storage_format,
+    )
+
+    def writer(offset: int) -> None:
+        for index in range(args.per_thread):
+            append(target, [_receipt(offset + index)])
+
+    threads = [
+        threading.Thread(target=writer, args=(number * args.per_thread,))
+        for number in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stored = len(_load_receipts(target)) - args.existing
+    return elapsed, stored
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--per-thread", type=int, default=25)
+    parser.add_argument("--existing", type=int, default=1000)
+    parser.add_argument("--format", default="compact", choices=multi_access.STORAGE_FORMATS)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args(argv)
+
+    expected = args.threads * args.per_thread
+    print(
+        f"{args.threads} writers x {args.per_thread} receipts onto {args.existing} "
+        f"existing ({args.format}, flush {group_commit.FLUSH_SECONDS * 1000:g} ms, "
+        f"max {group_commit.MAX_RECORDS})"
+    )
+    print(f"{'mode':<16}{'seconds':>9}{'receipts/s':>12}{'stored':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            target = ReceiptsTarget(
+                Path(tmp) / f"{mode}.json",
+                {"data_dir": Path(tmp)},
+                args.format,
+                "files",
+                "none",
+                declared=True,
+            )
+            elapsed, stored = run_mode(MODES[mode], target, args)
+            lost = f" ({expected - stored} lost)" if stored != expected else ""
+            print(f"{mode:<16}{elapsed:>9.2f}{expected / elapsed:>12.0f}{stored:>10}{lost}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
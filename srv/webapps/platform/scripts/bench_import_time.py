@@ -0,0 +1,129 @@
+# /srv/webapps/platform/scripts/bench_import_time.py
+
+"""
+Measure how long ``import app`` takes and check it against budgets.
+
+Runs ``python -X importtime -c "import app"`` in a fresh interpreter
+``--runs`` times (after one warm-up run that fills the bytecode cache) and
+takes the median of each module's timings. Prints the slowest modules by
+cumulative time, then checks:
+
+- ``--budget NAME=MS``: the cumulative import time of module NAME, or of
+  ``own`` (the self time of app.py, modules/ and data_access/ added up,
+  which leaves out Flask and the other dependencies).
+- ``--forbid NAME``: a module that must not be imported at all, such as
+  the dependency of a blueprint that PLATFORM_BLUEPRINTS leaves out.
+
+Exits 1 when a budget is exceeded or a forbidden module was imported, so
+CI can run it as a check. The child inherits the environment, so set
+PLATFORM_BLUEPRINTS (and the rest) the way the deployment does.
+
+Usage::
+
+    python scripts/bench_import_time.py
+    python scripts/bench_import_time.py --runs 9 --budget app=200 --budget own=40
+    PLATFORM_BLUEPRINTS=receipts python scripts/bench_import_time.py \\
+        --forbid modules.paypal_gateway
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+
+DEFAULT_BUDGETS = {"app": 400.0, "own": 80.0}
+# Only needed by PDF receipts and batch rendering.
+DEFAULT_FORBIDDEN = ("weasyprint", "concurrent.futures.process")
+PLATFORM_PACKAGES = ("modules", "data_access")
+
+
+def _is_own(name: str) -> bool:
+    return name == "app" or name.split(".", 1)[0] in PLATFORM_PACKAGES
+
+
+def measure(target: str) -> dict[str, tuple[int, int]]:
+    """Import ``target`` in a new interpreter; return {module: (self us, cumulative us)}."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=MODULE_DIR,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if completed.returncode:
+        raise RuntimeError(f"import {target} failed:\n{completed.stderr}")
+    timings = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        timings[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return timings
+
+
+def _budget(value: str) -> tuple[str, float]:
+    name, _, limit = value.partition("=")
+    try:
+        return name.strip(), float(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected NAME=MS, got {value!r}") from None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", default="app", help="module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--budget", type=_budget, action="append", default=[])
+    parser.add_argument("--forbid", action="append", default=[])
+    args = parser.parse_args(argv)
+
+    measure(args.target)  # warm-up: compile and cache bytecode
+    runs = [measure(args.target) for _ in range(max(args.runs, 1))]
+
+    # Median per module over the runs that imported it.
+    modules = {name for run in runs for name in run}
+    self_ms = {}
+    cumulative_ms = {}
+    for name in modules:
+        samples = [run[name] for run in runs if name in run]
+        self_ms[name] = statistics.median(sample[0] for sample in samples) / 1000
+        cumulative_ms[name] = statistics.median(sample[1] for sample in samples) / 1000
+    cumulative_ms["own"] = sum(ms for name, ms in self_ms.items() if _is_own(name))
+
+    print(f"import {args.target}: median of {len(runs)} runs")
+    print(f"{'module':<44}{'self ms':>10}{'cumul ms':>10}")
+    slowest = sorted(modules, key=lambda name: cumulative_ms[name], reverse=True)
+    for name in slowest[:args.top]:
+        print(f"{name:<44}{self_ms[name]:>10.1f}{cumulative_ms[name]:>10.1f}")
+    print(f"{'own (app, modules, data_access self time)':<44}{'':>10}{cumulative_ms['own']:>10.1f}")
+
+    budgets = dict(DEFAULT_BUDGETS)
+    budgets.update(args.budget)
+    failed = False
+    for name, limit in budgets.items():
+        if name not in cumulative_ms:
+            print(f"budget {name}: not imported")
+            continue
+        over = cumulative_ms[name] > limit
+        failed |= over
+        print(
+            f"budget {name}: {cumulative_ms[name]:.1f} ms of {limit:g} ms"
+            f"{'  OVER BUDGET' if over else ''}"
+        )
+    for name in [*DEFAULT_FORBIDDEN, *args.forbid]:
+        if name in modules:
+            failed = True
+            print(f"forbidden: {name} was imported")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
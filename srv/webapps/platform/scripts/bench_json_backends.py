@@ -0,0 +1,94 @@
+# /srv/webapps/platform/scripts/bench_json_backends.py
+
+"""
+Measure JSON encode/decode throughput for the stdlib and orjson backends.
+
+Usage::
+
+    python scripts/bench_json_backends.py                  # synthetic payloads
+    python scripts/bench_json_backends.py path/to/data.json --repeat 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+from modules import json_codec  # noqa: E402
+
+
+def synthetic_payload(records: int) -> list:
+    return [
+        {
+            "id": f"3_2_3_17_77_{index}",
+            "name": f"Record {index}",
+            "tags": ["csa", "produce", "local"],
+            "price": 12.5 + index % 7,
+            "available": index % 3 == 0,
+            "notes": None,
+        }
+        for index in range(records)
+    ]
+
+
+def _best_of(repeat: int, func) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _backends() -> dict:
+    backends = {
+        "json": (
+            lambda obj: json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8"),
+            json.loads,
+        )
+    }
+    if json_codec.orjson is not None:
+        backends["orjson"] = (json_codec.orjson.dumps, json_codec.orjson.loads)
+    return backends
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="*", type=Path, help="JSON files to benchmark")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.sources:
+        payloads = {path.name: json.loads(path.read_bytes()) for path in args.sources}
+    else:
+        payloads = {
+            f"{records} records": synthetic_payload(records)
+            for records in (100, 10_000, 100_000)
+        }
+
+    print(f"active backend: {json_codec.BACKEND}")
+    print(f"{'payload':<24}{'backend':<9}{'bytes':>11}{'encode MB/s':>13}{'decode MB/s':>13}")
+    for label, payload in payloads.items():
+        for name, (encode, decode) in _backends().items():
+            data = encode(payload)
+            mb = len(data) / 1_000_000
+            encode_s = _best_of(args.repeat, lambda: encode(payload))
+            decode_s = _best_of(args.repeat, lambda: decode(data))
+            print(
+                f"{label:<24}{name:<9}{len(data):>11}"
+                f"{mb / encode_s:>13.1f}{mb / decode_s:>13.1f}"
+            )
+
+    if json_codec.orjson is None:
+        print("(orjson not installed: pip install orjson)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
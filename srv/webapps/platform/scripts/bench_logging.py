@@ -0,0 +1,151 @@
+# /srv/webapps/platform/scripts/bench_logging.py
+
+"""
+Compare the latency logging adds to request threads: synchronous vs queued.
+
+``--threads`` threads each log ``--records`` records, the way request
+handlers do under load, into a sink that behaves like a busy journal:
+every write takes ``--write-ms`` and every ``--stall-every``-th write
+stalls for ``--stall-ms``. Modes:
+
+- ``sync``: the previous setup, a StreamHandler writing on the calling
+  thread.
+- ``queue``: modules/structured_log.py, with a QueueHandler on the calling
+  thread and a listener thread that formats and writes.
+
+Reports the per-call latency seen by the logging threads (p50, p99, max),
+how long the sink took to receive everything, and records dropped because
+the queue was full.
+
+Usage::
+
+    python scripts/bench_logging.py
+    python scripts/bench_logging.py --threads 12 --stall-ms 100 --queue-size 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+
+class SlowSink:
+    """A text stream whose writes take time, with periodic stalls."""
+
+    def __init__(self, write_ms: float, stall_ms: float, stall_every: int) -> None:
+        self.write_s = write_ms / 1000
+        self.stall_s = stall_ms / 1000
+        self.stall_every = stall_every
+        self.lines = 0
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            self.lines += text.count("\n")
+            stall = self.stall_every and self.lines % self.stall_every == 0
+        time.sleep(self.stall_s if stall else self.write_s)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def _percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(mode: str, args) -> dict:
+    # Import here so LOG_QUEUE_SIZE applies; each mode runs in its own process.
+    os.environ["LOG_QUEUE_SIZE"] = str(args.queue_size)
+    from modules import structured_log
+
+    sink = SlowSink(args.write_ms, args.stall_ms, args.stall_every)
+    if mode == "sync":
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        logging.getLogger().addHandler(handler)
+        logging.getLogger().setLevel(logging.INFO)
+    else:
+        structured_log.install("INFO", stream=sink)
+
+    logger = logging.getLogger("bench")
+    latencies: list = []
+    lock = threading.Lock()
+
+    def worker(index: int) -> None:
+        own = []
+        for number in range(args.records):
+            started = time.perf_counter()
+            logger.info("order %s captured for %s", f"{index}-{number}", "t.example")
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logged = time.perf_counter() - started
+    if mode == "queue":
+        structured_log._stop_listener()
+    return {
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "logged_s": logged,
+        "drained_s": time.perf_counter() - started,
+        "written": sink.lines,
+        "dropped": structured_log.stats()["dropped"] if mode == "queue" else 0,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--records", type=int, default=500, help="records per thread")
+    parser.add_argument("--write-ms", type=float, default=0.05)
+    parser.add_argument("--stall-ms", type=float, default=50)
+    parser.add_argument("--stall-every", type=int, default=500)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--mode", choices=("sync", "queue"), action="append")
+    args = parser.parse_args(argv)
+
+    print(
+        f"{args.threads} threads x {args.records} records; write {args.write_ms:g} ms, "
+        f"{args.stall_ms:g} ms stall every {args.stall_every} writes"
+    )
+    print(f"{'mode':<7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'logged s':>10}{'drained s':>11}"
+          f"{'written':>9}{'dropped':>9}")
+    for mode in args.mode or ["sync", "queue"]:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            result = run(mode, args)
+            line = (
+                f"{mode:<7}{result['p50_ms']:>9.3f}{result['p99_ms']:>9.3f}{result['max_ms']:>9.1f}"
+                f"{result['logged_s']:>10.2f}{result['drained_s']:>11.2f}"
+                f"{result['written']:>9}{result['dropped']:>9}\n"
+            )
+            os.write(write_fd, line.encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as reader:
+            sys.stdout.write(reader.read())
+        os.waitpid(pid, 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# /srv/webapps/platform/scripts/bench_receipt_bulk.py
+
+"""
+Benchmark bulk receipt import and export on a large file.
+
+Generates ``--records`` receipts (default one million) as NDJSON and CSV,
+then for each storage engine streams them through
+``POST /api/donation-receipts/import`` and back out of
+``GET /api/donation-receipts/export``, in-process via the Flask test client.
+Every step runs in a forked child so its peak memory can be reported
+(growth of VmHWM over the child's starting RSS).
+
+Usage::
+
+    python scripts/bench_receipt_bulk.py
+    python scripts/bench_receipt_bulk.py --records 100000 --engine sqlite
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+os.chdir(MODULE_DIR)
+
+ENGINES = {
+    "files": {"storage_format": "compact"},
+    "sqlite": {"storage_engine": "sqlite"},
+    "partitioned": {"storage_format": "compact", "receipt_partitions": "month"},
+}
+
+
+def _status_kb(field: str) -> int:
+    with open("/proc/self/status", encoding="ascii") as handle:
+        for line in handle:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return 0
+
+
+def write_inputs(directory: Path, records: int) -> dict:
+    from modules.receipt_bulk import CSV_FIELDS
+
+    ndjson_path = directory / "receipts.ndjson"
+    csv_path = directory / "receipts.csv"
+    with ndjson_path.open("w", encoding="utf-8") as nd, csv_path.open(
+        "w", encoding="utf-8", newline=""
+    ) as cs:
+        writer = csv.DictWriter(cs, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for index in range(records):
+            month = 1 + index % 12
+            receipt = {
+                "receipt_id": f"bulk-{index}",
+                "recorded_at": f"2025-{month:02d}-{1 + index % 28:02d}T12:00:00+00:00",
+                "amount": 5 + index % 500,
+                "currency": "USD",
+                "donor_name": f"Donor {index}",
+                "donor_email": f"donor{index}@example.com",
+                "provider": "paypal",
+            }
+            writer.writerow(receipt)
+            donor = {"name": receipt.pop("donor_name"), "email": receipt.pop("donor_email")}
+            nd.write(json.dumps({**receipt, "donor": donor}) + "\n")
+    return {"ndjson": ndjson_path, "csv": csv_path}
+
+
+def _in_child(func) -> dict:
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        start_rss = _status_kb("VmRSS")
+        result = func()
+        result["peak_mb"] = max(_status_kb("VmHWM") - start_rss, 0) / 1024
+        os.write(write_fd, json.dumps(result).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as reader:
+        data = reader.read()
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--engine", choices=list(ENGINES), action="append")
+    parser.add_argument("--format", choices=("ndjson", "csv"), action="append")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        inputs = write_inputs(root, args.records)
+        clients_root = root / "clients"
+
+        import app as platform_app
+
+        platform_app.multi_access.CLIENTS_ROOT = clients_root
+        client = platform_app.app.test_client()
+
+        print(f"{args.records} receipts")
+        print(f"{'engine':<13}{'step':<15}{'seconds':>9}{'records/s':>12}{'MB':>9}{'peak MB':>9}")
+        for engine in args.engine or list(ENGINES):
+            for fmt in args.format or ["ndjson", "csv"]:
+                slug = f"{engine}-{fmt}.example"
+                data_dir = clients_root / slug / "data"
+                data_dir.mkdir(parents=True)
+                (clients_root / slug / "frontend").mkdir()
+                (clients_root / slug / "msn_bench.json").write_text(
+                    json.dumps({"MSS": ENGINES[engine]})
+                )
+                headers = {"Host": slug}
+
+                def do_import(source=inputs[fmt], headers=headers, fmt=fmt):
+                    started = time.perf_counter()
+                    with source.open("rb") as stream:
+                        response = client.post(
+                            f"/api/donation-receipts/import?format={fmt}",
+                            input_stream=stream,
+                            content_length=source.stat().st_size,
+                            headers=headers,
+                        )
+                    assert response.status_code == 201, response.get_data()[:200]
+                    return {
+                        "seconds": time.perf_counter() - started,
+                        "count": response.json["imported"],
+                        "bytes": source.stat().st_size,
+                    }
+
+                def do_export(headers=headers, fmt=fmt):
+                    started = time.perf_counter()
+                    response = client.get(
+                        f"/api/donation-receipts/export?format={fmt}",
+                        headers=headers,
+                        buffered=False,
+                    )
+                    size = lines = 0
+                    for chunk in response.response:
+                        size += len(chunk)
+                        lines += chunk.count(b"\n")
+                    response.close()
+                    return {
+                        "seconds": time.perf_counter() - started,
+                        "count": lines - (fmt == "csv"),
+                        "bytes": size,
+                    }
+
+                for step, func in ((f"import {fmt}", do_import), (f"export {fmt}", do_export)):
+                    result = _in_child(func)
+                    print(
+                        f"{engine:<13}{step:<15}{result['seconds']:>9.2f}"
+                        f"{result['count'] / result['seconds']:>12.0f}"
+                        f"{result['bytes'] / 1e6:>9.1f}{result['peak_mb']:>9.1f}",
+                        flush=True,
+                    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
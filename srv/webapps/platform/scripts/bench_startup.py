@@ -0,0 +1,123 @@
+# /srv/webapps/platform/scripts/bench_startup.py
+
+"""
+Compare worker startup with and without preload/warmup.
+
+Forks ``--workers`` processes the way Gunicorn does and reports, per mode:
+
+- startup: time from launch until every worker has imported the app
+- first request: mean latency of each worker's first request to every client
+- RSS / PSS / USS per worker, read from /proc/<pid>/smaps_rollup once the
+  first requests have been served (USS is what a worker does not share)
+
+``lazy`` is the previous behaviour (each worker imports the app itself and
+starts with cold caches); ``preload`` imports and warms once, then forks.
+
+Usage::
+
+    python scripts/bench_startup.py --workers 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+os.chdir(MODULE_DIR)
+
+
+def _memory(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as handle:
+        for line in handle:
+            name, _, rest = line.partition(":")
+            if rest.strip().endswith("kB"):
+                values[name] = int(rest.split()[0])
+    uss = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return {"rss": values.get("Rss", 0), "pss": values.get("Pss", 0), "uss": uss}
+
+
+def _worker(report_fd: int, release_fd: int) -> None:
+    import app as platform_app
+
+    imported = time.perf_counter()
+    client = platform_app.app.test_client()
+    latencies = []
+    for slug in platform_app.multi_access.register_clients():
+        started = time.perf_counter()
+        client.get("/api/datasets", headers={"Host": slug})
+        latencies.append(time.perf_counter() - started)
+
+    os.write(report_fd, json.dumps({"ready": imported, "first": latencies}).encode() + b"\n")
+    os.read(release_fd, 1)
+    os._exit(0)
+
+
+def run(mode: str, workers: int) -> dict:
+    launched = time.perf_counter()
+    if mode == "preload":
+        import gc
+
+        import app as platform_app
+
+        platform_app.warm_tenant_caches()
+        gc.freeze()
+
+    report_r, report_w = os.pipe()
+    release_r, release_w = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            _worker(report_w, release_r)
+        pids.append(pid)
+
+    reports = []
+    with os.fdopen(report_r) as reader:
+        while len(reports) < workers:
+            reports.append(json.loads(reader.readline()))
+        memory = [_memory(pid) for pid in pids]
+        os.write(release_w, b"x" * workers)
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+    first = [latency for report in reports for latency in report["first"]]
+    return {
+        "startup_ms": (max(report["ready"] for report in reports) - launched) * 1000,
+        "first_request_ms": 1000 * sum(first) / max(len(first), 1),
+        "rss_kb": sum(item["rss"] for item in memory) / workers,
+        "pss_kb": sum(item["pss"] for item in memory) / workers,
+        "uss_kb": sum(item["uss"] for item in memory) / workers,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--mode", choices=("lazy", "preload"), action="append")
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':<9}{'startup ms':>12}{'1st req ms':>12}{'RSS kB':>10}{'PSS kB':>10}{'USS kB':>10}")
+    for mode in args.mode or ["lazy", "preload"]:
+        # Each mode runs in its own child so the app has not been imported yet.
+        pid = os.fork()
+        if pid == 0:
+            result = run(mode, args.workers)
+            print(
+                f"{mode:<9}{result['startup_ms']:>12.1f}{result['first_request_ms']:>12.2f}"
+                f"{result['rss_kb']:>10.0f}{result['pss_kb']:>10.0f}{result['uss_kb']:>10.0f}",
+                flush=True,
+            )
+            os._exit(0)
+        os.waitpid(pid, 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
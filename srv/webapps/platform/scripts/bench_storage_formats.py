@@ -0,0 +1,91 @@
+# /srv/webapps/platform/scripts/bench_storage_formats.py
+
+"""
+Compare file size, write time and parse time for each storage format.
+
+Usage::
+
+    python scripts/bench_storage_formats.py                  # synthetic payload
+    python scripts/bench_storage_formats.py path/to/data.json --repeat 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+from data_access import multi_tenant as multi_access  # noqa: E402
+
+
+def synthetic_payload(records: int) -> list:
+    return [
+        {
+            "amount": 25.0 + index,
+            "currency": "USD",
+            "donor": {"name": f"Donor {index}", "email": f"donor{index}@example.com"},
+            "designation": "Annual Fund",
+            "provider": "paypal",
+            "recorded_at": "2025-01-01T00:00:00+00:00",
+        }
+        for index in range(records)
+    ]
+
+
+def _best_of(repeat: int, func) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", nargs="?", type=Path, help="JSON file to benchmark")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    payload = (
+        multi_access.load_json(args.source)
+        if args.source
+        else synthetic_payload(args.records)
+    )
+
+    formats = [
+        fmt
+        for fmt in multi_access.STORAGE_FORMATS
+        if fmt != "msgpack" or multi_access.msgpack is not None
+    ]
+
+    print(f"{'format':<10}{'bytes':>12}{'size %':>9}{'write ms':>11}{'parse ms':>11}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage_format in formats:
+            target = Path(tmp) / f"bench.{storage_format}"
+            write_s = _best_of(
+                args.repeat,
+                lambda: multi_access.save_json(target, payload, storage_format),
+            )
+            parse_s = _best_of(args.repeat, lambda: multi_access.load_json(target))
+            size = target.stat().st_size
+            baseline = baseline or size
+            print(
+                f"{storage_format:<10}{size:>12}{100 * size / baseline:>8.1f}%"
+                f"{write_s * 1000:>11.2f}{parse_s * 1000:>11.2f}"
+            )
+
+    if "msgpack" not in formats:
+        print("(msgpack skipped: package not installed)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# /srv/webapps/platform/scripts/bench_upstream.py
+
+"""
+Load-test Gunicorn upstream topologies and compare req/s and p99 latency.
+
+Each ``--target`` is ``LABEL=ADDRESS``. ADDRESS is ``host:port`` for TCP or
+``unix:/path`` for a Unix socket, optionally followed by ``,close``. With
+``,close`` every request opens a new connection, the way nginx talked to
+Gunicorn before the keepalive upstream. Without it, every client thread
+reuses one connection. Targets run one after another with the same paths,
+Host header and concurrency.
+
+Compare the old topology (TCP, sync workers, connection per request) with
+the new one (Unix socket, gthread, keepalive) by running both services::
+
+    PLATFORM_BIND=127.0.0.1:8000 PLATFORM_WORKER_CLASS=sync \\
+        gunicorn --config gunicorn.conf.py app:app &
+    gunicorn --config gunicorn.conf.py app:app &
+    python scripts/bench_upstream.py --host cuyahogaterravita.com \\
+        --paths /api/datasets /api/datasets/csa_recipes \\
+        --target old=127.0.0.1:8000,close --target new=unix:/run/platform/gunicorn.sock
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.unix_path)
+        self.sock = sock
+
+
+def _connector(address: str) -> Callable[[], http.client.HTTPConnection]:
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        return lambda: UnixHTTPConnection(path, timeout=10)
+    host, _, port = address.rpartition(":")
+    return lambda: http.client.HTTPConnection(host, int(port), timeout=10)
+
+
+def run(
+    address: str, host: str, paths: List[str], requests: int, concurrency: int
+) -> Dict[str, float]:
+    close = address.endswith(",close")
+    connect = _connector(address[: -len(",close")] if close else address)
+    local = threading.local()
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    headers = {"Host": host, "Connection": "close" if close else "keep-alive"}
+
+    def one(index: int) -> None:
+        nonlocal errors
+        path = paths[index % len(paths)]
+        started = time.perf_counter()
+        try:
+            connection = getattr(local, "connection", None) or connect()
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status < 500
+            if close or response.will_close:
+                connection.close()
+                connection = None
+            local.connection = connection
+        except (OSError, http.client.HTTPException):
+            local.connection = None
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000,
+        "errors": errors,
+    }
+
+
+def _target(value: str) -> Tuple[str, str]:
+    label, sep, address = value.partition("=")
+    if not sep or not address:
+        raise argparse.ArgumentTypeError("expected LABEL=ADDRESS")
+    return label, address
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", type=_target, action="append", required=True)
+    parser.add_argument("--host", required=True, help="Host header (tenant slug)")
+    parser.add_argument("--paths", nargs="+", default=["/api/datasets"])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    print(f"{args.requests} GETs per target, {args.concurrency} client threads")
+    print(f"{'target':<12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for label, address in args.target:
+        run(address, args.host, args.paths, args.warmup, args.concurrency)
+        result = run(address, args.host, args.paths, args.requests, args.concurrency)
+        print(
+            f"{label:<12} {result['rps']:>8.0f} {result['p50']:>8.2f} "
+            f"{result['p99']:>8.2f} {result['errors']:>7.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# /srv/webapps/platform/scripts/migrate_storage_format.py
+
+"""
+Rewrite a client's backend data files in their configured storage format.
+
+By default every file listed in the manifest's ``backend_data`` is converted
+to the format resolved from ``MSS.storage_format`` / ``MSS.storage_formats``.
+Pass ``--format`` to force a single format for all selected files.
+
+Usage::
+
+    python scripts/migrate_storage_format.py cuyahogaterravita.com
+    python scripts/migrate_storage_format.py cuyahogaterravita.com \\
+        --file csa_recipes.json --format compact --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+from data_access import client as client_access  # noqa: E402
+from data_access import multi_tenant as multi_access  # noqa: E402
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("client", help="client slug (directory under clients/)")
+    parser.add_argument(
+        "--file",
+        action="append",
+        dest="files",
+        help="limit to this backend_data filename (repeatable)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=multi_access.STORAGE_FORMATS,
+        help="override the manifest-configured format",
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    paths = multi_access.get_client_paths(args.client)
+    if not paths["client_root"].exists():
+        parser.error(f"unknown client: {args.client}")
+
+    manifest = multi_access.load_client_manifest(paths)
+    filenames = args.files or manifest.backend_data
+
+    for filename in filenames:
+        try:
+            target = client_access.resolve_backend_data_path(
+                paths, manifest, filename, access=None
+            )
+        except ValueError as exc:
+            print(f"skip {filename}: {exc}")
+            continue
+
+        if not target.exists():
+            print(f"skip {filename}: not found")
+            continue
+
+        storage_format = args.format or client_access.resolve_storage_format(
+            manifest, filename
+        )
+        before = target.stat().st_size
+        payload = multi_access.load_json(target)
+        after = len(multi_access.encode_payload(payload, storage_format))
+
+        print(f"{filename}: {before} -> {after} bytes ({storage_format})")
+        if not args.dry_run:
+            multi_access.save_json(target, payload, storage_format)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# /srv/webapps/platform/scripts/paypal_stub.py
+
+"""
+Serve a local stand-in for the PayPal APIs the reconciliation job calls.
+
+Answers ``POST /v1/oauth2/token`` (any credentials) and
+``GET /v1/reporting/transactions`` with ``--transactions`` synthetic
+transactions spread evenly over ``[--since, --until)``. Transaction ``n``
+has ID ``STUB<n>`` (zero-padded to 12 digits) and is always the same, so
+runs are repeatable. Every 20th is a refund and every 50th is still
+pending; the rest are completed payments. ``--tenants a.example,b.example``
+tags them in turn with those ``custom_field`` values, as orders from
+``create-order`` are (an empty name leaves a share untagged); by default
+none are tagged. Each request takes ``--latency-ms`` extra, like a round
+trip to PayPal.
+
+The reporting API's limits apply: ranges longer than 31 days and pages
+larger than 500 are rejected.
+
+Usage::
+
+    python scripts/paypal_stub.py --transactions 200000 --latency-ms 80 --tenants stub.example
+    PAYPAL_API_BASE=http://127.0.0.1:8099 PAYPAL_CLIENT_ID=x PAYPAL_CLIENT_SECRET=y \\
+        python scripts/reconcile_paypal.py stub.example --since 2025-01-01 --until 2026-01-01
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+MAX_RANGE = timedelta(days=31)
+MAX_PAGE_SIZE = 500
+
+
+class Ledger:
+    """``count`` transactions at evenly spaced times in ``[since, until)``."""
+
+    def __init__(
+        self, count: int, since: datetime, until: datetime, tenants: list[str] | None = None
+    ) -> None:
+        self.count = count
+        self.since = since
+        self.step = (until - since) / max(count, 1)
+        self.tenants = tenants or []
+
+    def at(self, number: int) -> datetime:
+        return self.since + self.step * (number + 0.5)
+
+    def between(self, start: datetime, end: datetime) -> range:
+        """Numbers of the transactions in ``[start, end)``."""
+        first = math.ceil((start - self.since) / self.step - 0.5)
+        last = math.ceil((end - self.since) / self.step - 0.5)
+        return range(max(first, 0), min(max(last, 0), self.count))
+
+    def transaction(self, number: int) -> dict:
+        refund = number % 20 == 19
+        amount = 5 + (number * 7) % 250
+        transaction = {
+            "transaction_info": {
+                "transaction_id": f"STUB{number:012d}",
+                "paypal_reference_id": f"ORDER{number:012d}",
+                "transaction_event_code": "T1107" if refund else "T0006",
+                "transaction_initiation_date": self.at(number).strftime(TIME_FORMAT),
+                "transaction_amount": {
+                    "currency_code": "USD",
+                    "value": f"{-amount if refund else amount:.2f}",
+                },
+                "transaction_status": "P" if number % 50 == 49 else "S",
+                "transaction_subject": "Annual Fund",
+            },
+            "payer_info": {
+                "email_address": f"donor{number % 5000}@example.com",
+                "payer_name": {"given_name": "Donor", "surname": str(number % 5000)},
+            },
+        }
+        tenant = self.tenants[number % len(self.tenants)] if self.tenants else ""
+        if tenant:
+            transaction["transaction_info"]["custom_field"] = tenant
+        return transaction
+
+
+def make_handler(ledger: Ledger, latency_s: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency_s)
+            if urlsplit(self.path).path != "/v1/oauth2/token":
+                return self._send(404, {"name": "NOT_FOUND", "message": "Not found"})
+            return self._send(
+                200, {"access_token": "stub-token", "token_type": "Bearer", "expires_in": 32400}
+            )
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            url = urlsplit(self.path)
+            if url.path != "/v1/reporting/transactions":
+                return self._send(404, {"name": "NOT_FOUND", "message": "Not found"})
+            if self.headers.get("Authorization") != "Bearer stub-token":
+                return self._send(401, {"name": "AUTHENTICATION_FAILURE", "message": "Bad token"})
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                start = datetime.strptime(query["start_date"], TIME_FORMAT)
+                end = datetime.strptime(query["end_date"], TIME_FORMAT)
+                page = int(query.get("page", 1))
+                page_size = int(query.get("page_size", 100))
+            except (KeyError, ValueError) as exc:
+                return self._send(400, {"name": "INVALID_REQUEST", "message": str(exc)})
+            if end - start > MAX_RANGE or page_size > MAX_PAGE_SIZE or page < 1:
+                return self._send(
+                    400, {"name": "INVALID_REQUEST", "message": "Range or page out of bounds"}
+                )
+
+            numbers = ledger.between(start, end)
+            offset = (page - 1) * page_size
+            return self._send(
+                200,
+                {
+                    "transaction_details": [
+                        ledger.transaction(number)
+                        for number in numbers[offset:offset + page_size]
+                    ],
+                    "start_date": query["start_date"],
+                    "end_date": query["end_date"],
+                    "page": page,
+                    "total_items": len(numbers),
+                    "total_pages": max(math.ceil(len(numbers) / page_size), 1),
+                },
+            )
+
+    return Handler
+
+
+def _moment(value: str) -> datetime:
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--transactions", type=int, default=50000)
+    parser.add_argument("--since", type=_moment, default=_moment("2025-01-01"))
+    parser.add_argument("--until", type=_moment, default=_moment("2026-01-01"))
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--tenants", default="", help="custom_field values, comma-separated")
+    args = parser.parse_args(argv)
+
+    tenants = [name.strip() for name in args.tenants.split(",")] if args.tenants else []
+    ledger = Ledger(args.transactions, args.since, args.until, tenants)
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(ledger, args.latency_ms / 1000)
+    )
+    server.daemon_threads = True
+    print(
+        f"PayPal stub on http://{args.host}:{server.server_port}: {args.transactions} "
+        f"transactions {args.since:%Y-%m-%d} .. {args.until:%Y-%m-%d}, "
+        f"+{args.latency_ms:g} ms per request",
+        flush=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# /srv/webapps/platform/scripts/reconcile_paypal.py
+
+"""
+Backfill donation receipts for PayPal captures that never got one.
+
+Pages through the PayPal transaction history for ``[--since, --until)``
+(default: the last ``--days`` days) on ``--concurrency`` threads, matches
+the tenant's completed payments (orders tagged with its slug) to its stored
+receipts by transaction ID, and appends receipts for the rest in one write
+(modules/paypal_reconcile.py). Untagged payments are only taken for the
+tenant in PAYPAL_RECONCILE_UNTAGGED_TENANT.
+Reports the counts and the fetch throughput in transactions and pages per
+second. ``--dry-run`` reports without writing.
+
+PayPal credentials and PAYPAL_API_BASE come from the environment, as for the
+app. Point PAYPAL_API_BASE at scripts/paypal_stub.py to try it locally.
+
+Usage::
+
+    python scripts/reconcile_paypal.py cuyahogaterravita.com --days 3
+    python scripts/reconcile_paypal.py cuyahogaterravita.com \\
+        --since 2025-01-01 --until 2026-01-01 --concurrency 8 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+from modules import paypal_reconcile  # noqa: E402
+from modules.paypal_gateway import PayPalClientError  # noqa: E402
+
+
+def _moment(value: str) -> datetime:
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an ISO 8601 date, got {value!r}") from None
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("client", help="client slug (directory under CLIENTS_ROOT)")
+    parser.add_argument("--since", type=_moment, help="start (inclusive), e.g. 2025-01-01")
+    parser.add_argument("--until", type=_moment, help="end (exclusive); default now")
+    parser.add_argument("--days", type=float, default=3, help="range when --since is omitted")
+    parser.add_argument("--concurrency", type=int, default=paypal_reconcile.CONCURRENCY)
+    parser.add_argument("--filename", help="receipts file (default donation_receipts.json)")
+    parser.add_argument("--dry-run", action="store_true", help="report without writing")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    until = args.until or datetime.now(timezone.utc)
+    since = args.since or until - timedelta(days=args.days)
+    if since >= until:
+        parser.error("--since must be before --until")
+
+    try:
+        report = paypal_reconcile.reconcile(
+            args.client, since, until, args.concurrency, args.filename, args.dry_run
+        )
+    except PayPalClientError as exc:
+        print(f"PayPal request failed: {exc}", file=sys.stderr)
+        return 1
+    except PermissionError as exc:
+        print(f"Receipts not writable: {exc}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    fetch_s = report["fetch_s"] or 1e-9
+    print(
+        f"{args.client} {since:%Y-%m-%d %H:%M} .. {until:%Y-%m-%d %H:%M}: "
+        f"{report['windows']} windows, {report['pages']} pages, "
+        f"{report['transactions']} transactions"
+    )
+    print(
+        f"{report['payments']} completed payments: {report['matched']} matched, "
+        f"{report['missing']} missing, {report['invalid']} invalid; skipped "
+        f"{report['other_tenant']} for other tenants, {report['untagged']} untagged"
+    )
+    action = "would write" if args.dry_run else f"wrote {report['written']} of"
+    print(f"{action} {report['missing']} receipts -> {report['source']}")
+    print(
+        f"fetch {report['fetch_s']:.2f}s ({report['transactions'] / fetch_s:.0f} transactions/s, "
+        f"{report['pages'] / fetch_s:.1f} pages/s, concurrency {args.concurrency}); "
+        f"index {report['index_s']:.2f}s, write {report['write_s']:.2f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
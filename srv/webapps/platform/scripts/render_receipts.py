@@ -0,0 +1,77 @@
+# /srv/webapps/platform/scripts/render_receipts.py
+
+"""
+Render a tenant's donation receipts for one year into its output directory.
+
+Receipts recorded in ``--year`` are streamed from the tenant's store and
+rendered on a process pool (modules/receipt_render.py). Documents go to
+``<client_root>/receipt_documents/<year>/<receipt_id>.<format>``, or to
+``--out``. The script reports throughput in receipts per second and in
+receipts per second per core.
+
+Usage::
+
+    python scripts/render_receipts.py cuyahogaterravita.com --year 2025
+    python scripts/render_receipts.py cuyahogaterravita.com --format pdf --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+from modules import receipt_render  # noqa: E402
+from modules.donation_receipts import (  # noqa: E402
+    iter_receipts,
+    load_client_manifest,
+    resolve_receipts_target,
+)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("client", help="client slug (directory under CLIENTS_ROOT)")
+    parser.add_argument("--year", type=int, default=datetime.now(timezone.utc).year - 1)
+    parser.add_argument("--format", default="html", choices=receipt_render.FORMATS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--filename", help="receipts file (default donation_receipts.json)")
+    parser.add_argument("--out", type=Path, help="output directory")
+    args = parser.parse_args(argv)
+
+    if args.format == "pdf" and not receipt_render.pdf_available():
+        print("PDF rendering requires the weasyprint package", file=sys.stderr)
+        return 1
+
+    target = resolve_receipts_target(args.client, args.filename)
+    try:
+        manifest = load_client_manifest(target.paths)
+    except (FileNotFoundError, ValueError):
+        manifest = None
+    organization = receipt_render.organization_for(manifest, args.client)
+    destination = args.out or receipt_render.output_dir(target.paths) / str(args.year)
+
+    receipts = iter_receipts(target, str(args.year), str(args.year + 1))
+    started = time.perf_counter()
+    written = receipt_render.render_batch(
+        target.paths, receipts, organization, destination, args.format, args.workers
+    )
+    elapsed = time.perf_counter() - started
+
+    rate = written / elapsed if elapsed else 0.0
+    print(f"{written} receipts -> {destination}")
+    print(
+        f"{elapsed:.2f}s, {rate:.0f} receipts/s, "
+        f"{rate / args.workers:.0f} receipts/s/core ({args.workers} workers)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# /srv/webapps/platform/scripts/sqlite_store_tool.py
+
+"""
+Move a client's ``data/`` directory into or out of its SQLite store.
+
+``import`` copies every manifest-declared backend data file into
+``data/tenant.sqlite3`` as a new document version. Receipt files (named with
+``--receipts``, default ``donation_receipts.json``) become receipt rows.
+``export`` writes the latest documents and all receipts back to JSON files in
+their configured storage format.
+
+Usage::
+
+    python scripts/sqlite_store_tool.py import cuyahogaterravita.com
+    python scripts/sqlite_store_tool.py export cuyahogaterravita.com --out /tmp/export
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+from modules import sqlite_store  # noqa: E402
+from data_access import client as client_access  # noqa: E402
+from data_access import multi_tenant as multi_access  # noqa: E402
+
+
+def import_data_dir(paths, manifest, receipt_files: set[str]) -> None:
+    db_path = sqlite_store.store_path(paths)
+    data_dir = paths["data_dir"]
+    candidates = set(manifest.backend_data) | receipt_files
+
+    for filename in sorted(candidates):
+        source = data_dir / filename
+        if not source.exists():
+            continue
+
+        payload = multi_access.load_json(source)
+        if filename in receipt_files:
+            if not isinstance(payload, list):
+                print(f"skip {filename}: receipts file is not a JSON array")
+                continue
+            existing = {
+                receipt.get("receipt_id")
+                for receipt in sqlite_store.load_receipts(db_path, filename)
+            }
+            fresh = [
+                receipt
+                for receipt in payload
+                if not receipt.get("receipt_id") or receipt["receipt_id"] not in existing
+            ]
+            count = sqlite_store.append_receipts(db_path, filename, fresh)
+            print(f"{filename}: {count} receipts imported")
+        else:
+            version = sqlite_store.save_document(db_path, filename, payload)
+            print(f"{filename}: stored as version {version}")
+
+
+def export_data_dir(paths, manifest, out_dir: Path) -> None:
+    db_path = sqlite_store.store_path(paths)
+    if not db_path.exists():
+        print(f"no store at {db_path}")
+        return
+
+    for filename in sqlite_store.list_documents(db_path):
+        payload = sqlite_store.load_document(db_path, filename)
+        storage_format = client_access.resolve_storage_format(manifest, filename)
+        multi_access.save_json(out_dir / filename, payload, storage_format)
+        print(f"{filename}: exported ({storage_format})")
+
+    for filename in sqlite_store.list_receipt_sources(db_path):
+        receipts = sqlite_store.load_receipts(db_path, filename)
+        storage_format = client_access.resolve_storage_format(manifest, filename)
+        multi_access.save_json(out_dir / filename, receipts, storage_format)
+        print(f"{filename}: {len(receipts)} receipts exported ({storage_format})")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("client", help="client slug (directory under clients/)")
+    parser.add_argument(
+        "--receipts",
+        action="append",
+        default=None,
+        help="filename holding receipts (repeatable; default donation_receipts.json)",
+    )
+    parser.add_argument(
+        "--out", type=Path, help="export destination (defaults to the client data dir)"
+    )
+    args = parser.parse_args(argv)
+
+    paths = multi_access.get_client_paths(args.client)
+    if not paths["client_root"].exists():
+        parser.error(f"unknown client: {args.client}")
+    manifest = multi_access.load_client_manifest(paths)
+
+    if args.command == "import":
+        import_data_dir(paths, manifest, set(args.receipts or ["donation_receipts.json"]))
+    else:
+        export_data_dir(paths, manifest, args.out or paths["data_dir"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# /srv/webapps/platform/scripts/storage_sync.py
+
+"""
+Seed the shared storage backend from a clients directory, or pull it into this node.
+
+``push`` uploads every file under ``--source`` (default CLIENTS_ROOT),
+skipping node-local files (``storage_backend.NODE_LOCAL_PATTERNS``: dot
+files, SQLite stores, rendered documents), to the backend configured by
+STORAGE_BACKEND (modules/storage_backend.py). Files that already exist are
+left alone unless ``--overwrite`` is given, and that overwrite is still
+conditional on the version just listed. ``pull`` runs the same sync that
+warmup runs and reports how many files changed.
+
+Usage::
+
+    STORAGE_BACKEND=s3 STORAGE_S3_BUCKET=platform-clients \\
+        python scripts/storage_sync.py push --source /srv/webapps/clients
+    STORAGE_BACKEND=s3 STORAGE_S3_BUCKET=platform-clients \\
+        python scripts/storage_sync.py pull cuyahogaterravita.com
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(MODULE_DIR))
+
+from modules.storage_backend import StorageConflict, is_node_local  # noqa: E402
+from data_access import multi_tenant as multi_access  # noqa: E402
+
+
+def push(source: Path, clients: list[str], overwrite: bool) -> int:
+    backend = multi_access.mirror.backend
+    uploaded = skipped = conflicts = 0
+    for slug in clients or sorted(
+        entry.name for entry in source.iterdir() if entry.is_dir() and not entry.name.startswith(".")
+    ):
+        existing = {info.key: info.etag for info in backend.list(f"{slug}/")}
+        for root, dirnames, filenames in os.walk(source / slug):
+            dirnames[:] = [name for name in dirnames if not is_node_local(name)]
+            for name in sorted(filenames):
+                path = Path(root) / name
+                key = path.relative_to(source).as_posix()
+                if is_node_local(key):
+                    continue
+                if key in existing and not overwrite:
+                    skipped += 1
+                    continue
+                try:
+                    backend.put(key, path.read_bytes(), existing.get(key))
+                    uploaded += 1
+                except StorageConflict:
+                    print(f"conflict: {key} changed in the backend, not overwritten")
+                    conflicts += 1
+    print(f"{uploaded} uploaded, {skipped} already present, {conflicts} conflicts")
+    return 1 if conflicts else 0
+
+
+def pull(clients: list[str]) -> int:
+    started = time.perf_counter()
+    fetched = sum(multi_access.mirror.sync(f"{slug}/") for slug in clients) if clients else (
+        multi_access.mirror.sync()
+    )
+    print(
+        f"{fetched} files fetched into {multi_access.CLIENTS_ROOT} "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=("push", "pull"))
+    parser.add_argument("clients", nargs="*", help="client slugs (default: all)")
+    parser.add_argument("--source", type=Path, default=None)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args(argv)
+
+    if multi_access.mirror is None:
+        print("STORAGE_BACKEND is not set; nothing to sync", file=sys.stderr)
+        return 1
+    if args.command == "push":
+        return push(args.source or multi_access.CLIENTS_ROOT, args.clients, args.overwrite)
+    return pull(args.clients)
+
+
+if __name__ == "__main__":
+    sys.exit(main())